@@ -1,71 +1,242 @@
 import os
 import json
-import pandas as pd
-from datetime import datetime
-from psycopg2.extras import RealDictCursor, Json
-from src.utils.db import get_connection
-from src.model.preprocess import preprocess
-from src.model.model_runner import load_model
-from src.utils.stats import get_correlation_matrix, get_shap_values
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2.extras import RealDictCursor
+from src.utils.db import get_connection, POOL_MAX
+from src.utils.response_cache import RESPONSE_CACHE, CachedResponse, cached_response, daily_key
+from src.utils.metrics import instrumented, span, count
 
 """
 Tries to fetch daily insights from the DB
 If not found (meaning that day might be not over or is in future or never recorded), 
 falls back to unprocessed rows in incoming_data table. If those exist there-computes insights on the fly, returns them, and tells the user it's partial.
 If not found - returns 500 error.
+pandas/xgboost are only imported on the fallback path, a stored insight is served without them.
+Stored insights never change, they are cached (src/utils/response_cache.py) and revalidated with ETag/Last-Modified.
+With location=<location_id> the stored per-location breakdown of the day is returned (location_daily_insights),
+there is no on-the-fly fallback for it: 404 until the day is processed.
+With start=/end= (instead of date=) every day of the range is returned, a page of at most `limit` days at a time
+(pass next_cursor back as cursor= for the next page). Stored days come from one query on the insight_date index,
+the days of the page that are not stored yet but have unprocessed rows are computed on the fly concurrently,
+each on its own pooled connection.
 """
 
+RANGE_PAGE_DAYS     = int(os.environ.get("DAILY_RANGE_PAGE_DAYS", 31))
+RANGE_MAX_PAGE_DAYS = int(os.environ.get("DAILY_RANGE_MAX_PAGE_DAYS", 366))
+FALLBACK_WORKERS    = int(os.environ.get("DAILY_RANGE_FALLBACK_WORKERS", 4)) # capped by the pool size (PGPOOL_MAX)
+
+
+def _compute_fallback(conn, target_date):
+    """
+    Insights computed on the fly from the unprocessed rows of target_date, None if there are none.
+    Memoized per (date, max id): repeated polls are free and new rows only cost their own SHAP rows.
+    """
+    from src.utils.partial_day import partial_day_insights
+    return partial_day_insights(conn, target_date, n_feat=5)
+
+
+def _location_day(event, conn, target_date, location_id):
+    with span("db.read"), conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT insight_date, location_id, row_count, top_stress_features_shap, correlations_pearson, created_at
+            FROM location_daily_insights
+            WHERE insight_date = %s AND location_id = %s
+        """, (target_date, location_id))
+        row = cur.fetchone()
+
+    if not row:
+        return {
+            "statusCode": 404,
+            "body": json.dumps({"error": f"No processed insights for location {location_id} on {target_date}"})
+        }
+
+    entry = CachedResponse.build({
+        "source": "database",
+        "message":  f"Queried insights for location {location_id} on {target_date}",
+        "insight_date": row["insight_date"].isoformat(),
+        "location_id": row["location_id"],
+        "rows": row["row_count"],
+        "top_stress_features_shap": row["top_stress_features_shap"],
+        "correlations_pearson": row["correlations_pearson"]
+    }, f"{target_date}:{location_id}:{row['created_at'].timestamp()}", row["created_at"])
+    RESPONSE_CACHE.set(daily_key(target_date, location_id), entry)
+    return cached_response(event, entry, "MISS")
+
+
+def _range_page(params) -> tuple[date, date, date, date, str | None]:
+    """(start, end, first, last day of the page, cursor of the next page or None), ValueError on bad parameters."""
+    if not (params.get("start") and params.get("end")):
+        raise ValueError("'start' and 'end' go together")
+    start, end = date.fromisoformat(params["start"]), date.fromisoformat(params["end"])
+    if end < start:
+        raise ValueError("'end' is before 'start'")
+    limit = int(params.get("limit") or RANGE_PAGE_DAYS)
+    if not 1 <= limit <= RANGE_MAX_PAGE_DAYS:
+        raise ValueError(f"'limit' must be between 1 and {RANGE_MAX_PAGE_DAYS} days")
+    first = date.fromisoformat(params["cursor"]) if params.get("cursor") else start
+    if not start <= first <= end:
+        raise ValueError("'cursor' is outside of the range")
+    last = min(end, first + timedelta(days=limit - 1))
+    return start, end, first, last, (last + timedelta(days=1)).isoformat() if last < end else None
+
+
+def _stored_days(conn, first, last, location_id=None) -> dict:
+    """{insight_date: row} of the stored insights between first and last (the latest row of a day), one query."""
+    with span("db.read") as s, conn.cursor(cursor_factory=RealDictCursor) as cur:
+        if location_id is None:
+            cur.execute("""
+                SELECT DISTINCT ON (insight_date) insight_date, top_stress_features_shap, correlations_pearson
+                FROM daily_insights
+                WHERE insight_date BETWEEN %s AND %s
+                ORDER BY insight_date, created_at DESC
+            """, (first, last))
+        else:
+            cur.execute("""
+                SELECT insight_date, row_count, top_stress_features_shap, correlations_pearson
+                FROM location_daily_insights
+                WHERE insight_date BETWEEN %s AND %s AND location_id = %s
+                ORDER BY insight_date
+            """, (first, last, location_id))
+        rows = cur.fetchall()
+        s.rows = len(rows)
+    return {row["insight_date"]: row for row in rows}
+
+
+def _unprocessed_days(conn, first, last) -> set:
+    """Days between first and last that have unprocessed rows (partial index on unprocessed timestamps)."""
+    with span("db.read_unprocessed"), conn.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT DATE(timestamp) FROM incoming_data
+            WHERE processed = FALSE AND timestamp >= %s AND timestamp < %s
+        """, (first, last + timedelta(days=1)))
+        return {row[0] for row in cur.fetchall()}
+
+
+def _compute_fallbacks(dates: list) -> dict:
+    """{date: (top SHAP features, correlations) or None}, computed concurrently, one pooled connection per worker."""
+    def compute(target_date):
+        with get_connection() as conn:
+            return target_date, _compute_fallback(conn, target_date)
+
+    if not dates:
+        return {}
+    # worker threads are not traced (spans are per invocation), the caller's span covers the pool
+    with ThreadPoolExecutor(max_workers=max(1, min(FALLBACK_WORKERS, POOL_MAX, len(dates)))) as pool:
+        return dict(pool.map(compute, dates))
+
+
+def _date_range(params, location_id=None):
+    try:
+        start, end, first, last, next_cursor = _range_page(params)
+    except ValueError as e:
+        return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+    with get_connection() as conn:
+        stored = _stored_days(conn, first, last, location_id)
+        missing = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        missing = [day for day in missing if day not in stored]
+        # the per-location breakdown has no fallback, like the single day request
+        pending = sorted(_unprocessed_days(conn, first, last) & set(missing)) if missing and location_id is None else []
+
+    with span("fallback", rows=len(pending)):
+        computed = _compute_fallbacks(pending)
+
+    insights = []
+    for day in sorted(set(stored) | {d for d, result in computed.items() if result is not None}):
+        if day in stored:
+            row = stored[day]
+            insight = {"insight_date": day.isoformat(), "source": "database"}
+            if location_id is not None:
+                insight["rows"] = row["row_count"]
+            insight["top_stress_features_shap"] = row["top_stress_features_shap"]
+            insight["correlations_pearson"] = row["correlations_pearson"]
+        else:
+            shap_features, corr_map = computed[day]
+            insight = {
+                "insight_date": day.isoformat(),
+                "source": "computed (fallback)",
+                "top_stress_features_shap": shap_features,
+                "correlations_pearson": corr_map
+            }
+        insights.append(insight)
+
+    body = {
+        "source": "database" if len(insights) == len(stored) else "database + computed (fallback)",
+        "message": f"Queried insights from {first} to {last}" + (f" for location {location_id}" if location_id is not None else ""),
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "insights": insights,
+        "missing": [day.isoformat() for day in missing if day not in computed or computed[day] is None],
+        "next_cursor": next_cursor
+    }
+    if location_id is not None:
+        body["location_id"] = location_id
+    return {"statusCode": 200, "body": json.dumps(body)}
+
+
+@instrumented("get_daily_insights")
 def lambda_handler(event, context):
     try:
+        params = event.get("queryStringParameters") or {}
+        location_str = params.get("location")
+        if location_str is not None and not location_str.isdigit():
+            return {"statusCode": 400, "body": json.dumps({"error": "'location' must be a location_id (integer)"})}
+        location_id = int(location_str) if location_str is not None else None
+
+        if params.get("start") or params.get("end"):
+            return _date_range(params, location_id)
+
         # Extract date from query param
-        date_str = event.get("queryStringParameters", {}).get("date")
+        date_str = params.get("date")
         if not date_str:
-            return {"statusCode": 400, "body": json.dumps({"error": "Missing 'date' parameter"})}
-        target_date = pd.to_datetime(date_str).date()
+            return {"statusCode": 400, "body": json.dumps({"error": "Missing 'date' parameter (or 'start' and 'end')"})}
+        try:
+            target_date = date.fromisoformat(date_str)
+        except ValueError as e:
+            return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+        # A stored day never changes, serve it from the cache when we can
+        entry = RESPONSE_CACHE.get(daily_key(target_date, location_id))
+        if entry is not None:
+            count("cache.hit")
+            return cached_response(event, entry, "HIT")
+        count("cache.miss")
 
         with get_connection() as conn:
+            if location_id is not None:
+                return _location_day(event, conn, target_date, location_id)
+
             # First try daily_insights table
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            with span("db.read"), conn.cursor(cursor_factory=RealDictCursor) as cur:
                 cur.execute("""
                     SELECT * FROM daily_insights
                     WHERE insight_date = %s
+                    ORDER BY created_at DESC
                     LIMIT 1
                 """, (target_date,))
                 row = cur.fetchone()
 
             if row:
-                return {
-                    "statusCode": 200,
-                    "body": json.dumps({
-                        "source": "database",
-                        "message":  f"Queried insights for {target_date}",
-                        "insight_date": row["insight_date"].isoformat(),
-                        "top_stress_features_shap": row["top_stress_features_shap"],
-                        "correlations_pearson": row["top_stress_features_shap"]
-                    })
-                }
+                entry = CachedResponse.build({
+                    "source": "database",
+                    "message":  f"Queried insights for {target_date}",
+                    "insight_date": row["insight_date"].isoformat(),
+                    "top_stress_features_shap": row["top_stress_features_shap"],
+                    "correlations_pearson": row["correlations_pearson"]
+                }, row["insight_id"], row["created_at"])
+                RESPONSE_CACHE.set(daily_key(target_date), entry)
+                return cached_response(event, entry, "MISS")
 
             # Fallback to unprocessed incoming data
-            query = """
-                SELECT * FROM incoming_data
-                WHERE DATE(timestamp) = %s AND processed = FALSE
-                ORDER BY timestamp
-            """
-            df = pd.read_sql(query, conn, params=[target_date])
-            if df.empty:
+            with span("fallback"):
+                computed = _compute_fallback(conn, target_date)
+            if computed is None:
                 return {
                     "statusCode": 404,
                     "body": json.dumps({"error": f"No data found for {date_str}"})
                 }
-
-            # Compute insights on the fly
-            model     = load_model("/opt/python/assets/xgb_model.json")
-            feat_cols = model.get_booster().feature_names
-            proc_df   = preprocess(df, model_features=feat_cols)
-
-            X = proc_df.drop(columns=["mental_health_status"])
-            shap_features = get_shap_values(X, model, n_feat=5)
-            corr_map = get_correlation_matrix(proc_df, n_feat=5)
+            shap_features, corr_map = computed
 
             return {
                 "statusCode": 200,
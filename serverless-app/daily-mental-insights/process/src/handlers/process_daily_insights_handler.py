@@ -4,17 +4,33 @@ import pandas as pd
 from datetime import datetime
 from psycopg2.extras import Json
 from src.utils.db import get_connection
-from src.model.preprocess import preprocess
-from src.model.model_runner import load_model
-from src.utils.stats import get_correlation_matrix, get_shap_values
+from src.utils.response_cache import invalidate_insights
+from src.utils.metrics import instrumented, span
+from src.utils.data_access import read_incoming, day_range, session_timezone, MODEL_COLUMNS, UNPROCESSED_DAY
+from src.model.preprocess import preprocess, max_lag
+from src.model.model_runner import get_model
+from src.utils.stats import get_correlation_matrix, get_shap_values, top_shap_features
+from src.utils.aggregates import (
+    merge_aggregates, save_daily_aggregate, historical_shap_from_aggregates, compare_shap,
+    save_time_of_day_stats, correlations_for_range, compare_correlations
+)
+from src.utils.locations import (
+    location_aggregates, location_day_rows, save_location_days, location_historical_from_aggregates,
+    save_location_historical
+)
+from src.utils.lag_state import load_tail, next_tail, save_tails
+from src.utils.feature_store import FEATURE_STORE_DIR, day_versions, source_key, load_day, write_day, stored_frame
 from datetime import datetime, timedelta, timezone
 
 
+@instrumented("process_daily_insights")
 def lambda_handler(event, context):
     try:
         query_params = event.get("queryStringParameters", {})
         scheduler = query_params.get("scheduler") if query_params else False
         date_str = query_params.get("date") if query_params else None
+        # verify=true recomputes historical SHAP over the full history and compares it with the incremental result
+        verify = str(query_params.get("verify", "")).lower() in ("1", "true") if query_params else False
 
         if date_str:
             target_date = pd.to_datetime(date_str).date()
@@ -24,104 +40,142 @@ def lambda_handler(event, context):
             else:
                 return {"statusCode": 400, "body": json.dumps({"error": "Missing 'date' parameter, provide date: YYYY-MM-DD"})}
     
-        model     = load_model("/opt/python/assets/xgb_model.json")
-        feat_cols = model.get_booster().feature_names
+        with span("model.load"):
+            model_entry = get_model()
+        model, feat_cols = model_entry.model, model_entry.feature_names
 
         with get_connection() as conn:
             # === DAILY INSIGHTS ===
-            check_df = pd.read_sql(
-                """
-                SELECT 1 FROM daily_insights
-                WHERE insight_date = %s
-                LIMIT 1
-                """,
-                conn,
-                params=[target_date]
-            )
+            with span("db.check"):
+                check_df = pd.read_sql(
+                    """
+                    SELECT 1 FROM daily_insights
+                    WHERE insight_date = %s
+                    LIMIT 1
+                    """,
+                    conn,
+                    params=[target_date]
+                )
             
             if not check_df.empty:
                 raise ValueError(f"Insight for {target_date} already exists in daily_insights.")
             
-            df_daily = pd.read_sql(
-                """
-                SELECT * FROM incoming_data
-                WHERE DATE(timestamp) = %s AND processed = FALSE
-                ORDER BY timestamp
-                """,
-                conn, params=[target_date]
-            )
+            with span("db.read") as s:
+                df_daily = read_incoming(
+                    conn, UNPROCESSED_DAY, day_range(target_date),
+                    columns=["id"] + MODEL_COLUMNS
+                )
+                s.rows = len(df_daily)
 
             if df_daily.empty:
                 return {
                     "statusCode": 404,
                     "body": json.dumps({"error": f"No unprocessed data found for {target_date}"})
                 }
-            expected_intervals = 24 * 4
             if len(df_daily) < 96:
                 return {
                     "statusCode": 400,
                     "body": json.dumps({"error": f"Insufficient data for a full day insight. Expected 96 entries, found {len(df_daily)} for {target_date}."})
                 }
         
-            df_proc = preprocess(df_daily, model_features=feat_cols)
+            # the previous day's lag tail keeps the first rows of the day, see src/utils/lag_state.py
+            lag_depth = max_lag(feat_cols)
+            with span("db.read_lag_tail"):
+                history = load_tail(conn, target_date, lag_depth)
+            # a day already in the feature store (src/utils/feature_store.py) is not preprocessed again
+            store_key = df_proc = None
+            if FEATURE_STORE_DIR:
+                with span("features"):
+                    store_key = source_key(day_versions(conn, target_date - timedelta(days=1), target_date), target_date)
+                    df_proc = load_day(target_date, feat_cols, store_key)
+            if df_proc is None:
+                # the float32 frame the store would return, so a later run from the store computes the same insights
+                with span("preprocess", rows=len(df_daily)):
+                    df_proc = stored_frame(preprocess(df_daily, model_features=feat_cols, compact=True, history=history), feat_cols)
+                if store_key is not None:
+                    write_day(target_date, df_proc, feat_cols, store_key)
             X_daily = df_proc.drop(columns=["mental_health_status"])
-            top_features = get_shap_values(X_daily, model, n_feat=5)
-            correlation_map = get_correlation_matrix(df_proc, n_feat=5)
+            with span("shap", rows=len(X_daily)):
+                # one SHAP pass per row: the all-locations aggregate is the sum of the per-location ones
+                per_location = location_aggregates(df_proc, model_entry.path)
+                daily_agg = merge_aggregates(list(per_location.values()))
+                top_features = top_shap_features(daily_agg["shap_abs_sum"], daily_agg["row_count"], n_feat=5)
+            with span("correlation", rows=len(df_proc)):
+                correlation_map = get_correlation_matrix(df_proc, n_feat=5)
 
 
             # Save daily insights
-            with conn.cursor() as cur:
+            with span("db.write", rows=len(df_daily)), conn.cursor() as cur:
 
                 cur.execute("""
                     INSERT INTO daily_insights (insight_date, top_stress_features_shap, correlations_pearson)
                     VALUES (%s, %s, %s);
                 """, (target_date, Json(top_features), Json(correlation_map)))
+                save_daily_aggregate(cur, target_date, daily_agg)
+                save_time_of_day_stats(cur, target_date, df_proc)
+                save_location_days(cur, [target_date], *location_day_rows(target_date, per_location, n_feat=5))
+                save_tails(cur, [(target_date, next_tail(df_daily, history, lag_depth))], lag_depth)
 
                 ids = df_daily["id"].tolist()
                 cur.execute(
-                    "UPDATE incoming_data SET processed = TRUE WHERE id = ANY(%s);",
-                    (ids,)
+                    "UPDATE incoming_data SET processed = TRUE WHERE id = ANY(%s) AND timestamp >= %s AND timestamp < %s;",
+                    (ids, *day_range(target_date))
                 )
                 conn.commit()
 
             # === HISTORICAL INSIGHTS (AFTER DAILY ARE PROCESSED) ===
-            df_all = pd.read_sql(
-                """
-                SELECT * FROM incoming_data
-                WHERE timestamp <= %s
-                """,
-                conn,
-                params=[target_date]
-            )
-            if df_all.empty:
-                return {
-                    "statusCode": 404,
-                    "body": json.dumps({"error": "No data is available for historical insights."})
-                }
-
-            proc_df_all = preprocess(df_all, model_features=feat_cols)
-            X_all = proc_df_all.drop(columns=["mental_health_status"])
-            top_features_all = get_shap_values(X_all, model, n_feat=5)
-            correlation_map_all = get_correlation_matrix(proc_df_all, n_feat=5)
+            # Built from the stored per-day aggregates, incoming_data history is not read
+            with span("historical"):
+                hist = historical_shap_from_aggregates(conn, target_date, n_feat=5)
+                top_features_all    = hist["top_stress_features_shap"]
+                time_range          = hist["time_range"]
+                days_analyzed       = hist["days_analyzed"]
+                correlation_map_all = correlations_for_range(conn, end_date=target_date, n_feat=5)
+                location_rows       = location_historical_from_aggregates(conn, target_date, n_feat=5)
 
-            date_range = proc_df_all.index.normalize().unique()
-            time_range = f"{date_range.min().date()} to {date_range.max().date()}"
-            days_analyzed = len(date_range)
+            verification = None
+            if verify:
+                # full recompute, for comparison only: outliers repaired day by day like the processed days,
+                # so the comparison shows what the incremental path changes and not the repair statistics
+                with span("verify") as s:
+                    df_all = read_incoming(conn, "timestamp < %s", [day_range(target_date)[1]])
+                    s.rows = len(df_all)
+                    proc_df_all = preprocess(df_all, model_features=feat_cols, compact=True, repair_tz=session_timezone(conn))
+                    X_all = proc_df_all.drop(columns=["mental_health_status"])
+                    n_all = len(X_all.columns)
+                    verification = {
+                        "shap": compare_shap(
+                            top_shap_features(hist["shap_abs_sum"], hist["row_count"], n_feat=n_all),
+                            get_shap_values(X_all, model, n_feat=n_all),
+                            n_feat=5
+                        ),
+                        "correlations": compare_correlations(
+                            correlations_for_range(conn, end_date=target_date, n_feat=n_all),
+                            get_correlation_matrix(proc_df_all, n_feat=n_all)
+                        ),
+                    }
 
-            with conn.cursor() as cur:
+            with span("db.write_historical"), conn.cursor() as cur:
                 cur.execute("""
                     INSERT INTO historical_insights (time_range, top_stress_features_shap, correlations_pearson, days_analyzed)
                     VALUES (%s, %s, %s, %s);
                 """, (time_range, Json(top_features_all), Json(correlation_map_all), days_analyzed))
+                save_location_historical(cur, location_rows)
                 conn.commit()
+                invalidate_insights(target_date, locations=[row[0] for row in location_rows])
+
+                body = {
+                    "message": f"Historical insights were updated to include {date_str} data.",
+                    "top_stress_features_shap": top_features,
+                    "correlations_pearson": correlation_map,
+                    "locations": sorted(per_location),
+                }
+                if verification is not None:
+                    body["verification"] = verification
 
                 return {
                     "statusCode": 200,
-                    "body": json.dumps({
-                        "message": f"Historical insights were updated to include {date_str} data.",
-                        "top_stress_features_shap": top_features,
-                        "correlations_pearson": correlation_map
-                    })
+                    "body": json.dumps(body)
                 }
 
     except Exception as e:
@@ -6,6 +6,27 @@ CREATE TABLE IF NOT EXISTS daily_insights (
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- single day and start/end range lookups of the GET endpoint
+CREATE INDEX IF NOT EXISTS daily_insights_date_idx
+  ON daily_insights (insight_date);
+
+-- mergeable per-day aggregates, historical insights are summed from these
+CREATE TABLE IF NOT EXISTS daily_aggregates (
+  insight_date DATE PRIMARY KEY,
+  row_count INT NOT NULL,
+  shap_abs_sum JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- per-day, per-time-of-day sums and counts for get_correlation_matrix (one row per 15 min bucket)
+CREATE TABLE IF NOT EXISTS daily_time_of_day_stats (
+  insight_date DATE NOT NULL,
+  time_of_day TIME NOT NULL,
+  sums JSONB NOT NULL,
+  counts JSONB NOT NULL,
+  PRIMARY KEY (insight_date, time_of_day)
+);
+
 CREATE TABLE IF NOT EXISTS historical_insights (
   hinsight_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
   time_range TEXT NOT NULL, 
@@ -15,6 +36,56 @@ CREATE TABLE IF NOT EXISTS historical_insights (
   created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- bootstrap bounds of top_stress_features_shap ({feature: [low, high]}) when the full recompute explained a sample of rows
+ALTER TABLE historical_insights ADD COLUMN IF NOT EXISTS top_stress_features_shap_ci JSONB;
+
+-- per-location breakdown of a processed day: the day's insights for one location_id and its mergeable |SHAP| sums
+CREATE TABLE IF NOT EXISTS location_daily_insights (
+  insight_date DATE NOT NULL,
+  location_id INT NOT NULL,
+  row_count INT NOT NULL,
+  shap_abs_sum JSONB NOT NULL,
+  top_stress_features_shap JSONB NOT NULL,
+  correlations_pearson JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (insight_date, location_id)
+);
+
+-- per-location time-of-day sums and counts, same as daily_time_of_day_stats
+CREATE TABLE IF NOT EXISTS location_time_of_day_stats (
+  insight_date DATE NOT NULL,
+  location_id INT NOT NULL,
+  time_of_day TIME NOT NULL,
+  sums JSONB NOT NULL,
+  counts JSONB NOT NULL,
+  PRIMARY KEY (insight_date, location_id, time_of_day)
+);
+
+CREATE TABLE IF NOT EXISTS location_historical_insights (
+  lhinsight_id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  location_id INT NOT NULL,
+  time_range TEXT NOT NULL,
+  days_analyzed INT NOT NULL,
+  top_stress_features_shap JSONB NOT NULL,
+  correlations_pearson JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS location_historical_insights_latest_idx
+  ON location_historical_insights (location_id, created_at DESC);
+
+-- last max_lag repaired base rows as of a processed day ({"timestamp": [...], column: [...]}),
+-- the next day prepends them so its first rows keep their lag features (src/utils/lag_state.py)
+CREATE TABLE IF NOT EXISTS lag_tails (
+  insight_date DATE PRIMARY KEY,
+  max_lag INT NOT NULL,
+  rows JSONB NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- incoming_day_versions version of insight_date when its tail was saved, a newer version makes the tail stale
+ALTER TABLE lag_tails ADD COLUMN IF NOT EXISTS source_version BIGINT;
+
 CREATE TABLE IF NOT EXISTS incoming_data (
   id SERIAL PRIMARY KEY,
   timestamp TIMESTAMPTZ NOT NULL,
@@ -31,3 +102,76 @@ CREATE TABLE IF NOT EXISTS incoming_data (
   mental_health_status INT,
   processed BOOLEAN DEFAULT FALSE
 );
+
+-- daily lookups read one day of unprocessed rows (timestamp >= day AND timestamp < day + 1 AND processed = FALSE)
+-- and the earliest unprocessed day. Processed rows drop out of the partial index, so it stays about one day big.
+CREATE INDEX IF NOT EXISTS incoming_data_unprocessed_ts_idx
+  ON incoming_data (timestamp) WHERE processed = FALSE;
+
+-- range reads over processed history, and the lag tail before a day (timestamp < day ORDER BY timestamp DESC LIMIT
+-- max_lag, src/utils/lag_state.py): a backward scan that stops after max_lag rows instead of sorting the whole history
+CREATE INDEX IF NOT EXISTS incoming_data_ts_idx
+  ON incoming_data (timestamp);
+
+-- version of every day of incoming_data (DATE(timestamp) in the writer's TimeZone): the id of the last transaction
+-- that inserted, deleted or changed model columns of its rows. Marking rows processed leaves it alone.
+-- The feature store keys its partitions on it (src/utils/feature_store.py), checking a partition costs one row per day.
+CREATE TABLE IF NOT EXISTS incoming_day_versions (
+  day DATE PRIMARY KEY,
+  version BIGINT NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION bump_incoming_day_versions() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO incoming_day_versions (day, version)
+    SELECT DATE(timestamp), pg_current_xact_id()::text::bigint FROM new_rows GROUP BY 1
+    ON CONFLICT (day) DO UPDATE SET version = EXCLUDED.version;
+  ELSIF TG_OP = 'DELETE' THEN
+    INSERT INTO incoming_day_versions (day, version)
+    SELECT DATE(timestamp), pg_current_xact_id()::text::bigint FROM old_rows GROUP BY 1
+    ON CONFLICT (day) DO UPDATE SET version = EXCLUDED.version;
+  ELSE
+    INSERT INTO incoming_day_versions (day, version)
+    SELECT DATE(v.timestamp), pg_current_xact_id()::text::bigint
+    FROM old_rows o
+    JOIN new_rows n USING (id)
+    CROSS JOIN LATERAL (VALUES (o.timestamp), (n.timestamp)) AS v (timestamp)
+    WHERE (o.timestamp, o.location_id, o.temperature_celsius, o.humidity_percent, o.air_quality_index, o.noise_level_db,
+           o.lighting_lux, o.crowd_density, o.stress_level, o.sleep_hours, o.mood_score, o.mental_health_status)
+      IS DISTINCT FROM
+          (n.timestamp, n.location_id, n.temperature_celsius, n.humidity_percent, n.air_quality_index, n.noise_level_db,
+           n.lighting_lux, n.crowd_density, n.stress_level, n.sleep_hours, n.mood_score, n.mental_health_status)
+    GROUP BY 1
+    ON CONFLICT (day) DO UPDATE SET version = EXCLUDED.version;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS incoming_data_versions_insert ON incoming_data;
+CREATE TRIGGER incoming_data_versions_insert AFTER INSERT ON incoming_data
+  REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_incoming_day_versions();
+DROP TRIGGER IF EXISTS incoming_data_versions_update ON incoming_data;
+CREATE TRIGGER incoming_data_versions_update AFTER UPDATE ON incoming_data
+  REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_incoming_day_versions();
+DROP TRIGGER IF EXISTS incoming_data_versions_delete ON incoming_data;
+CREATE TRIGGER incoming_data_versions_delete AFTER DELETE ON incoming_data
+  REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION bump_incoming_day_versions();
+
+-- days loaded before the triggers existed
+INSERT INTO incoming_day_versions (day, version)
+SELECT DATE(timestamp), pg_current_xact_id()::text::bigint FROM incoming_data GROUP BY 1
+ON CONFLICT (day) DO NOTHING;
+
+-- per-interval mental_health_status predictions of the scoring endpoint (src/utils/scoring.py): one row per scored
+-- row and model version, scoring the same rows again with the same model overwrites them
+CREATE TABLE IF NOT EXISTS status_predictions (
+  timestamp TIMESTAMPTZ NOT NULL,
+  location_id INT NOT NULL,
+  model_version TEXT NOT NULL,
+  probability DOUBLE PRECISION NOT NULL,
+  predicted_status INT NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (model_version, location_id, timestamp)
+);
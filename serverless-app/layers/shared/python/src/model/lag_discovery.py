@@ -0,0 +1,209 @@
+import hashlib
+from collections import OrderedDict
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+
+"""
+Lag discovery behind the ACF/PACF stages of preprocess (add_acf_lag_features, add_pacf_lag_features).
+For every lag column (and resampling period) it picks
+- the ACF cutoff: the first lag whose autocorrelation falls inside the 95% band (1.96 / sqrt(n)), else 4,
+  which becomes a rolling mean <col>_ma_lag_<cutoff>
+- the PACF significant lags: every lag whose partial autocorrelation is outside that band, <col>_lag_<lag>
+the same choices as statsmodels acf(fft=True) / pacf() (method "ywadjusted") one column at a time, computed for
+all columns at once:
+- the frame is resampled once per period, columns with the same missing rows are one 2-D block
+- ACF: one real FFT over the rows of the whole block (zero-padded, |F|^2, inverse) gives every autocovariance
+- PACF: Durbin-Levinson on the (n - k adjusted) autocovariances, the recursion runs on all columns together
+The choices are cached by a fingerprint of the data (a hash of the timestamps and values of the lag columns),
+so preprocessing the same history again does not run the discovery again.
+add_lag_columns builds every rolling mean and lag into a single matrix (cumulative sums once per column, then
+one vectorized difference or slice per new column) that is joined to the frame at once, instead of inserting
+the columns one by one.
+"""
+
+CONFIDENCE_Z     = 1.96 # 95% band
+ACF_DEFAULT_LAG  = 4 # ACF cutoff when no lag falls inside the band
+ROWS_MINUTES     = 15 # lags are converted to rows of the raw 15 min data
+CACHE_SIZE       = 32
+
+
+class LagChoice(NamedTuple):
+    """Columns to add: rolling means (column, window rows) and shifts (column, lag rows)."""
+    rolling: tuple[tuple[str, int], ...]
+    shifts: tuple[tuple[str, int], ...]
+
+    def names(self) -> list[str]:
+        return [f"{col}_ma_lag_{w}" for col, w in self.rolling] + [f"{col}_lag_{lag}" for col, lag in self.shifts]
+
+
+# fingerprint -> LagChoice, least recently used first
+_CACHE: OrderedDict = OrderedDict()
+
+
+#
+def _autocovariances(values: np.ndarray, nlags: int) -> np.ndarray:
+    """(nlags + 1, k) autocovariances (sum of products / n) of the demeaned columns of values (n x k), one FFT."""
+    n = len(values)
+    x = values - values.mean(axis=0)
+    size = 1 << (2 * n - 1).bit_length() # >= 2n - 1, no circular wrap-around
+    spectrum = np.fft.rfft(x, n=size, axis=0)
+    return np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=0)[:nlags + 1] / n
+
+
+#
+def acf_batch(values: np.ndarray, nlags: int) -> np.ndarray:
+    """(nlags + 1, k) autocorrelations of every column of values (n x k, no NaN), like statsmodels acf(fft=True)."""
+    acov = _autocovariances(values, nlags)
+    return acov / acov[0]
+
+
+#
+def pacf_batch(values: np.ndarray, nlags: int) -> np.ndarray:
+    """
+    (nlags + 1, k) partial autocorrelations of every column of values (n x k, no NaN), like statsmodels pacf()
+    (Yule-Walker on autocovariances adjusted by n / (n - k)), by the Durbin-Levinson recursion on all columns at once.
+    """
+    n = len(values)
+    acov = _autocovariances(values, nlags) * (n / (n - np.arange(nlags + 1)))[:, None]
+    r = acov / acov[0]
+
+    k = values.shape[1]
+    out = np.zeros((nlags + 1, k))
+    out[0] = 1.0
+    phi = np.zeros((nlags + 1, k)) # phi[1:m + 1] are the AR(m) coefficients
+    sigma = np.ones(k)
+    for m in range(1, nlags + 1):
+        reflection = (r[m] - (phi[1:m] * r[m - 1:0:-1]).sum(axis=0)) / sigma
+        phi[1:m] = phi[1:m] - reflection * phi[m - 1:0:-1]
+        phi[m] = reflection
+        sigma = sigma * (1 - reflection ** 2)
+        out[m] = reflection
+    return out
+
+
+#
+def _blocks(frame: pd.DataFrame):
+    """(columns, values) blocks: the columns with the same missing rows, without those rows."""
+    groups = {}
+    valid = frame.notna().to_numpy()
+    for j, col in enumerate(frame.columns):
+        groups.setdefault(valid[:, j].tobytes(), []).append(col)
+    for cols in groups.values():
+        block = frame[cols].dropna().to_numpy(dtype=np.float64)
+        if len(block):
+            yield cols, block
+
+
+#
+def _rows(lag: int, period: str) -> int:
+    """A lag of the resampled series in rows of the raw data, like the original stages convert it."""
+    if not period:
+        return lag
+    return int(lag * (pd.Timedelta(period).total_seconds() / 60) / ROWS_MINUTES)
+
+
+#
+def _discover_period(df: pd.DataFrame, cols: list, period: str, max_lag: int, acf: bool, pacf: bool) -> tuple[list, list]:
+    frame = df[cols].resample(period).mean() if period else df[cols]
+    rolling, shifts = [], []
+    for block_cols, values in _blocks(frame):
+        n = len(values)
+        nlags = min(max_lag, n // 3 - 1)
+        if nlags < 1:
+            continue
+        threshold = CONFIDENCE_Z / np.sqrt(n)
+        if acf:
+            inside  = np.abs(acf_batch(values, nlags)[1:]) < threshold
+            cutoffs = np.where(inside.any(axis=0), inside.argmax(axis=0) + 1, ACF_DEFAULT_LAG)
+            rolling += [(col, _rows(int(c), period)) for col, c in zip(block_cols, cutoffs) if c > 1]
+        if pacf:
+            significant = np.abs(pacf_batch(values, nlags)[1:]) > threshold
+            for j, col in enumerate(block_cols):
+                shifts += [(col, _rows(int(lag), period)) for lag in np.flatnonzero(significant[:, j]) + 1]
+    return rolling, shifts
+
+
+#
+def fingerprint(df: pd.DataFrame, cols, periods, max_lag: int, acf=True, pacf=True) -> str:
+    """Hash of the timestamps and lag column values of df and of the discovery settings."""
+    digest = hashlib.sha1(repr((list(cols), tuple(periods), max_lag, acf, pacf)).encode())
+    digest.update(np.ascontiguousarray(df.index.asi8).tobytes())
+    digest.update(np.ascontiguousarray(df[list(cols)].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+#
+def discover_lags(df: pd.DataFrame, cols, periods=("",), max_lag=48, acf=True, pacf=True) -> LagChoice:
+    """
+    Rolling mean windows (ACF cutoffs) and lags (PACF) of cols over every period ("" = the raw rows, "1h", ...),
+    cached by fingerprint. A column/lag chosen for several periods is listed once.
+    """
+    cols = [c for c in cols if c in df.columns]
+    key = fingerprint(df, cols, periods, max_lag, acf, pacf)
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+        return _CACHE[key]
+
+    rolling, shifts = [], []
+    for period in periods:
+        period_rolling, period_shifts = _discover_period(df, cols, period, max_lag, acf, pacf)
+        rolling += period_rolling
+        shifts  += period_shifts
+    choice = LagChoice(tuple(dict.fromkeys(rolling)), tuple(dict.fromkeys(shifts)))
+
+    _CACHE[key] = choice
+    if len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return choice
+
+
+#
+def clear_cache():
+    _CACHE.clear()
+
+
+#
+def _window_sums(values: np.ndarray, cache: dict, col: str) -> tuple[np.ndarray, np.ndarray]:
+    """Cumulative sums of the non-NaN values of a column and of their count, each with a leading 0."""
+    if col not in cache:
+        valid = ~np.isnan(values)
+        cache[col] = (
+            np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))]),
+            np.concatenate([[0], np.cumsum(valid)]),
+        )
+    return cache[col]
+
+
+#
+def add_lag_columns(df: pd.DataFrame, choice: LagChoice, dtype=np.float64) -> pd.DataFrame:
+    """
+    df with the rolling means (min_periods=1, NaN skipped, like Series.rolling().mean()) and shifted columns of choice.
+    They are filled into one preallocated (columns x rows) matrix, the layout of a DataFrame block, so the frame
+    wraps it without a copy: a rolling mean is a difference of cumulative sums (computed once per column), a
+    shift a slice copy. Columns df already has keep their values.
+    """
+    specs = [(f"{col}_ma_lag_{w}", col, w, True) for col, w in choice.rolling]
+    specs += [(f"{col}_lag_{lag}", col, lag, False) for col, lag in choice.shifts]
+    specs = [spec for spec in specs if spec[0] not in df.columns]
+    if not specs:
+        return df
+
+    n = len(df)
+    base = {col: df[col].to_numpy(dtype=np.float64) for col in dict.fromkeys(spec[1] for spec in specs)}
+    out  = np.empty((len(specs), n), dtype=dtype)
+    sums = {}
+    for j, (_, col, step, rolling) in enumerate(specs):
+        values, step = base[col], min(step, n)
+        if rolling:
+            totals, counts = _window_sums(values, sums, col)
+            lower, lower_counts = np.zeros(n), np.zeros(n, dtype=counts.dtype) # sums before the window
+            lower[step:], lower_counts[step:] = totals[1:n - step + 1], counts[1:n - step + 1]
+            with np.errstate(invalid="ignore"): # no value in the window: NaN, like pandas
+                out[j] = (totals[1:] - lower) / (counts[1:] - lower_counts)
+        else:
+            out[j, :step] = np.nan
+            out[j, step:] = values[:n - step]
+
+    added = pd.DataFrame(out.T, index=df.index, columns=[spec[0] for spec in specs], copy=False)
+    return pd.concat([df, added], axis=1)
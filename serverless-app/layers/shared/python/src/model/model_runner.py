@@ -1,12 +1,47 @@
+import os
+import weakref
+from typing import NamedTuple
 import xgboost as xgb
+import numpy as np
 import pandas as pd
+from src.model.preprocess import LagStep, compile_lag_plan
 
-MODEL_PATH = "assets/xgb_model.json"
+# Layer asset (/opt/python/assets in Lambda), can be overridden with MODEL_PATH
+MODEL_PATH = os.environ.get(
+    "MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "assets", "xgb_model.json")
+)
 
 
-def load_model(path) -> xgb.XGBClassifier:
+class ModelEntry(NamedTuple):
+    """A loaded model plus the metadata derived from it."""
+    model: xgb.XGBClassifier
+    feature_names: list[str]
+    lag_plan: tuple[LagStep, ...]
+    path: str
+    mtime: float
+
+
+# path -> ModelEntry, lives for the whole (warm) Lambda container
+_REGISTRY: dict[str, ModelEntry] = {}
+
+
+def resolve_model_path(path=None) -> str:
+    """
+    Absolute model path, MODEL_PATH by default.
+    A JSON model with an up-to-date binary (.ubj) sibling resolves to the binary one, it loads faster.
+    """
+    path = os.path.abspath(str(path if path else MODEL_PATH))
+    root, ext = os.path.splitext(path)
+    ubj_path  = root + ".ubj"
+    if ext == ".json" and os.path.exists(ubj_path) and os.path.getmtime(ubj_path) >= os.path.getmtime(path):
+        return ubj_path
+    return path
+
+
+def load_model(path=None) -> xgb.XGBClassifier:
     """
-    Loads a trained XGBoost model from JSON.
+    Loads a trained XGBoost model from JSON or UBJSON (picked by the file extension).
     """
     path = path if path else MODEL_PATH
     model = xgb.XGBClassifier()
@@ -14,8 +49,70 @@ def load_model(path) -> xgb.XGBClassifier:
     return model
 
 
-def predict(model, X: pd.DataFrame) -> pd.Series:
+def get_model(path=None) -> ModelEntry:
+    """
+    Cached model for path (MODEL_PATH by default) with its feature names and compiled lag plan.
+    Loaded once per container, reloaded only when the file's mtime changes.
+    """
+    path  = resolve_model_path(path)
+    mtime = os.path.getmtime(path)
+
+    entry = _REGISTRY.get(path)
+    if entry is None or entry.mtime != mtime:
+        model = load_model(path)
+        feature_names = model.get_booster().feature_names
+        entry = ModelEntry(model, feature_names, compile_lag_plan(tuple(feature_names)), path, mtime)
+        _REGISTRY[path] = entry
+    return entry
+
+
+def clear_model_cache():
+    """Drops every cached model (the next get_model call reloads from disk)."""
+    _REGISTRY.clear()
+
+
+def save_binary_model(path=None) -> str:
+    """
+    Writes a UBJSON copy of a JSON model next to it (same name, .ubj) and returns its path.
+    """
+    path = os.path.abspath(str(path if path else MODEL_PATH))
+    ubj_path = os.path.splitext(path)[0] + ".ubj"
+    load_model(path).save_model(ubj_path)
+    return ubj_path
+
+
+# booster -> thread count set by set_prediction_threads
+_THREADS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def set_prediction_threads(model, nthread: int):
+    """
+    Sets the number of threads the model's booster predicts with (0 = all cores), for every later prediction.
+    Any set_param makes XGBoost reconfigure the booster on the next prediction (~0.4 ms, more than scoring
+    a day of rows), so the parameter is only set when the count changes.
+    """
+    booster = model.get_booster()
+    if _THREADS.get(booster) != nthread:
+        booster.set_param({"nthread": int(nthread)})
+        _THREADS[booster] = nthread
+
+
+def predict_proba(model, X, nthread=None) -> np.ndarray:
+    """
+    Probability of mental_health_status = 1 per row of X (model features in model order, NaN = missing).
+    XGBoost in-place prediction on a C-contiguous float32 matrix: no DMatrix is built per call, and a matrix
+    from build_feature_matrix/preprocess(compact=True) is passed without a copy.
+    nthread (see set_prediction_threads) None keeps the booster's current setting.
+    """
+    values = X.to_numpy(dtype=np.float32) if isinstance(X, pd.DataFrame) else X
+    values = np.ascontiguousarray(values, dtype=np.float32)
+    if nthread is not None:
+        set_prediction_threads(model, nthread)
+    return model.get_booster().inplace_predict(values, validate_features=False)
+
+
+def predict(model, X, nthread=None) -> np.ndarray:
     """
-    Predicts the mental health status from features.
+    Predicts the mental health status from features (same labels as model.predict, see predict_proba).
     """
-    return model.predict(X)
\ No newline at end of file
+    return (predict_proba(model, X, nthread) > 0.5).astype(np.int64)
@@ -1,7 +1,10 @@
+import os
 import pandas as pd
 import numpy as np
-from statsmodels.tsa.stattools import acf, pacf
 import re
+from functools import lru_cache
+from typing import NamedTuple
+from src.model.lag_discovery import discover_lags, add_lag_columns
 
 
 TARGET = 'mental_health_status'
@@ -14,23 +17,136 @@ BASE_FEATURES = [
 
 INDEX = 'timestamp'
 
+LAG_PATTERN = re.compile(r"(.+?)_lag_(\d+)$")
+
+# lag discovery (preprocess(lag_cols=...)): the columns the ACF/PACF stages were run on, and their periods
+DEFAULT_LAG_COLS = [f for f in BASE_FEATURES if f != 'location_id'] + [TARGET]
+LAG_PERIODS      = ('', '1h')
+
+# memory-lean default for preprocess(compact=None), see preprocess
+COMPACT = os.environ.get("PREPROCESS_COMPACT", "0") == "1"
+
+
 #
-def remove_target_outliers(df: pd.DataFrame) -> pd.DataFrame:
+def _own(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Replaces target=2 with the higher of its neighbors (assumed to be an outlier).
+    A frame a stage may modify without touching its input: a lazy (shallow) copy when pandas
+    copy-on-write is on (preprocess(compact=True) turns it on), a full copy otherwise.
     """
+    return df.copy(deep=not pd.options.mode.copy_on_write)
 
-    df = df.copy()
-    outlier_indices = df[df[TARGET] == 2].index
 
-    for ts in outlier_indices:
-        idx = df.index.get_loc(ts)  # Get integer position of timestamp
+#
+def downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Float columns as float32, integer columns as the smallest signed integer type that holds their values
+    (location_id/air_quality_index -> int16, crowd_density/stress_level/target -> int8 on the sensor data).
+    Columns with NULLs were decoded as float and become float32.
+    """
+    out = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_float_dtype(values.dtype):
+            out[col] = values.astype(np.float32)
+        elif pd.api.types.is_integer_dtype(values.dtype) and len(values):
+            lo, hi = values.min(), values.max()
+            small  = next(t for t in (np.int8, np.int16, np.int32, np.int64) if np.iinfo(t).min <= lo and hi <= np.iinfo(t).max)
+            out[col] = values.astype(small)
+        else:
+            out[col] = values
+    return pd.DataFrame(out, index=df.index)
 
-        if 0 < idx < len(df) - 1: # make sure we exclude the last point (has no neighbors)
-            before_val = df.iloc[idx - 1][TARGET]
-            after_val = df.iloc[idx + 1][TARGET]
-            df.at[ts, TARGET] = max(before_val, after_val)
+#
+def _repair_target_values(values: np.ndarray) -> np.ndarray:
+    """
+    Vectorized core of remove_target_outliers.
+    Interior target=2 values take the higher of their neighbors. Runs of consecutive
+    outliers are resolved the same way the sequential loop does it: each point sees the
+    already repaired value before it, i.e. the value just before the run.
+    """
+    values = values.copy()
+    n = len(values)
+    if n < 3:
+        return values
+
+    pos  = np.arange(n)
+    mask = (values == 2) & (pos > 0) & (pos < n - 1)
+    if not mask.any():
+        return values
+
+    prev_mask = np.r_[False, mask[:-1]]
+    run_start = np.where(mask & ~prev_mask, pos, 0)
+    run_start = np.maximum.accumulate(run_start)[mask]
+
+    idx    = pos[mask]
+    before = values[run_start - 1]
+    after  = values[idx + 1]
+    repaired = np.where(after > before, after, before) # same as max(before, after)
+    repaired = np.where(idx != run_start, np.maximum(repaired, 2), repaired)
+
+    values[idx] = repaired
+    return values
+
+
+#
+def _repair_sign_flip_values(values: np.ndarray, iqr_coef=1.5) -> np.ndarray:
+    """
+    Vectorized core of flip_outlier_sign.
+    Neighbors are the rows right before and after, taken with shifted (rolled) arrays. The first row
+    still sees the last row as its left neighbor, like the positional lookup it replaces (idx - 1 = -1).
+    The last row has no right neighbor (the lookup raised IndexError there) and is left unrepaired.
+    Outliers whose left neighbor was itself an outlier depend on the already repaired value,
+    those few are resolved afterwards in order.
+    """
+    values = values.astype(float, copy=True) # float64 for the quantiles, callers cast back
+    n = len(values)
+    if n < 2:
+        return values
 
+    q25, q75 = np.nanquantile(values, [0.25, 0.75])
+    iqr      = q75 - q25
+    lq, uq   = q25 - iqr_coef * iqr, q75 + iqr_coef * iqr
+
+    outlier_mask = (values < lq) | (values > uq)
+    outlier_mask[-1] = False # no right neighbor
+    if not outlier_mask.any():
+        return values
+
+    chained = outlier_mask & np.roll(outlier_mask, 1)
+    chained[0] = False # its left neighbor, the last row, is never repaired
+
+    direct = outlier_mask & ~chained
+    before = np.roll(values, 1)[direct]
+    after  = np.roll(values, -1)[direct]
+    current = values[direct]
+
+    neighbor_sign = np.sign(before + after)
+    lo, hi = np.minimum(np.abs(after), np.abs(before)), np.maximum(np.abs(after), np.abs(before))
+    flip = (
+        (lo <= np.abs(current)) & (np.abs(current) <= hi)
+        & (np.sign(current) != neighbor_sign) & (neighbor_sign != 0)
+    )
+    values[np.flatnonzero(direct)[flip]] *= -1
+
+    for idx in np.flatnonzero(chained):
+        val_before  = values[idx - 1]
+        val_after   = values[idx + 1]
+        val_current = values[idx]
+        neighbor_sign = np.sign(val_before + val_after)
+        if min(abs(val_after), abs(val_before)) <= abs(val_current) <= max(abs(val_after), abs(val_before)):
+            if np.sign(val_current) != neighbor_sign and neighbor_sign != 0:
+                values[idx] *= -1
+
+    return values
+
+
+#
+def remove_target_outliers(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Replaces target=2 with the higher of its neighbors (assumed to be an outlier).
+    """
+    df = _own(df)
+    df[TARGET] = _repair_target_values(df[TARGET].to_numpy()).astype(df[TARGET].dtype)
     return df
 
 
@@ -41,166 +157,229 @@ def flip_outlier_sign(df: pd.DataFrame, col='mood_score', iqr_coef=1.5) -> pd.Da
     For example, a few outliers (and their left and right neighbor) 
     in mood_score look like 1.4 -2.2 3.0 or 2.1 -1.7 0.5, which makes it appear as if the sign was flipped
     """
-    df = df.copy()
+    df = _own(df)
+    df[col] = _repair_sign_flip_values(df[col].to_numpy(), iqr_coef=iqr_coef).astype(df[col].dtype, copy=False)
+    return df
 
-    q25, q75 = df[col].quantile([0.25, 0.75])
-    iqr      = q75 - q25
-    lq, uq   = q25 - iqr_coef * iqr, q75 + iqr_coef * iqr
 
-    outlier_mask = (df[col] < lq) | (df[col] > uq)
-    mc_outlier_timestamps = df.index[outlier_mask]
+#
+def repair_outliers(df: pd.DataFrame, col='mood_score', iqr_coef=1.5) -> pd.DataFrame:
+    """
+    Applies remove_target_outliers and flip_outlier_sign in one pass over NumPy arrays,
+    with a single copy of the frame (none under copy-on-write). Column dtypes are kept.
+    """
+    df = _own(df)
+    if TARGET in df.columns:
+        df[TARGET] = _repair_target_values(df[TARGET].to_numpy()).astype(df[TARGET].dtype)
+    if col in df.columns:
+        df[col] = _repair_sign_flip_values(df[col].to_numpy(), iqr_coef=iqr_coef).astype(df[col].dtype, copy=False)
+    return df
 
-    for ts in mc_outlier_timestamps:
-        idx = df.index.get_loc(ts)
-        val_before  = df.iloc[idx-1]['mood_score'] #if there were missing timepoints we should've handled this by time delta
-        val_after   = df.iloc[idx+1]['mood_score'] #instead of idx-1 or idx+1
-        val_current = df.iloc[idx]['mood_score'] 
-        neighbor_sign = np.sign(val_before + val_after)
-        if min(abs(val_after), abs(val_before)) <= abs(val_current) <= max(abs(val_after), abs(val_before)):
-            if np.sign(val_current) != neighbor_sign and neighbor_sign != 0:
-                df.iloc[idx, df.columns.get_loc('mood_score')] *= -1
+
+#
+def repair_outliers_by_day(df: pd.DataFrame, tz: str, col='mood_score', iqr_coef=1.5) -> pd.DataFrame:
+    """
+    repair_outliers on every calendar day (in tz) of df on its own, df sorted by its timestamp index.
+    Days processed one at a time (the daily job, the feature store, the lag tails) are repaired like this,
+    so a whole history gets the same IQR bounds and neighbors as its days.
+    """
+    df = _own(df)
+    index  = df.index if df.index.tz is not None else df.index.tz_localize("UTC")
+    days   = index.tz_convert(tz).normalize().asi8
+    starts = [0, *(np.flatnonzero(days[1:] != days[:-1]) + 1)]
+    bounds = list(zip(starts, starts[1:] + [len(df)]))
+    if TARGET in df.columns and len(df):
+        values = df[TARGET].to_numpy()
+        df[TARGET] = np.concatenate([_repair_target_values(values[lo:hi]) for lo, hi in bounds]).astype(df[TARGET].dtype)
+    if col in df.columns and len(df):
+        values = df[col].to_numpy()
+        repaired = np.concatenate([_repair_sign_flip_values(values[lo:hi], iqr_coef=iqr_coef) for lo, hi in bounds])
+        df[col] = repaired.astype(df[col].dtype, copy=False)
     return df
 
 
 #
-def add_time_features(df: pd.DataFrame) -> pd.DataFrame:
+def add_time_features(df: pd.DataFrame, compact=False) -> pd.DataFrame:
     """
     Adds hour, weekday, weekend, and cyclic encodings.
+    compact=True stores them as int8/float32.
     """
-    df = df.copy()
+    df = _own(df)
 
     df['hour'] = df.index.hour
     df['weekday'] = df.index.weekday
-    df['is_weekend'] = df['weekday'].isin([5, 6]).astype(int)
+    df['is_weekend'] = df['weekday'].isin([5, 6]).astype(np.int8 if compact else int)
+    if compact:
+        df['hour'] = df['hour'].astype(np.int8)
+        df['weekday'] = df['weekday'].astype(np.int8)
 
     # Cyclic encoding
-    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
-    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+    float_dtype = np.float32 if compact else np.float64 # computed in float64, then rounded
+    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24).astype(float_dtype, copy=False)
+    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24).astype(float_dtype, copy=False)
 
     return df
 
 
 #
-def add_acf_lag_features(df, cols, period='', max_lag=48) -> pd.DataFrame:
+def add_acf_lag_features(df, cols, period='', max_lag=48, dtype=np.float64) -> pd.DataFrame:
     """
     Adds rolling average features based on ACF cutoff
     """
-    df = df.copy()
-    for col in cols:
-        series = df[col].resample(period).mean() if period else df[col]
-        series = series.dropna()
+    return add_lag_columns(df, discover_lags(df, cols, (period,), max_lag, pacf=False), dtype=dtype)
 
-        adjusted_lag = min(max_lag, (len(series) // 3) - 1)
-        if adjusted_lag < 1:
-            continue 
 
-        try:
-            acf_vals = acf(series, nlags=adjusted_lag, fft=True)
-        except Exception as e:
-            print(f"ACF failed for {col}: {e}")
-            continue
+#
+def add_pacf_lag_features(df, cols, period='', max_lag=48, dtype=np.float64) -> pd.DataFrame:
+    """
+    Adds direct lag features based on PACF significant lags.
+    """
+    return add_lag_columns(df, discover_lags(df, cols, (period,), max_lag, acf=False), dtype=dtype)
+
+
+#
+def add_discovered_lag_features(df, cols=None, periods=LAG_PERIODS, max_lag=48, dtype=np.float64) -> pd.DataFrame:
+    """
+    Both stages for every period at once: one discovery (cached by data fingerprint) and one pass that adds
+    all rolling means and lags, see src/model/lag_discovery.py. Without cols df is returned as is.
+    """
+    if not cols:
+        return df
+    return add_lag_columns(df, discover_lags(df, cols, periods, max_lag), dtype=dtype)
 
-        threshold  = 1.96 / np.sqrt(len(series)) # == 95% CI
-        cutoff_lag = next((i for i, v in enumerate(acf_vals[1:], start=1) if abs(v) < threshold), 4)
 
-        if cutoff_lag > 1:
-            if period:
-                td = pd.Timedelta(period)
-                mins = int(td.total_seconds() / 60)
-                cutoff_lag = int(cutoff_lag * mins/15)
-            new_col = f'{col}_ma_lag_{cutoff_lag}'
-            df[new_col] = df[col].rolling(window=cutoff_lag, min_periods=1).mean()
 
-    return df
+#
+class LagStep(NamedTuple):
+    """One output column of a lag plan: feature = base_col shifted by lag rows."""
+    feature: str
+    base_col: str
+    lag: int
 
 
 #
-def add_pacf_lag_features(df, cols, period='', max_lag=48) -> pd.DataFrame:
+@lru_cache(maxsize=8)
+def compile_lag_plan(feature_list: tuple[str, ...]) -> tuple[LagStep, ...]:
     """
-    Adds direct lag features based on PACF significant lags.
+    Parses the model feature names once and lists the base column and shift for every output column.
+    Plain features are a shift of 0 of themselves. Cached per feature list (pass a tuple).
     """
-    df = df.copy()
+    plan = []
+    for feature in feature_list:
+        match = LAG_PATTERN.match(feature)
+        if match:
+            base_col, lag = match.groups()
+            plan.append(LagStep(feature, base_col, int(lag)))
+        else:
+            plan.append(LagStep(feature, feature, 0))
+    return tuple(plan)
 
-    for col in cols:
-        series = df[col].resample(period).mean() if period else df[col]
-        series = series.dropna()
 
-        adjusted_lag = min(max_lag, (len(series) // 3) - 1)
-        if adjusted_lag < 1:
-            continue 
+#
+def build_feature_matrix(df: pd.DataFrame, plan: tuple[LagStep, ...], dtype=np.float32) -> np.ndarray:
+    """
+    Fills a single preallocated C-contiguous (rows x features) matrix straight from the base columns.
+    Shifted-in rows and features whose base column is missing are NaN.
+    float32 is what XGBoost uses internally, so the matrix can be passed to the booster as is.
+    """
+    n_rows = len(df)
+    X = np.full((n_rows, len(plan)), np.nan, dtype=dtype)
 
-        try:
-            pacf_vals = pacf(series, nlags=adjusted_lag)
-        except Exception as e:
-            print(f"PACF failed for {col}: {e}")
+    base_cache = {}
+    for j, step in enumerate(plan):
+        if step.base_col not in df.columns:
             continue
+        if step.base_col not in base_cache:
+            base_cache[step.base_col] = df[step.base_col].to_numpy(dtype=dtype, na_value=np.nan)
+        base = base_cache[step.base_col]
 
-        threshold = 1.96 / np.sqrt(len(series))  # 95% confidence
-        sig_lags = [i for i, v in enumerate(pacf_vals[1:], start=1) if abs(v) > threshold]
+        if step.lag == 0:
+            X[:, j] = base
+        elif step.lag < n_rows:
+            X[step.lag:, j] = base[:-step.lag]
 
-        for lag in sig_lags:
-            if period: 
-                td = pd.Timedelta(period)
-                mins = int(td.total_seconds() / 60)
-                lag = int(lag * mins/15)
-            new_col = f'{col}_lag_{lag}'
-            df[new_col] = df[col].shift(lag)
+    return X
 
-    return df
 
+#
+def max_lag(feature_list) -> int:
+    """Rows of history the deepest lag feature of feature_list looks back (0 without lag features)."""
+    return max((step.lag for step in compile_lag_plan(tuple(feature_list))), default=0)
 
 
 #
-def generate_required_lags(df: pd.DataFrame, feature_list: list[str]) -> pd.DataFrame:
+def generate_required_lags(df: pd.DataFrame, feature_list: list[str], dtype=np.float64) -> pd.DataFrame:
     """
     Ensures the DataFrame includes all expected lag features used in the model.
     Creates any missing lag features.
     Removes any features not in feature_list.
+    Built from one feature matrix (float64 by default), the frame wraps it without a copy.
+    Use build_feature_matrix directly to skip the DataFrame.
     """
-    df = df.copy()
-    import re
-
-    lag_pattern = re.compile(r"(.+?)_lag_(\d+)$")
-
-    for feature in feature_list:
-        match = lag_pattern.match(feature)
-        if match:
-            base_col, lag = match.groups()
-            lag = int(lag)
-            if base_col in df.columns:
-                df[feature] = df[base_col].shift(lag)
-            else:
-                df[feature] = np.nan
-        elif feature not in df.columns:
-            df[feature] = np.nan
+    plan = compile_lag_plan(tuple(feature_list))
+    out  = pd.DataFrame(
+        build_feature_matrix(df, plan, dtype=dtype),
+        index=df.index,
+        columns=list(feature_list),
+        copy=False,
+    )
 
     # Keep only model features
-    keep_cols = feature_list + [TARGET] if TARGET in df.columns else feature_list
-    return df[keep_cols]
+    if TARGET in df.columns:
+        out[TARGET] = df[TARGET].to_numpy()
+    return out
 
 
 
 #
-def preprocess(df: pd.DataFrame, model_features=[], lag_cols=None) -> pd.DataFrame:
-    """Main preprocessing pipeline: outlier fixing, time features, ACF/PACF-based lags."""
-    #if lag_cols is None:
-    #    lag_cols = [f for f in BASE_FEATURES if f != 'location_id'] + [TARGET]
-    df = df.copy()
+def preprocess(df: pd.DataFrame, model_features=[], lag_cols=None, compact=None, history=None, dropna=True,
+               repair_tz=None) -> pd.DataFrame:
+    """
+    Main preprocessing pipeline: outlier fixing, time features, ACF/PACF-based lags.
+    compact=True (default: PREPROCESS_COMPACT=1) is the memory-lean mode: columns are downcast
+    (float32 features, int8/int16 integers) and the stages run under pandas copy-on-write, so they
+    share the unchanged columns instead of copying the frame. Same columns and rows, the values
+    are the float32 roundings (XGBoost uses float32 anyway, so SHAP values do not change).
+    history: already repaired base rows (timestamp index) that come right before df, like the lag tail
+    of the previous day (src/utils/lag_state.py). They only fill the lags of df's first rows and are
+    not returned, so with max_lag(model_features) rows of history no row of df is dropped for its lags.
+    dropna=False keeps rows with missing values (lags without history, rows without a target), for
+    scoring: XGBoost sends a missing value down the branch it learned for it.
+    lag_cols (e.g. DEFAULT_LAG_COLS) runs the ACF/PACF lag stages on them (add_discovered_lag_features), which add
+    the discovered rolling means/lags next to the model features, for feature discovery. None (the default) skips
+    them: the lags a trained model uses are already in model_features.
+    repair_tz (a timezone, the session TimeZone the days were split in) repairs outliers day by day
+    (repair_outliers_by_day) instead of over all of df, so a history gives the rows its days give one at a time.
+    """
+    compact = COMPACT if compact is None else compact
+    if compact:
+        with pd.option_context("mode.copy_on_write", True):
+            history = downcast(history) if history is not None else None
+            return _preprocess(downcast(df), model_features, lag_cols, compact=True, history=history, dropna=dropna,
+                               repair_tz=repair_tz)
+    return _preprocess(df.copy(), model_features, lag_cols, history=history, dropna=dropna, repair_tz=repair_tz)
+
 
+#
+def _preprocess(df: pd.DataFrame, model_features, lag_cols=None, compact=False, history=None, dropna=True,
+                repair_tz=None) -> pd.DataFrame:
     df = df.drop(columns=['processed'], errors='ignore')
 
     df['timestamp'] = pd.to_datetime(df['timestamp'])
     df.set_index('timestamp', inplace=True)
-    
-    return (
+
+    df = repair_outliers(df) if repair_tz is None else repair_outliers_by_day(df, repair_tz)
+    n_history = 0
+    if history is not None and len(history):
+        # repaired with their own day, only the new rows are repaired here
+        n_history = len(history)
+        df = pd.concat([history[[c for c in df.columns if c in history.columns]], df])
+
+    out = (
         df
-        .pipe(remove_target_outliers)
-        .pipe(flip_outlier_sign)
-        .pipe(add_time_features)
-        .pipe(generate_required_lags, feature_list=model_features)
-        #.pipe(add_acf_lag_features, cols=lag_cols, period='')
-        #.pipe(add_acf_lag_features, cols=lag_cols, period='1h')
-        #.pipe(add_pacf_lag_features, cols=lag_cols, period='')
-        #.pipe(add_pacf_lag_features, cols=lag_cols, period='1h')
-        .dropna()
-    )
\ No newline at end of file
+        .pipe(add_time_features, compact=compact)
+        .pipe(generate_required_lags, feature_list=model_features, dtype=np.float32 if compact else np.float64)
+        .pipe(add_discovered_lag_features, cols=lag_cols, dtype=np.float32 if compact else np.float64)
+        .iloc[n_history:]
+    )
+    return out.dropna() if dropna else out
\ No newline at end of file
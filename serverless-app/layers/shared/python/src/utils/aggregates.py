@@ -0,0 +1,180 @@
+import os
+import pandas as pd
+from psycopg2.extras import Json, RealDictCursor, execute_values
+from src.utils.stats import (
+    top_shap_features, get_time_of_day_stats, correlation_from_time_of_day_stats
+)
+
+"""
+Mergeable per-day aggregates for historical insights.
+Every processed day stores the sum of |SHAP| per feature and the number of rows it covers,
+so the historical mean |SHAP| is sum(sums) / sum(counts) over the stored days,
+instead of re-running the explainer on the whole incoming_data history.
+Correlations work the same way from per-day, per-time-of-day sums and counts (daily_time_of_day_stats).
+"""
+
+VERIFY_TOL = float(os.environ.get("HISTORICAL_VERIFY_TOL", 0.05))
+
+
+#
+def merge_aggregates(aggregates: list[dict]) -> dict:
+    """Adds up per-day aggregates. Features missing from a day count as 0."""
+    row_count, shap_abs_sum = 0, {}
+    for agg in aggregates:
+        row_count += agg["row_count"]
+        for feature, value in agg["shap_abs_sum"].items():
+            shap_abs_sum[feature] = shap_abs_sum.get(feature, 0.0) + value
+
+    return {"row_count": row_count, "shap_abs_sum": shap_abs_sum}
+
+
+#
+def save_daily_aggregate(cur, insight_date, agg: dict):
+    """Upserts the aggregate for one day (re-processing a day replaces it)."""
+    save_daily_aggregates(cur, [(insight_date, agg)])
+
+
+#
+def save_daily_aggregates(cur, items: list[tuple]):
+    """Upserts (insight_date, aggregate) pairs in one statement."""
+    execute_values(cur, """
+        INSERT INTO daily_aggregates (insight_date, row_count, shap_abs_sum)
+        VALUES %s
+        ON CONFLICT (insight_date) DO UPDATE
+        SET row_count = EXCLUDED.row_count,
+            shap_abs_sum = EXCLUDED.shap_abs_sum,
+            created_at = CURRENT_TIMESTAMP;
+    """, [(insight_date, agg["row_count"], Json(agg["shap_abs_sum"])) for insight_date, agg in items])
+
+
+#
+def load_aggregates(conn, end_date) -> list[dict]:
+    """All stored per-day aggregates up to and including end_date, oldest first."""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute("""
+            SELECT insight_date, row_count, shap_abs_sum
+            FROM daily_aggregates
+            WHERE insight_date <= %s
+            ORDER BY insight_date
+        """, (end_date,))
+        return cur.fetchall()
+
+
+#
+def historical_shap_from_aggregates(conn, end_date, n_feat=5) -> dict:
+    """
+    Historical top SHAP features built from stored aggregates.
+    Returns None when no day has been aggregated yet.
+    """
+    rows = load_aggregates(conn, end_date)
+    if not rows:
+        return None
+
+    merged = merge_aggregates(rows)
+    return {
+        "top_stress_features_shap": top_shap_features(merged["shap_abs_sum"], merged["row_count"], n_feat=n_feat),
+        "shap_abs_sum": merged["shap_abs_sum"],
+        "row_count": merged["row_count"],
+        "time_range": f"{rows[0]['insight_date']} to {rows[-1]['insight_date']}",
+        "days_analyzed": len(rows),
+    }
+
+
+#
+def time_of_day_rows(insight_date, df: pd.DataFrame) -> list[tuple]:
+    """daily_time_of_day_stats rows of a preprocessed day (one per 15 min bucket), as plain values."""
+    sums, counts = get_time_of_day_stats(df)
+    sums, counts = sums.to_dict("index"), counts.to_dict("index")
+    return [(insight_date, tod, sums[tod], counts[tod]) for tod in sums]
+
+
+#
+def save_time_of_day_stats(cur, insight_date, df: pd.DataFrame):
+    """
+    Stores the per-time-of-day sums and counts of a preprocessed day (one row per 15 min bucket).
+    Re-processing a day replaces its rows.
+    """
+    save_time_of_day_rows(cur, [insight_date], time_of_day_rows(insight_date, df))
+
+
+#
+def save_time_of_day_rows(cur, insight_dates: list, rows: list[tuple]):
+    """Replaces the stored buckets of insight_dates with rows (from time_of_day_rows), in bulk."""
+    cur.execute("DELETE FROM daily_time_of_day_stats WHERE insight_date = ANY(%s);", (list(insight_dates),))
+    if rows:
+        execute_values(cur, """
+            INSERT INTO daily_time_of_day_stats (insight_date, time_of_day, sums, counts)
+            VALUES %s
+        """, [(insight_date, tod, Json(sums), Json(counts)) for insight_date, tod, sums, counts in rows], page_size=1000)
+
+
+#
+def load_time_of_day_stats(conn, start_date=None, end_date=None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Merged time-of-day sums and counts over [start_date, end_date] (either bound optional).
+    The merge runs in Postgres, so only (buckets x features) values come back, however many days are stored.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT s.time_of_day, kv.key AS feature,
+                   SUM(kv.value::float8) AS total,
+                   SUM((s.counts ->> kv.key)::float8) AS n
+            FROM daily_time_of_day_stats s
+            CROSS JOIN LATERAL jsonb_each_text(s.sums) kv
+            WHERE (%s::date IS NULL OR s.insight_date >= %s::date)
+              AND (%s::date IS NULL OR s.insight_date <= %s::date)
+            GROUP BY s.time_of_day, kv.key
+        """, (start_date, start_date, end_date, end_date))
+        merged = pd.DataFrame(cur.fetchall(), columns=["time_of_day", "feature", "total", "n"])
+
+    sums   = merged.pivot(index="time_of_day", columns="feature", values="total")
+    counts = merged.pivot(index="time_of_day", columns="feature", values="n")
+    return sums, counts
+
+
+#
+def correlations_for_range(conn, start_date=None, end_date=None, n_feat=5) -> dict:
+    """
+    Same output as get_correlation_matrix over the stored days in the range, without touching incoming_data.
+    """
+    sums, counts = load_time_of_day_stats(conn, start_date, end_date)
+    if sums.empty:
+        return {}
+    return correlation_from_time_of_day_stats(sums, counts, n_feat=n_feat)
+
+
+#
+def compare_correlations(incremental: dict, full: dict, tol=VERIFY_TOL) -> dict:
+    """Compares two correlation maps ({feature: r}) by their largest absolute difference."""
+    features = set(incremental) | set(full)
+    diffs    = [abs(incremental.get(f, 0.0) - full.get(f, 0.0)) for f in features]
+    max_diff = max((d for d in diffs if d == d), default=0.0) # NaN for constant columns
+
+    return {
+        "ok": max_diff <= tol,
+        "top_features_match": set(incremental) == set(full),
+        "max_abs_diff": round(max_diff, 4),
+        "tolerance": tol,
+    }
+
+
+#
+def compare_shap(incremental: dict, full: dict, n_feat=5, tol=VERIFY_TOL) -> dict:
+    """
+    Compares incremental and full-recompute mean |SHAP| for all features ({feature: value}).
+    The difference is scaled by the largest full-recompute value so near-zero features don't dominate,
+    and the top n_feat features are compared as sets.
+    """
+    features = set(incremental) | set(full)
+    scale    = max(full.values(), default=0.0) or 1.0
+    max_diff = max((abs(incremental.get(f, 0.0) - full.get(f, 0.0)) for f in features), default=0.0) / scale
+
+    top_incremental = set(sorted(incremental, key=incremental.get, reverse=True)[:n_feat])
+    top_full        = set(sorted(full, key=full.get, reverse=True)[:n_feat])
+
+    return {
+        "ok": top_incremental == top_full and max_diff <= tol,
+        "top_features_match": top_incremental == top_full,
+        "max_scaled_diff": round(max_diff, 4),
+        "tolerance": tol,
+    }
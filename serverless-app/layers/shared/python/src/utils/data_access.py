@@ -0,0 +1,417 @@
+import queue
+import struct
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from psycopg2 import sql
+from src.model.preprocess import BASE_FEATURES, TARGET
+
+"""
+Columnar reader for incoming_data.
+Rows are streamed with `COPY (SELECT <projected columns> ...) TO STDOUT (FORMAT binary)` and decoded
+straight into typed NumPy arrays: rows without NULLs have a fixed width, so whole buffers are decoded
+at once with a structured dtype, and only rows that contain a NULL go through a per-row parser.
+Compared to pd.read_sql there are no Python tuples / datetime objects per row, and unused columns
+(id, processed) are not transferred unless asked for.
+The same layout is used the other way round by copy_incoming (COPY ... FROM STDIN) for bulk loads.
+"""
+
+# incoming_data column -> postgres wire type
+INCOMING_COLUMNS = {
+    "id": "int4",
+    "timestamp": "timestamptz",
+    "location_id": "int4",
+    "temperature_celsius": "float8",
+    "humidity_percent": "float8",
+    "air_quality_index": "int4",
+    "noise_level_db": "float8",
+    "lighting_lux": "float8",
+    "crowd_density": "int4",
+    "stress_level": "int4",
+    "sleep_hours": "float8",
+    "mood_score": "float8",
+    "mental_health_status": "int4",
+    "processed": "bool",
+}
+
+# what preprocess needs
+MODEL_COLUMNS = ["timestamp"] + BASE_FEATURES + [TARGET]
+
+CHUNK_ROWS = 100_000
+
+# one day of unprocessed rows, params are day_range(day). A half-open range on the raw column
+# (not DATE(timestamp) = day) so it can use incoming_data_unprocessed_ts_idx and partition pruning
+UNPROCESSED_DAY = "timestamp >= %s AND timestamp < %s AND processed = FALSE"
+
+# wire dtype, output dtype (the same dtypes pd.read_sql ends up with)
+_WIRE_TYPES = {
+    "int4":        (">i4", np.int64),
+    "int8":        (">i8", np.int64),
+    "float8":      (">f8", np.float64),
+    "bool":        ("?",   np.bool_),
+    "timestamptz": (">i8", np.int64),
+}
+
+_SIGNATURE   = b"PGCOPY\n\xff\r\n\x00"
+_PG_EPOCH_US = 946_684_800_000_000 # 2000-01-01 in unix microseconds
+
+
+def _row_dtype(types: list[str]) -> np.dtype:
+    """Layout of one NULL-free binary COPY row: field count, then (length, value) per column."""
+    return np.dtype(
+        [("n", ">i2")]
+        + [item for i, t in enumerate(types) for item in ((f"l{i}", ">i4"), (f"v{i}", _WIRE_TYPES[t][0]))]
+    )
+
+
+class _BinaryCopyDecoder:
+    """
+    Incremental decoder of a binary COPY stream into per-column arrays.
+    libpq hands over one row per write, so data is buffered and decoded FLUSH_BYTES at a time.
+    """
+
+    FLUSH_BYTES = 1 << 20
+
+    def __init__(self, columns: list[str]):
+        self.columns = list(columns)
+        self.types   = [INCOMING_COLUMNS[c] for c in self.columns]
+        self.sizes   = [np.dtype(_WIRE_TYPES[t][0]).itemsize for t in self.types]
+        self.row_dtype = _row_dtype(self.types)
+        self.buffer = bytearray()
+        self.header_done = False
+        self.finished = False
+        self.rows = 0
+        self._values = [[] for _ in self.columns]
+        self._nulls  = [[] for _ in self.columns]
+
+    def feed(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.FLUSH_BYTES:
+            self.flush()
+
+    def flush(self):
+        """Decodes every complete row in the buffer."""
+        if not self.header_done and not self._read_header():
+            return
+        while not self.finished and (self._read_fixed_rows() or self._read_one_row()):
+            pass
+
+    def _read_header(self) -> bool:
+        if len(self.buffer) < len(_SIGNATURE) + 8:
+            return False
+        if bytes(self.buffer[:len(_SIGNATURE)]) != _SIGNATURE:
+            raise ValueError("Not a binary COPY stream")
+        ext_len = struct.unpack_from(">i", self.buffer, len(_SIGNATURE) + 4)[0]
+        header_len = len(_SIGNATURE) + 8 + ext_len
+        if len(self.buffer) < header_len:
+            return False
+        del self.buffer[:header_len]
+        self.header_done = True
+        return True
+
+    def _read_fixed_rows(self) -> bool:
+        """Vectorized decode of the leading run of NULL-free (fixed width) rows."""
+        itemsize = self.row_dtype.itemsize
+        n_full   = len(self.buffer) // itemsize
+        if not n_full:
+            return False
+
+        arr   = np.frombuffer(self.buffer, dtype=self.row_dtype, count=n_full)
+        valid = arr["n"] == len(self.columns)
+        for i, size in enumerate(self.sizes):
+            valid &= arr[f"l{i}"] == size
+        n_valid = n_full if valid.all() else int(np.argmin(valid))
+
+        for i, t in enumerate(self.types):
+            if n_valid:
+                self._values[i].append(arr[f"v{i}"][:n_valid].astype(_WIRE_TYPES[t][1]))
+                self._nulls[i].append(None)
+        del arr # release the view before the buffer is resized
+
+        self.rows += n_valid
+        del self.buffer[:n_valid * itemsize]
+        return n_valid > 0
+
+    def _read_one_row(self) -> bool:
+        buf = self.buffer
+        if len(buf) < 2:
+            return False
+        n_fields = struct.unpack_from(">h", buf, 0)[0]
+        if n_fields == -1:
+            self.finished = True
+            del buf[:2]
+            return False
+
+        offset, values, nulls = 2, [], []
+        for i, t in enumerate(self.types):
+            if len(buf) < offset + 4:
+                return False
+            length = struct.unpack_from(">i", buf, offset)[0]
+            offset += 4
+            if length == -1:
+                values.append(0)
+                nulls.append(True)
+                continue
+            if len(buf) < offset + length:
+                return False
+            values.append(np.frombuffer(buf, dtype=_WIRE_TYPES[t][0], count=1, offset=offset)[0])
+            nulls.append(False)
+            offset += length
+
+        for i, t in enumerate(self.types):
+            self._values[i].append(np.array([values[i]], dtype=_WIRE_TYPES[t][1]))
+            self._nulls[i].append(np.array([nulls[i]]))
+        self.rows += 1
+        del buf[:offset]
+        return True
+
+    def take(self, max_rows=None) -> pd.DataFrame:
+        """Decoded rows so far (up to max_rows) as a DataFrame, removed from the decoder."""
+        data = {}
+        n_take = self.rows if max_rows is None else min(max_rows, self.rows)
+        for i, (col, t) in enumerate(zip(self.columns, self.types)):
+            values = np.concatenate(self._values[i]) if self._values[i] else np.empty(0, _WIRE_TYPES[t][1])
+            nulls  = np.concatenate([
+                np.zeros(len(v), bool) if m is None else m for v, m in zip(self._values[i], self._nulls[i])
+            ]) if self._values[i] else np.empty(0, bool)
+
+            self._values[i], self._nulls[i] = [values[n_take:]], [nulls[n_take:]]
+            data[col] = _to_column(values[:n_take], nulls[:n_take], t)
+
+        self.rows -= n_take
+        return pd.DataFrame(data)
+
+
+def _to_column(values: np.ndarray, nulls: np.ndarray, pg_type: str):
+    """Converts decoded wire values to the dtype pd.read_sql would produce (NULLs as NaN/NaT/None)."""
+    if pg_type == "timestamptz":
+        ts = pd.to_datetime(values + _PG_EPOCH_US, unit="us", utc=True).as_unit("ns")
+        return ts.where(~nulls) if nulls.any() else ts
+    if not nulls.any():
+        return values
+    if pg_type == "bool":
+        out = values.astype(object)
+        out[nulls] = None
+        return out
+    out = values.astype(np.float64)
+    out[nulls] = np.nan
+    return out
+
+
+def day_range(day: date) -> tuple[date, date]:
+    """[day, next day) bounds. Compared with a timestamptz they mean midnight in the session TimeZone, like DATE(timestamp)."""
+    return day, day + timedelta(days=1)
+
+
+def session_timezone(conn) -> str:
+    """The session TimeZone, the one day_range and DATE(timestamp) split days in."""
+    with conn.cursor() as cur:
+        cur.execute("SHOW TimeZone")
+        return cur.fetchone()[0]
+
+
+def earliest_unprocessed_date(conn) -> date | None:
+    """Day of the oldest unprocessed row (MIN over the partial index, not a scan), None if everything is processed."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT MIN(timestamp)::date FROM incoming_data WHERE processed = FALSE")
+        return cur.fetchone()[0]
+
+
+def select_incoming_sql(cur, table: str, columns: list[str], where: str, params, order_by, limit=None) -> str:
+    """The SELECT read_incoming runs (with params bound), also used to EXPLAIN it."""
+    unknown = [c for c in columns if c not in INCOMING_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown incoming_data columns: {unknown}")
+
+    query = sql.SQL("SELECT {cols} FROM {table}").format(
+        cols=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        table=sql.Identifier(table),
+    ).as_string(cur)
+    if where:
+        query += " WHERE " + where
+    if order_by:
+        query += " ORDER BY " + order_by
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return cur.mogrify(query, params).decode()
+
+
+def _copy_sql(cur, table: str, columns: list[str], where: str, params, order_by, limit=None) -> str:
+    return f"COPY ({select_incoming_sql(cur, table, columns, where, params, order_by, limit)}) TO STDOUT (FORMAT binary)"
+
+
+class _DecoderWriter:
+    """File-like sink for copy_expert that decodes as data arrives."""
+
+    def __init__(self, decoder, on_rows=None, stop=None):
+        self.decoder, self.on_rows, self.stop = decoder, on_rows, stop
+
+    def write(self, data):
+        if self.stop is not None and self.stop.is_set():
+            raise InterruptedError("COPY reader closed")
+        self.decoder.feed(data)
+        if self.on_rows is not None:
+            self.on_rows(self.decoder)
+        return len(data)
+
+    def close(self):
+        self.decoder.flush()
+        if self.on_rows is not None:
+            self.on_rows(self.decoder)
+
+
+def read_incoming(conn, where="", params=(), columns=MODEL_COLUMNS, order_by="timestamp",
+                  table="incoming_data", limit=None) -> pd.DataFrame:
+    """
+    Projected columns of incoming_data as a typed DataFrame.
+    `where` is an SQL condition with %s placeholders, like the handlers already write them.
+    `limit` caps the rows (the first ones in order_by order).
+    """
+    decoder = _BinaryCopyDecoder(columns)
+    writer  = _DecoderWriter(decoder)
+    with conn.cursor() as cur:
+        cur.copy_expert(_copy_sql(cur, table, columns, where, params, order_by, limit), writer)
+    writer.close()
+    return decoder.take()
+
+
+def iter_incoming(conn, where="", params=(), columns=MODEL_COLUMNS, order_by="timestamp",
+                  chunk_rows=CHUNK_ROWS, table="incoming_data", limit=None):
+    """
+    Same as read_incoming, yielded as DataFrames of at most chunk_rows rows.
+    COPY runs in a background thread that blocks while two chunks are waiting,
+    so memory stays bounded by the chunk size however much history is read.
+    """
+    chunks = queue.Queue(maxsize=2)
+    stop   = threading.Event()
+    done   = object()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def on_rows(decoder):
+        while decoder.rows >= chunk_rows:
+            put(decoder.take(chunk_rows))
+
+    def produce():
+        try:
+            decoder = _BinaryCopyDecoder(columns)
+            writer  = _DecoderWriter(decoder, on_rows, stop)
+            with conn.cursor() as cur:
+                cur.copy_expert(_copy_sql(cur, table, columns, where, params, order_by, limit), writer)
+            writer.close()
+            if decoder.rows:
+                put(decoder.take())
+            put(done)
+        except Exception as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    item = None
+    try:
+        while True:
+            item = chunks.get()
+            if item is done:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+        if not isinstance(item, Exception) and item is not done:
+            conn.rollback() # the COPY was interrupted
+
+
+def _to_wire(values: pd.Series, pg_type: str, tz: str) -> np.ndarray:
+    """Column values as the numbers binary COPY expects (timestamps as microseconds since 2000-01-01)."""
+    if pg_type == "timestamptz":
+        ts = pd.DatetimeIndex(values)
+        ts = ts.tz_localize(tz) if ts.tz is None else ts # naive timestamps mean session time, like text input
+        return ts.as_unit("us").asi8 - _PG_EPOCH_US
+    return values.to_numpy()
+
+
+def encode_binary_rows(df: pd.DataFrame, columns: list[str], tz="UTC", column_types=INCOMING_COLUMNS) -> bytes:
+    """
+    Rows of df as binary COPY tuples (no header/trailer). NULL-free rows are packed in one
+    structured array, rows with missing values are packed one by one with NULL fields.
+    column_types maps the columns to wire types (incoming_data's by default).
+    """
+    types = [column_types[c] for c in columns]
+    has_null = df[columns].isna().any(axis=1).to_numpy()
+
+    fixed = df[~has_null]
+    arr = np.empty(len(fixed), dtype=_row_dtype(types))
+    arr["n"] = len(columns)
+    for i, (col, t) in enumerate(zip(columns, types)):
+        arr[f"l{i}"] = np.dtype(_WIRE_TYPES[t][0]).itemsize
+        arr[f"v{i}"] = _to_wire(fixed[col], t, tz)
+    out = [arr.tobytes()]
+
+    for _, row in df[has_null].iterrows():
+        parts = [struct.pack(">h", len(columns))]
+        for col, t in zip(columns, types):
+            if pd.isna(row[col]):
+                parts.append(struct.pack(">i", -1))
+                continue
+            value = _to_wire(pd.Series([row[col]]), t, tz)[0]
+            wire  = np.array([value], dtype=_WIRE_TYPES[t][0]).tobytes()
+            parts.append(struct.pack(">i", len(wire)) + wire)
+        out.append(b"".join(parts))
+
+    return b"".join(out)
+
+
+class _EncodedReader:
+    """File-like source for copy_expert that encodes DataFrames lazily, one at a time."""
+
+    def __init__(self, frames, columns, tz, column_types=INCOMING_COLUMNS):
+        self.frames, self.columns, self.tz = iter(frames), columns, tz
+        self.column_types = column_types
+        self.buffer = bytearray(_SIGNATURE + struct.pack(">ii", 0, 0))
+        self.rows = 0
+        self.exhausted = False
+
+    def read(self, size=-1):
+        while not self.exhausted and (size < 0 or len(self.buffer) < size):
+            frame = next(self.frames, None)
+            if frame is None:
+                self.buffer += struct.pack(">h", -1)
+                self.exhausted = True
+                break
+            self.buffer += encode_binary_rows(frame, self.columns, self.tz, self.column_types)
+            self.rows += len(frame)
+
+        size = len(self.buffer) if size < 0 else size
+        out = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return out
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def copy_incoming(conn, frames, columns: list[str], table="incoming_data", column_types=INCOMING_COLUMNS) -> int:
+    """
+    Streams DataFrames (already type-checked, see scripts/load_csv_to_db.py) into
+    `COPY table (columns) FROM STDIN (FORMAT binary)`. Only one frame is encoded at a time.
+    Returns the number of rows sent. The caller commits.
+    Another table's columns need their wire types in column_types (see INCOMING_COLUMNS).
+    """
+    with conn.cursor() as cur:
+        cur.execute("SHOW TimeZone")
+        reader = _EncodedReader(frames, columns, cur.fetchone()[0], column_types)
+        query = sql.SQL("COPY {table} ({cols}) FROM STDIN (FORMAT binary)").format(
+            table=sql.Identifier(table),
+            cols=sql.SQL(", ").join(sql.Identifier(c) for c in columns),
+        )
+        cur.copy_expert(query, reader, size=1 << 20)
+    return reader.rows
@@ -1,11 +1,115 @@
 import os
+import time
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import pool
 
-def get_connection():
-    return psycopg2.connect(
+"""
+Module-level connection pool. It survives warm Lambda invocations, so only a cold start pays for TCP + auth.
+Connections idle for longer than PGPOOL_PROBE_AFTER_S are checked with a `SELECT 1` before reuse
+(a frozen container can come back with dead sockets) and replaced if the probe fails.
+"""
+
+POOL_MIN             = int(os.environ.get("PGPOOL_MIN", 1))
+POOL_MAX             = int(os.environ.get("PGPOOL_MAX", 4))
+PROBE_AFTER_S        = float(os.environ.get("PGPOOL_PROBE_AFTER_S", 30))
+STATEMENT_TIMEOUT_MS = int(os.environ.get("PG_STATEMENT_TIMEOUT_MS", 0)) # 0 = no timeout
+CONNECT_TIMEOUT_S    = int(os.environ.get("PG_CONNECT_TIMEOUT_S", 5))
+
+_pool      = None
+_pool_pid  = None
+_last_used = {} # id(conn) -> time.monotonic() when it was last handed back
+
+
+def _connect_kwargs() -> dict:
+    kwargs = dict(
         host=os.environ.get("PGHOST", "localhost"),
         database=os.environ.get("PGDATABASE", "users"),
         user=os.environ.get("PGUSER", "postgres"),
         password=os.environ.get("PGPASSWORD", "example"),
-        port=os.environ.get("PGPORT", 5432)
-    )
\ No newline at end of file
+        port=os.environ.get("PGPORT", 5432),
+        connect_timeout=CONNECT_TIMEOUT_S,
+    )
+    if STATEMENT_TIMEOUT_MS:
+        kwargs["options"] = f"-c statement_timeout={STATEMENT_TIMEOUT_MS}"
+    return kwargs
+
+
+def connect():
+    """A new dedicated connection, outside the pool (the caller closes it)."""
+    return psycopg2.connect(**_connect_kwargs())
+
+
+def get_pool() -> pool.ThreadedConnectionPool:
+    """
+    The process-wide pool, created on first use.
+    A forked worker gets its own pool instead of sharing the parent's sockets.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = pool.ThreadedConnectionPool(POOL_MIN, POOL_MAX, **_connect_kwargs())
+        _pool_pid = os.getpid()
+        _last_used.clear()
+    return _pool
+
+
+def close_pool():
+    """Closes every pooled connection (the next get_connection() builds a new pool)."""
+    global _pool
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.closeall()
+    _pool = None
+    _last_used.clear()
+
+
+def _is_alive(conn) -> bool:
+    """Cheap liveness check, the SELECT 1 round trip only runs for connections idle past PROBE_AFTER_S."""
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0.0) < PROBE_AFTER_S:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+def _discard(conn_pool, conn):
+    _last_used.pop(id(conn), None)
+    conn_pool.putconn(conn, close=True)
+
+
+@contextmanager
+def get_connection():
+    """
+    Borrows a healthy pooled connection: `with get_connection() as conn:`.
+    Commits on success and rolls back on error (same as psycopg2's own `with conn:`),
+    then hands the connection back to the pool instead of closing it.
+    """
+    conn_pool = get_pool()
+    conn = conn_pool.getconn()
+    for _ in range(POOL_MAX):
+        if _is_alive(conn):
+            break
+        _discard(conn_pool, conn)
+        conn = conn_pool.getconn()
+
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+        raise
+    finally:
+        if conn.closed:
+            _discard(conn_pool, conn)
+        else:
+            _last_used[id(conn)] = time.monotonic()
+            conn_pool.putconn(conn)
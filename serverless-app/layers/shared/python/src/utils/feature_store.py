@@ -0,0 +1,215 @@
+import os
+import json
+import mmap
+import hashlib
+from datetime import timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET, INDEX, preprocess, max_lag
+from src.utils.data_access import read_incoming, day_range, session_timezone
+from src.utils.lag_state import load_tail, next_tail
+
+"""
+Preprocessed days on disk, so the same days are not preprocessed again by every run.
+A partition is one day's compact preprocess output (src/model/preprocess.py, after the lag tail of the day
+before, src/utils/lag_state.py) in FEATURE_STORE_DIR/<version>/<YYYY-MM-DD>/: part.bin holds the UTC timestamps
+(int64 ns), the feature matrix (rows x features, float32, row-major) and the target back to back, meta.json (written
+last) their row count and target dtype. Like a .npy without the header: np.load parses one per array, which costs
+more than the read itself when a history of thousands of days is loaded.
+- the version is PREPROCESS_VERSION + a hash of the model's feature list: a model with other features
+  (or a change of preprocess, bump PREPROCESS_VERSION) gets its own partitions
+- meta.json holds the versions (incoming_day_versions, kept by triggers on incoming_data, see db/init.sql) of
+  the day and of the day before, whose rows its lag tail comes from. A partition whose versions no longer match
+  is stale and rebuilt, checking costs one row per day instead of hashing the rows. Marking rows processed
+  does not change them. The versions are transaction ids of one database, use one directory per database
+- reads memory-map part.bin and take the arrays as views of it, no preprocess and no raw rows
+The daily handler and the backfill compute a day's insights on its stored_frame and write the partitions of
+the days they process, the historical recompute reads them and only preprocesses the missing/stale days.
+Days that are not over (the GET fallback) are not stored.
+Every stored day is repaired on its own (outlier IQR bounds and neighbors), while the historical recompute
+without a store repairs the whole history at once: with the store on, a value whose repair depends on those
+bounds can differ from the result without it. scripts/check_feature_store.py checks the store against the whole
+history preprocessed with per-day repair (preprocess(repair_tz=...)) and reports how far that is from the result without a store.
+FEATURE_STORE_DIR="" turns the store off. On AWS Lambda /tmp is per container, point it to an EFS mount
+to share the partitions between functions.
+"""
+
+FEATURE_STORE_DIR  = os.environ.get("FEATURE_STORE_DIR", "")
+PREPROCESS_VERSION = 2 # bump when preprocess output changes for the same rows
+
+
+#
+def store_version(feature_names) -> str:
+    return _store_version(tuple(feature_names))
+
+
+#
+@lru_cache(maxsize=8)
+def _store_version(feature_names: tuple) -> str:
+    digest = hashlib.sha1("\n".join(feature_names).encode()).hexdigest()[:12]
+    return f"v{PREPROCESS_VERSION}-{digest}"
+
+
+#
+def partition_dir(day, feature_names, root=None) -> str:
+    return os.path.join(root or FEATURE_STORE_DIR, store_version(feature_names), day.isoformat())
+
+
+#
+def day_versions(conn, start=None, end=None) -> dict:
+    """{day: version} of every day of incoming_data from start to end (inclusive, both optional)."""
+    where, params = [], []
+    if start is not None:
+        where.append("day >= %s")
+        params.append(start)
+    if end is not None:
+        where.append("day <= %s")
+        params.append(end)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT day, version FROM incoming_day_versions
+            {"WHERE " + " AND ".join(where) if where else ""}
+            ORDER BY day
+        """, params)
+        return dict(cur.fetchall())
+
+
+#
+def source_key(versions: dict, day) -> dict:
+    """What a partition of day is built from: its own rows and the day before (the lag tail)."""
+    return {"source": versions.get(day), "history": versions.get(day - timedelta(days=1))}
+
+
+#
+def _write(path: str, *chunks):
+    """Writes path through a temporary file, readers never see a partly written file."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp, path)
+
+
+#
+def _arrays(proc_df: pd.DataFrame, feature_names) -> tuple:
+    """(X, y, index ns) of a preprocessed frame, the arrays of a partition."""
+    return proc_df[list(feature_names)].to_numpy(dtype=np.float32), proc_df[TARGET].to_numpy(), proc_df.index.asi8
+
+
+#
+def write_day(day, proc_df: pd.DataFrame, feature_names, key: dict, root=None):
+    """Stores one day's preprocessed frame (feature columns + target) under key (source_key)."""
+    if not (root or FEATURE_STORE_DIR):
+        return
+    path = partition_dir(day, feature_names, root)
+    os.makedirs(path, exist_ok=True)
+    X, y, index = _arrays(proc_df, feature_names)
+    _write(os.path.join(path, "part.bin"), index.tobytes(), np.ascontiguousarray(X).tobytes(), y.tobytes())
+    meta = {**key, "rows": len(proc_df), "features": list(feature_names), "target_dtype": y.dtype.str}
+    _write(os.path.join(path, "meta.json"), json.dumps(meta).encode())
+
+
+#
+def read_day(day, feature_names, key: dict, root=None) -> tuple | None:
+    """(X, y, index ns) memory-mapped from the partition of day, None when it is missing or stale."""
+    if not (root or FEATURE_STORE_DIR):
+        return None
+    path = partition_dir(day, feature_names, root)
+    try:
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta["source"] != key["source"] or meta["history"] != key["history"]:
+            return None
+        n_rows, n_feat, y_dtype = meta["rows"], len(feature_names), np.dtype(meta["target_dtype"])
+        x_offset, y_offset = n_rows * 8, n_rows * 8 + n_rows * n_feat * 4
+        with open(os.path.join(path, "part.bin"), "rb") as f:
+            if os.fstat(f.fileno()).st_size != y_offset + n_rows * y_dtype.itemsize: # overwritten by a concurrent writer
+                return None
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if n_rows else b""
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return (
+        np.frombuffer(buf, np.float32, n_rows * n_feat, x_offset).reshape(n_rows, n_feat),
+        np.frombuffer(buf, y_dtype, n_rows, y_offset),
+        np.frombuffer(buf, np.int64, n_rows, 0),
+    )
+
+
+#
+def _frame(parts: list[tuple], feature_names) -> pd.DataFrame:
+    X = np.concatenate([p[0] for p in parts]) if parts else np.empty((0, len(feature_names)), dtype=np.float32)
+    out = pd.DataFrame(X, columns=list(feature_names), copy=False)
+    out[TARGET] = np.concatenate([p[1] for p in parts]) if parts else np.empty(0, dtype=np.int8)
+    out.index = pd.DatetimeIndex(pd.to_datetime(np.concatenate([p[2] for p in parts]) if parts else [], utc=True), name=INDEX)
+    return out
+
+
+#
+def stored_frame(proc_df: pd.DataFrame, feature_names) -> pd.DataFrame:
+    """
+    proc_df as a partition of it reads back: feature columns as float32, the target, the timestamp index.
+    Insights of a day are computed on this frame whether or not the store is on, so a day read from the
+    store gives the same SHAP values and correlations as the run that preprocessed it.
+    """
+    return _frame([_arrays(proc_df, feature_names)], feature_names)
+
+
+#
+def load_day(day, feature_names, key: dict, root=None) -> pd.DataFrame | None:
+    """The stored preprocessed frame of one day (compact dtypes), None when it is missing or stale."""
+    part = read_day(day, feature_names, key, root)
+    return _frame([part], feature_names) if part is not None else None
+
+
+#
+def _runs(days: list) -> list[list]:
+    """Consecutive days grouped into runs, each run is read at once."""
+    runs = []
+    for day in days:
+        if runs and runs[-1][-1] == day - timedelta(days=1):
+            runs[-1].append(day)
+        else:
+            runs.append([day])
+    return runs
+
+
+#
+def _rebuild(conn, days: list, feature_names, versions: dict, tz: str, root=None) -> dict:
+    """{day: (X, y, index)} of the stale days, preprocessed run by run and written to the store."""
+    depth, built = max_lag(feature_names), {}
+    for run in _runs(days):
+        df = read_incoming(conn, "timestamp >= %s AND timestamp < %s", (day_range(run[0])[0], day_range(run[-1])[1]))
+        by_day = dict(list(df.groupby(df[INDEX].dt.tz_convert(tz).dt.date)))
+        history = load_tail(conn, run[0], depth)
+        for day in run:
+            if day in by_day:
+                df_day = by_day[day].reset_index(drop=True)
+                proc_df = preprocess(df_day, model_features=feature_names, compact=True, history=history)
+                history = next_tail(df_day, history, depth)
+            else: # every row of the day was deleted
+                proc_df = _frame([], feature_names)
+            write_day(day, proc_df, feature_names, source_key(versions, day), root)
+            built[day] = _arrays(proc_df, feature_names)
+    return built
+
+
+#
+def load_features(conn, feature_names, root=None) -> tuple[pd.DataFrame, dict]:
+    """
+    The preprocessed frame of the whole history (compact dtypes, like preprocess(compact=True)), from the stored
+    partitions. Missing and stale days are preprocessed and stored. Also returns {"stored": n, "rebuilt": n} days.
+    """
+    versions = day_versions(conn)
+    tz = session_timezone(conn)
+
+    parts, stale = {}, []
+    for day in versions:
+        part = read_day(day, feature_names, source_key(versions, day), root)
+        if part is None:
+            stale.append(day)
+        else:
+            parts[day] = part
+    stored = len(parts)
+    parts.update(_rebuild(conn, stale, feature_names, versions, tz, root))
+    return _frame([parts[day] for day in sorted(parts)], feature_names), {"stored": stored, "rebuilt": len(stale)}
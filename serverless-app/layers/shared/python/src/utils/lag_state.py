@@ -0,0 +1,113 @@
+from datetime import timedelta
+import pandas as pd
+from psycopg2.extras import Json, execute_values
+from src.model.preprocess import BASE_FEATURES, TARGET, INDEX, repair_outliers, repair_outliers_by_day
+from src.utils.data_access import read_incoming, session_timezone, MODEL_COLUMNS
+
+"""
+Lag state carried from one processed day to the next.
+The lag features look up to max_lag(feature names) rows back (44 for air_quality_index_lag_44), so a day
+preprocessed on its own loses its first max_lag rows to dropna. When a day is processed, the last max_lag
+repaired base rows seen so far (its lag tail) are saved to lag_tails, and the next day passes them to
+preprocess(history=...): every row of the day gets its lags while only day + max_lag rows are read.
+A tail also keeps the incoming_day_versions version of its day: once that day's rows change (the version moves
+past it), the tail is stale and not used.
+When the previous day has no (current) tail (first day, skipped day, a deeper model, changed rows), it is rebuilt from incoming_data:
+the last max_lag rows before the day (a backward scan of the timestamp index, incoming_data_ts_idx, that stops
+after max_lag rows) tell which days it spans, those days are read whole and repaired day by day, like
+processed days, so the tail is the one a stored tail would be. Still a bounded read (the days those rows fall on).
+"""
+
+LAG_COLUMNS = BASE_FEATURES + [TARGET]
+
+
+#
+def next_tail(df: pd.DataFrame, history: pd.DataFrame | None, max_lag: int) -> pd.DataFrame:
+    """
+    The lag tail after processing df (raw rows of one day, with a timestamp column): the last max_lag
+    rows of history + df's repaired base rows, repaired the same way preprocess repairs them.
+    """
+    rows = repair_outliers(df.set_index(pd.to_datetime(df[INDEX]))[LAG_COLUMNS])
+    if history is not None and len(history):
+        rows = pd.concat([history[LAG_COLUMNS], rows])
+    return rows.tail(max_lag)
+
+
+#
+def _to_json(tail: pd.DataFrame) -> dict:
+    """Column lists, timestamps as ISO strings and NaN as null (JSONB has no NaN)."""
+    out = {INDEX: [ts.isoformat() for ts in tail.index]}
+    for col in tail.columns:
+        values = tail[col]
+        out[col] = values.astype(object).where(values.notna(), None).tolist()
+    return out
+
+
+#
+def _from_json(rows: dict) -> pd.DataFrame:
+    index = pd.DatetimeIndex(pd.to_datetime(rows[INDEX], utc=True), name=INDEX)
+    return pd.DataFrame({col: rows[col] for col in LAG_COLUMNS}, index=index)
+
+
+#
+def stored_tail(conn, target_date, max_lag: int) -> pd.DataFrame | None:
+    """
+    The stored tail of the day before target_date (one lag_tails row), None when it is missing, too short, or
+    older than the rows of that day (their version is newer than the one it was saved with).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT t.max_lag, t.rows FROM lag_tails t
+            LEFT JOIN incoming_day_versions v ON v.day = t.insight_date
+            WHERE t.insight_date = %s AND t.source_version >= COALESCE(v.version, 0);
+        """, (target_date - timedelta(days=1),))
+        stored = cur.fetchone()
+    if stored is None or stored[0] < max_lag:
+        return None
+    return _from_json(stored[1]).tail(max_lag)
+
+
+#
+def load_tail(conn, target_date, max_lag: int) -> pd.DataFrame | None:
+    """
+    History to preprocess target_date with: the stored tail of the day before, or else the max_lag
+    rows before target_date from incoming_data, repaired. None when there is nothing before it.
+    """
+    if not max_lag:
+        return None
+    stored = stored_tail(conn, target_date, max_lag)
+    if stored is not None:
+        return stored
+    return tail_before(conn, target_date, max_lag)
+
+
+#
+def tail_before(conn, day, max_lag: int) -> pd.DataFrame | None:
+    """
+    The lag tail before day from incoming_data: the days of the last max_lag rows before it, read whole and
+    repaired day by day (in the session TimeZone), like the chained stored tails. None when there are no rows before day.
+    """
+    if not max_lag:
+        return None
+    last = read_incoming(conn, "timestamp < %s", [day], columns=[INDEX], order_by="timestamp DESC", limit=max_lag)
+    if last.empty:
+        return None
+    tz = session_timezone(conn)
+    first_day = pd.Timestamp(last[INDEX].min()).tz_convert(tz).date()
+    df = read_incoming(conn, "timestamp >= %s AND timestamp < %s", (first_day, day), columns=MODEL_COLUMNS)
+    return repair_outliers_by_day(df.set_index(pd.to_datetime(df[INDEX]))[LAG_COLUMNS], tz).tail(max_lag)
+
+
+#
+def save_tails(cur, tails: list[tuple], max_lag: int):
+    """Upserts (insight_date, tail) rows, from next_tail, with the current version of their day."""
+    if tails:
+        execute_values(cur, """
+            INSERT INTO lag_tails (insight_date, max_lag, rows, source_version)
+            SELECT t.insight_date, t.max_lag, t.rows, COALESCE(v.version, 0)
+            FROM (VALUES %s) AS t (insight_date, max_lag, rows)
+            LEFT JOIN incoming_day_versions v ON v.day = t.insight_date
+            ON CONFLICT (insight_date) DO UPDATE
+                SET max_lag = EXCLUDED.max_lag, rows = EXCLUDED.rows, source_version = EXCLUDED.source_version,
+                    created_at = CURRENT_TIMESTAMP
+        """, [(d, max_lag, Json(_to_json(tail))) for d, tail in tails], template="(%s::date, %s::int, %s::jsonb)")
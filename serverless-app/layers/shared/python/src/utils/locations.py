@@ -0,0 +1,258 @@
+import os
+import pandas as pd
+from psycopg2.extras import Json, execute_values
+from src.model.preprocess import TARGET
+from src.model.model_runner import get_model
+from src.utils.stats import get_abs_shap_matrix, top_shap_features, correlation_from_time_of_day_stats
+from src.utils.sampling import SHAP_BOOTSTRAP, bootstrap_sums
+from src.utils.shap_pool import run_in_pool
+
+"""
+Per-location insights (location_id) from the same preprocessed frame as the all-locations ones.
+Rows are split into one contiguous chunk per worker, not per location, so the job scales with the
+number of cores however many locations there are. Every chunk returns per-location sums that simply
+add up: |SHAP| sums + row counts (like daily_aggregates) and time-of-day sums + counts (like
+daily_time_of_day_stats), so merging chunks, days or locations is exact.
+The all-locations SHAP aggregate is the merge of the per-location ones, SHAP runs once per row.
+
+Rows can carry sampling weights (src/utils/sampling.py): sums and counts are then weighted, and each chunk
+can add Poisson bootstrap replicates of its |SHAP| sums, which merge the same way.
+
+Workers are spawned processes (src/utils/shap_pool.run_in_pool) with one XGBoost thread each. Small inputs,
+and platforms without process pools, run the chunks in-process instead, XGBoost then uses its own threads.
+"""
+
+LOCATION_COLUMN     = "location_id"
+WORKERS             = int(os.environ.get("LOCATION_WORKERS", 0)) # 0 = one per core
+MIN_ROWS_PER_WORKER = int(os.environ.get("LOCATION_MIN_ROWS_PER_WORKER", 20_000)) # a process costs ~1-2 s to start
+
+
+#
+def _init_worker(model_path: str):
+    get_model(model_path).model.get_booster().set_param({"nthread": 1})
+
+
+#
+def chunk_aggregates(proc_df: pd.DataFrame, model_path=None, weights=None, n_boot=0, seed=0) -> dict:
+    """
+    Per-location (weighted) sums of a block of preprocessed rows:
+    row_count (Series), shap_abs_sum (locations x features), tod_sums/tod_counts ((location, time_of_day) x columns),
+    and with n_boot the bootstrap replicates boot_sums (n_boot x features) / boot_weights (n_boot,) of all its rows.
+    """
+    model    = get_model(model_path).model
+    X        = proc_df.drop(columns=[TARGET])
+    location = proc_df[LOCATION_COLUMN].astype("int64").to_numpy()
+    matrix   = get_abs_shap_matrix(X, model)
+    numeric  = proc_df.select_dtypes("number").drop(columns=[LOCATION_COLUMN]) # constant within a location
+    keys     = [location, proc_df.index.time]
+
+    if weights is None:
+        abs_shap  = pd.DataFrame(matrix, columns=X.columns, index=proc_df.index)
+        row_count = abs_shap.groupby(location).size()
+        tod_sums, tod_counts = numeric.groupby(keys).sum(), numeric.groupby(keys).count()
+    else:
+        abs_shap  = pd.DataFrame(matrix * weights[:, None], columns=X.columns, index=proc_df.index)
+        row_count = pd.Series(weights, index=proc_df.index).groupby(location).sum()
+        tod_sums  = numeric.mul(weights, axis=0).groupby(keys).sum()
+        tod_counts = numeric.notna().mul(weights, axis=0).groupby(keys).sum()
+
+    result = {
+        "row_count": row_count,
+        "shap_abs_sum": abs_shap.groupby(location).sum().astype("float64"),
+        "tod_sums": tod_sums,
+        "tod_counts": tod_counts,
+    }
+    if n_boot:
+        result["boot_sums"], result["boot_weights"] = bootstrap_sums(matrix, weights, n_boot, seed)
+    return result
+
+
+#
+def merge_chunks(chunks: list[dict]) -> dict:
+    """Adds up chunk_aggregates results (the same location/time of day can appear in several chunks)."""
+    merged = {
+        key: pd.concat([c[key] for c in chunks]).groupby(level=list(range(chunks[0][key].index.nlevels))).sum()
+        for key in ("row_count", "shap_abs_sum", "tod_sums", "tod_counts")
+    }
+    if "boot_sums" in chunks[0]:
+        merged["boot_sums"]    = sum(c["boot_sums"] for c in chunks)
+        merged["boot_weights"] = sum(c["boot_weights"] for c in chunks)
+    return merged
+
+
+#
+def _workers(n_rows: int, workers=None) -> int:
+    workers = workers or WORKERS or os.cpu_count() or 1
+    return max(1, min(workers, n_rows // MIN_ROWS_PER_WORKER))
+
+
+#
+def location_aggregates(proc_df: pd.DataFrame, model_path=None, workers=None, weights=None, bootstrap=None) -> dict:
+    """
+    Per-location aggregates of a preprocessed frame: {location_id: {"row_count", "shap_abs_sum",
+    "tod_sums", "tod_counts"}}. row_count/shap_abs_sum are the daily_aggregates format, so
+    src.utils.aggregates.merge_aggregates(result.values()) is the all-locations aggregate.
+    weights are per-row sampling weights (see src.utils.sampling.stratified_sample), row counts are then estimates.
+    A dict passed as bootstrap receives {"n_boot", "boot_sums", "boot_weights"} replicates of all rows
+    (n_boot from the dict, default SHAP_BOOTSTRAP) for src.utils.sampling.shap_bounds.
+    """
+    if proc_df.empty:
+        return {}
+    model_path = get_model(model_path).path
+    n_workers  = _workers(len(proc_df), workers)
+    bounds     = [len(proc_df) * i // n_workers for i in range(n_workers + 1)]
+    chunks     = [proc_df.iloc[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    n_chunks   = len(chunks)
+    weight_chunks = [None if weights is None else weights[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+    n_boot     = bootstrap.setdefault("n_boot", SHAP_BOOTSTRAP) if bootstrap is not None else 0
+    args = (chunks, [model_path] * n_chunks, weight_chunks, [n_boot] * n_chunks, range(n_chunks)) # chunk index = seed
+
+    parts = run_in_pool(chunk_aggregates, list(zip(*args)), n_workers, initializer=_init_worker, initargs=(model_path,))
+    if parts is None:
+        parts = [chunk_aggregates(*chunk_args) for chunk_args in zip(*args)]
+
+    merged = merge_chunks(parts)
+    if n_boot:
+        bootstrap["boot_sums"], bootstrap["boot_weights"] = merged["boot_sums"], merged["boot_weights"]
+    return {
+        int(loc): {
+            "row_count": int(merged["row_count"].loc[loc]) if weights is None else float(merged["row_count"].loc[loc]),
+            "shap_abs_sum": {col: float(v) for col, v in merged["shap_abs_sum"].loc[loc].items()},
+            "tod_sums": merged["tod_sums"].loc[loc],
+            "tod_counts": merged["tod_counts"].loc[loc],
+        }
+        for loc in merged["row_count"].index
+    }
+
+
+#
+def _finite_correlations(sums: pd.DataFrame, counts: pd.DataFrame, n_feat: int) -> dict:
+    """
+    Top N correlations of a location, skipping NaN ones: a location with few rows on a day can have
+    constant columns (or a constant target), and NaN is not valid in jsonb.
+    """
+    if sums.empty:
+        return {}
+    correlations = correlation_from_time_of_day_stats(sums, counts, n_feat=len(sums.columns))
+    return dict([(k, v) for k, v in correlations.items() if v == v][:n_feat])
+
+
+#
+def location_insights(per_location: dict, n_feat=5) -> dict:
+    """{location_id: {"top_stress_features_shap", "correlations_pearson"}} from location_aggregates output."""
+    return {
+        loc: {
+            "top_stress_features_shap": top_shap_features(agg["shap_abs_sum"], agg["row_count"], n_feat=n_feat),
+            "correlations_pearson": _finite_correlations(agg["tod_sums"], agg["tod_counts"], n_feat),
+        }
+        for loc, agg in per_location.items()
+    }
+
+
+#
+def location_historical_rows(proc_df: pd.DataFrame, per_location: dict, n_feat=5) -> list[tuple]:
+    """save_location_historical rows of a full recompute, from its preprocessed frame and location_aggregates output."""
+    insights = location_insights(per_location, n_feat)
+    days     = proc_df.index.normalize().to_series().groupby(proc_df[LOCATION_COLUMN].to_numpy()).agg(["min", "max", "nunique"])
+    return [
+        (
+            loc, f"{days.loc[loc, 'min'].date()} - {days.loc[loc, 'max'].date()}", int(days.loc[loc, "nunique"]),
+            insights[loc]["top_stress_features_shap"], insights[loc]["correlations_pearson"]
+        )
+        for loc in sorted(per_location)
+    ]
+
+
+#
+def location_day_rows(insight_date, per_location: dict, n_feat=5) -> tuple[list[tuple], list[tuple]]:
+    """location_daily_insights and location_time_of_day_stats rows of one day, as plain values."""
+    insights = location_insights(per_location, n_feat)
+    day_rows, tod_rows = [], []
+    for loc, agg in per_location.items():
+        day_rows.append((
+            insight_date, loc, agg["row_count"], agg["shap_abs_sum"],
+            insights[loc]["top_stress_features_shap"], insights[loc]["correlations_pearson"]
+        ))
+        sums, counts = agg["tod_sums"].to_dict("index"), agg["tod_counts"].to_dict("index")
+        tod_rows += [(insight_date, loc, tod, sums[tod], counts[tod]) for tod in sums]
+    return day_rows, tod_rows
+
+
+#
+def save_location_days(cur, insight_dates: list, day_rows: list[tuple], tod_rows: list[tuple]):
+    """Replaces the per-location rows of insight_dates (from location_day_rows), in bulk."""
+    dates = list(insight_dates)
+    cur.execute("DELETE FROM location_daily_insights WHERE insight_date = ANY(%s);", (dates,))
+    cur.execute("DELETE FROM location_time_of_day_stats WHERE insight_date = ANY(%s);", (dates,))
+    if day_rows:
+        execute_values(cur, """
+            INSERT INTO location_daily_insights
+                (insight_date, location_id, row_count, shap_abs_sum, top_stress_features_shap, correlations_pearson)
+            VALUES %s
+        """, [(d, loc, n, Json(s), Json(top), Json(corr)) for d, loc, n, s, top, corr in day_rows], page_size=1000)
+    if tod_rows:
+        execute_values(cur, """
+            INSERT INTO location_time_of_day_stats (insight_date, location_id, time_of_day, sums, counts)
+            VALUES %s
+        """, [(d, loc, tod, Json(s), Json(c)) for d, loc, tod, s, c in tod_rows], page_size=1000)
+
+
+#
+def save_location_historical(cur, rows: list[tuple]):
+    """Inserts (location_id, time_range, days_analyzed, top features, correlations) rows."""
+    if rows:
+        execute_values(cur, """
+            INSERT INTO location_historical_insights
+                (location_id, time_range, days_analyzed, top_stress_features_shap, correlations_pearson)
+            VALUES %s
+        """, [(loc, tr, days, Json(top), Json(corr)) for loc, tr, days, top, corr in rows])
+
+
+#
+def location_historical_from_aggregates(conn, end_date, n_feat=5) -> list[tuple]:
+    """
+    Per-location historical insights merged in Postgres from the stored per-location days up to end_date,
+    as save_location_historical rows. incoming_data is not read.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT location_id, MIN(insight_date), MAX(insight_date), COUNT(*), SUM(row_count)
+            FROM location_daily_insights
+            WHERE insight_date <= %s
+            GROUP BY location_id
+        """, (end_date,))
+        days = {loc: (first, last, n_days, n_rows) for loc, first, last, n_days, n_rows in cur.fetchall()}
+        if not days:
+            return []
+
+        cur.execute("""
+            SELECT d.location_id, kv.key, SUM(kv.value::float8)
+            FROM location_daily_insights d
+            CROSS JOIN LATERAL jsonb_each_text(d.shap_abs_sum) kv
+            WHERE d.insight_date <= %s
+            GROUP BY d.location_id, kv.key
+        """, (end_date,))
+        shap_sums = pd.DataFrame(cur.fetchall(), columns=["location_id", "feature", "total"])
+
+        cur.execute("""
+            SELECT s.location_id, s.time_of_day, kv.key,
+                   SUM(kv.value::float8), SUM((s.counts ->> kv.key)::float8)
+            FROM location_time_of_day_stats s
+            CROSS JOIN LATERAL jsonb_each_text(s.sums) kv
+            WHERE s.insight_date <= %s
+            GROUP BY s.location_id, s.time_of_day, kv.key
+        """, (end_date,))
+        tod = pd.DataFrame(cur.fetchall(), columns=["location_id", "time_of_day", "feature", "total", "n"])
+
+    rows = []
+    for loc, (first, last, n_days, n_rows) in sorted(days.items()):
+        loc_shap = shap_sums[shap_sums["location_id"] == loc]
+        loc_tod  = tod[tod["location_id"] == loc]
+        sums     = loc_tod.pivot(index="time_of_day", columns="feature", values="total")
+        counts   = loc_tod.pivot(index="time_of_day", columns="feature", values="n")
+        rows.append((
+            loc, f"{first} to {last}", n_days,
+            top_shap_features(dict(zip(loc_shap["feature"], loc_shap["total"])), n_rows, n_feat=n_feat),
+            _finite_correlations(sums, counts, n_feat),
+        ))
+    return rows
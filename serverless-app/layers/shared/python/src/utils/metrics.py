@@ -0,0 +1,254 @@
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+"""
+Per-invocation instrumentation: timed spans with row counts, emitted as one JSON line per invocation
+in CloudWatch Embedded Metric Format (EMF), so Lambda's log stream turns them into metrics without an agent.
+- span("db.read") times a block; repeated spans with the same name add up (calls, ms, rows)
+- an exception leaving a span is recorded with the name of the innermost span it left
+- with a Lambda context, the line is written shortly before the deadline if the handler is still running,
+  with the spans that were open at that moment, so a timed-out run still says where the time went
+- INSIGHTS_PROFILE=memory adds tracemalloc peaks per span and the top allocation sites,
+  INSIGHTS_PROFILE=cpu adds the top cProfile entries (both: "memory,cpu"); both are off by default
+span() outside of an invocation (library code called from scripts, backfill workers) is a no-op.
+Only the stdlib is imported, the GET handlers import this on cold start.
+"""
+
+NAMESPACE          = os.environ.get("METRICS_NAMESPACE", "MentalInsights")
+ENABLED            = os.environ.get("INSIGHTS_METRICS", "1") != "0"
+PROFILE            = {p.strip() for p in os.environ.get("INSIGHTS_PROFILE", "").split(",") if p.strip()}
+PROFILE_TOP        = int(os.environ.get("INSIGHTS_PROFILE_TOP", 10))
+DEADLINE_MARGIN_MS = int(os.environ.get("METRICS_DEADLINE_MARGIN_MS", 300))
+
+_current = ContextVar("metrics_invocation", default=None)
+_cold    = True
+
+
+class Span:
+    """An open span, set .rows to record how many rows it handled."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.rows = None
+        self.start = time.perf_counter()
+        self.child_peak = 0 # highest tracemalloc peak of the spans nested in this one
+
+
+class Invocation:
+    """Spans, counters and properties of one handler invocation (or one script run)."""
+
+    def __init__(self, name: str, context=None, profile=None):
+        global _cold
+        self.name      = name
+        self.profile   = PROFILE if profile is None else set(profile)
+        self.start     = time.perf_counter()
+        self.spans     = {} # name -> {"calls", "ms", "rows", "peak_kb"}
+        self.counters  = {}
+        self.props     = {"cold_start": _cold}
+        self.open      = [] # stack of open Span objects
+        self.status    = None
+        self.error     = None
+        self.emitted   = False
+        self.lock      = threading.Lock()
+        self.watchdog  = None
+        self.profiler  = None
+        _cold = False
+
+        request_id = getattr(context, "aws_request_id", None)
+        if request_id:
+            self.props["request_id"] = request_id
+
+        if "memory" in self.profile:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        if "cpu" in self.profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+        remaining_ms = getattr(context, "get_remaining_time_in_millis", None)
+        if ENABLED and remaining_ms is not None:
+            self.watchdog = threading.Timer(max(remaining_ms() - DEADLINE_MARGIN_MS, 0) / 1000, self._on_deadline)
+            self.watchdog.daemon = True
+            self.watchdog.start()
+
+    @contextmanager
+    def span(self, name: str, rows=None):
+        span = Span(name)
+        span.rows = rows
+        tracing = "memory" in self.profile
+        if tracing:
+            import tracemalloc
+            parent_peak = tracemalloc.get_traced_memory()[1]
+            if self.open:
+                self.open[-1].child_peak = max(self.open[-1].child_peak, parent_peak)
+            tracemalloc.reset_peak()
+        self.open.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            if self.error is None:
+                self.error = {"span": name, "type": type(e).__name__, "message": str(e)[:300]}
+            raise
+        finally:
+            self.open.pop()
+            stats = self.spans.setdefault(name, {"calls": 0, "ms": 0.0, "rows": None, "peak_kb": None})
+            stats["calls"] += 1
+            stats["ms"] += (time.perf_counter() - span.start) * 1000
+            if span.rows is not None:
+                stats["rows"] = (stats["rows"] or 0) + int(span.rows)
+            if tracing:
+                peak = max(tracemalloc.get_traced_memory()[1], span.child_peak)
+                stats["peak_kb"] = max(stats["peak_kb"] or 0, peak // 1024)
+                if self.open:
+                    self.open[-1].child_peak = max(self.open[-1].child_peak, peak)
+
+    def count(self, name: str, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_property(self, key: str, value):
+        self.props[key] = value
+
+    def record(self) -> dict:
+        """The EMF log record: metrics are top-level keys listed under _aws.CloudWatchMetrics."""
+        metrics = {"duration.ms": ("Milliseconds", round((time.perf_counter() - self.start) * 1000, 3))}
+        spans   = dict(self.spans) # the deadline watchdog reads while the handler may still add spans
+        for name, stats in spans.items():
+            metrics[f"{name}.ms"] = ("Milliseconds", round(stats["ms"], 3))
+            if stats["rows"] is not None:
+                metrics[f"{name}.rows"] = ("Count", stats["rows"])
+            if stats["peak_kb"] is not None:
+                metrics[f"{name}.peak_kb"] = ("Kilobytes", stats["peak_kb"])
+        for name, value in dict(self.counters).items():
+            metrics[name] = ("Count", value)
+        failed = self.error is not None or (isinstance(self.status, int) and self.status >= 500)
+        metrics["error"] = ("Count", int(failed))
+
+        record = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Function"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (unit, _) in metrics.items()],
+                }],
+            },
+            "Function": self.name,
+            **{name: value for name, (_, value) in metrics.items()},
+            **self.props,
+            "status": self.status,
+            "spans": {name: stats["calls"] for name, stats in spans.items()},
+        }
+        if self.error is not None:
+            record["error_detail"] = self.error
+        if self.open:
+            now = time.perf_counter()
+            record["open_spans"] = {s.name: round((now - s.start) * 1000, 3) for s in list(self.open)} # ms so far
+        if "memory" in self.profile:
+            record["memory_top"] = self._memory_top()
+        if self.profiler is not None:
+            record["cpu_top"] = self._cpu_top()
+        return record
+
+    def emit(self, stream=None):
+        """Writes the record once, whichever comes first of the end of the invocation and the deadline."""
+        with self.lock:
+            if self.emitted or not ENABLED:
+                return
+            self.emitted = True
+        print(json.dumps(self.record(), default=str), file=stream or sys.stdout, flush=True)
+
+    def close(self):
+        if self.watchdog is not None:
+            self.watchdog.cancel() # a frozen container must not fire it during the next invocation
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.emit()
+        if "memory" in self.profile:
+            import tracemalloc
+            tracemalloc.stop()
+
+    def _on_deadline(self):
+        self.status = self.status or "deadline"
+        self.emit()
+
+    def _memory_top(self) -> list[str]:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            return []
+        stats = tracemalloc.take_snapshot().statistics("lineno")[:PROFILE_TOP]
+        return [f"{s.traceback[0].filename}:{s.traceback[0].lineno} {s.size // 1024} KiB ({s.count} blocks)" for s in stats]
+
+    def _cpu_top(self) -> list[str]:
+        import pstats
+        stats = pstats.Stats(self.profiler)
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        return [
+            f"{os.path.basename(file)}:{line}({func}) {cumtime * 1000:.1f} ms cumulative, {ncalls} calls"
+            for (file, line, func), (_, ncalls, _, cumtime, _) in entries
+        ]
+
+
+@contextmanager
+def invocation(name: str, context=None, profile=None):
+    """Makes a new Invocation current for the block and emits its line at the end."""
+    inv = Invocation(name, context, profile)
+    token = _current.set(inv)
+    try:
+        yield inv
+    except BaseException as e:
+        if inv.error is None:
+            inv.error = {"span": None, "type": type(e).__name__, "message": str(e)[:300]}
+        raise
+    finally:
+        _current.reset(token)
+        inv.close()
+
+
+def instrumented(name: str):
+    """Decorator for lambda_handler(event, context): one invocation per call, status taken from the response."""
+    def decorate(handler):
+        @wraps(handler)
+        def wrapper(event, context):
+            with invocation(name, context) as inv:
+                response = handler(event, context)
+                if isinstance(response, dict):
+                    inv.status = response.get("statusCode")
+                return response
+        return wrapper
+    return decorate
+
+
+def current() -> Invocation | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, rows=None):
+    """Span of the current invocation, a no-op Span when there is none."""
+    inv = _current.get()
+    if inv is None:
+        yield Span(name)
+        return
+    with inv.span(name, rows) as s:
+        yield s
+
+
+def count(name: str, value=1):
+    inv = _current.get()
+    if inv is not None:
+        inv.count(name, value)
+
+
+def set_property(key: str, value):
+    inv = _current.get()
+    if inv is not None:
+        inv.set_property(key, value)
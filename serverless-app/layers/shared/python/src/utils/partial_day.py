@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from src.model.preprocess import preprocess, max_lag
+from src.model.model_runner import get_model
+from src.utils.data_access import read_incoming, day_range, MODEL_COLUMNS, UNPROCESSED_DAY
+from src.utils.lag_state import load_tail
+from src.utils.response_cache import LRUCache
+from src.utils.metrics import span, count
+from src.utils.stats import get_abs_shap_matrix, get_correlation_matrix, top_shap_from_matrix, SHAP_ENGINE
+
+"""
+On-the-fly insights for a day that has no daily_insights row yet (the GET fallback), memoized per container.
+A day's state is keyed by the (max id, row count) of its unprocessed rows:
+- unchanged since the last call: the stored result is returned, no model, no SHAP
+- new rows only (ids above the stored max id): just those rows are read, the day is preprocessed again
+  (cheap, and outlier repair/lags may change older rows) and SHAP runs only for rows whose features changed
+The day is preprocessed after the lag tail of the day before (src/utils/lag_state.load_tail), like the daily
+process job does it, so its first rows keep their lags.
+- anything else (rows processed or deleted meanwhile): full recompute
+Per-row TreeSHAP (the native engine) only depends on the row, so the result is the same as a full recompute.
+Concurrent calls for the same snapshot share one computation (SingleFlight).
+The memo holds at most CACHE_DAYS days and CACHE_BYTES bytes of day states (raw rows, features and |SHAP|).
+"""
+
+CACHE_DAYS  = int(os.environ.get("FALLBACK_CACHE_DAYS", 8))
+CACHE_BYTES = int(os.environ.get("FALLBACK_CACHE_BYTES", 64 * 1024 * 1024))
+CACHE_TTL_S = float(os.environ.get("FALLBACK_CACHE_TTL_S", 3600))
+
+
+class DayState(NamedTuple):
+    """What is kept between calls for one day."""
+    max_id: int
+    raw: pd.DataFrame       # unprocessed rows seen so far (id + MODEL_COLUMNS)
+    X: pd.DataFrame         # preprocessed model features
+    abs_shap: np.ndarray    # per-row |SHAP| of X
+    result: tuple           # (top SHAP features, correlations)
+
+    def nbytes(self) -> int:
+        return int(self.raw.memory_usage().sum() + self.X.memory_usage().sum() + self.abs_shap.nbytes)
+
+
+class SingleFlight:
+    """Calls with the same key that overlap share one execution: the first caller runs it, the others wait for its result."""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.value, self.error = None, None
+
+    def __init__(self):
+        self.lock  = threading.Lock()
+        self.calls = {}
+
+    def run(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+
+        if not leader:
+            COUNTERS["shared"] += 1
+            count("fallback.shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+
+_DAYS    = LRUCache(max_entries=CACHE_DAYS, max_bytes=CACHE_BYTES)
+_FLIGHTS = SingleFlight()
+COUNTERS = {"hits": 0, "delta": 0, "full": 0, "shared": 0, "shap_rows": 0}
+
+
+def stats() -> dict:
+    return {**COUNTERS, "days": len(_DAYS.entries)}
+
+
+def clear():
+    _DAYS.clear()
+
+
+def _reused_shap(state: DayState | None, X: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+    """Per-row |SHAP| of X taken from state where the row's features did not change, and the mask of those rows."""
+    same = np.zeros(len(X), dtype=bool)
+    reused = np.zeros((len(X), len(X.columns)), dtype=np.float32) # pred_contribs dtype
+    if state is None or SHAP_ENGINE != "native" or list(state.X.columns) != list(X.columns) \
+            or not (state.X.index.is_unique and X.index.is_unique):
+        return reused, same
+
+    old = state.X.reindex(X.index).to_numpy()
+    new = X.to_numpy()
+    same = ((old == new) | (np.isnan(old) & np.isnan(new))).all(axis=1)
+    reused[same] = pd.DataFrame(state.abs_shap, index=state.X.index).reindex(X.index).to_numpy()[same]
+    return reused, same
+
+
+def _compute(conn, target_date, max_id: int, n_rows: int, n_feat: int):
+    key   = (target_date, n_feat)
+    state = _DAYS.get(key)
+    if state is not None and state.max_id == max_id and len(state.raw) == n_rows:
+        COUNTERS["hits"] += 1
+        count("fallback.memo_hit")
+        return state.result
+
+    columns = ["id"] + MODEL_COLUMNS
+    with span("fallback.db.read") as s:
+        if state is not None and state.max_id < max_id:
+            delta = read_incoming(conn, UNPROCESSED_DAY + " AND id > %s", (*day_range(target_date), state.max_id), columns=columns)
+            s.rows = len(delta)
+            raw = pd.concat([state.raw, delta], ignore_index=True).sort_values("timestamp", kind="stable", ignore_index=True)
+            if len(raw) != n_rows: # some of the stored rows were processed meanwhile
+                state = None
+        else:
+            state = None
+        if state is None:
+            raw = read_incoming(conn, UNPROCESSED_DAY, day_range(target_date), columns=columns)
+            s.rows = len(raw)
+    COUNTERS["delta" if state is not None else "full"] += 1
+    count("fallback.delta" if state is not None else "fallback.full")
+
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    with span("fallback.db.read_lag_tail"):
+        history = load_tail(conn, target_date, max_lag(feat_cols))
+    with span("fallback.preprocess", rows=len(raw)):
+        proc_df = preprocess(raw.drop(columns=["id"]), model_features=feat_cols, history=history)
+    X = proc_df.drop(columns=["mental_health_status"])
+
+    abs_shap, same = _reused_shap(state, X)
+    if (~same).any():
+        with span("fallback.shap", rows=int((~same).sum())):
+            abs_shap[~same] = get_abs_shap_matrix(X[~same], model)
+        COUNTERS["shap_rows"] += int((~same).sum())
+
+    with span("fallback.correlation", rows=len(proc_df)):
+        result = (top_shap_from_matrix(X.columns, abs_shap, n_feat), get_correlation_matrix(proc_df, n_feat=n_feat))
+    state = DayState(max_id, raw, X, abs_shap, result)
+    _DAYS.set(key, state, CACHE_TTL_S, size=state.nbytes())
+    return result
+
+
+def partial_day_insights(conn, target_date, n_feat=5):
+    """
+    (top SHAP features, correlations) from the unprocessed rows of target_date, None if there are none.
+    Same output as preprocess (after the lag tail) + get_shap_values + get_correlation_matrix over those rows.
+    """
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT MAX(id), COUNT(*) FROM incoming_data WHERE {UNPROCESSED_DAY}", day_range(target_date))
+        max_id, n_rows = cur.fetchone()
+    if max_id is None:
+        return None
+    return _FLIGHTS.run((target_date, max_id, n_rows, n_feat), lambda: _compute(conn, target_date, max_id, n_rows, n_feat))
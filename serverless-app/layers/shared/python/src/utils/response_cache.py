@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple
+
+"""
+Read-through cache for the GET insight responses.
+Two levels: an in-process LRU with TTL (lives as long as the warm Lambda container), bounded by entry
+count and body bytes, and an optional shared backend (RESPONSE_CACHE_BACKEND) so containers can share
+entries and the process handlers' invalidations reach every reader:
+- ""            no shared level
+- "local"       in-memory stand-in with the same interface (local runs, scripts)
+- "redis://..." Redis, the redis package is imported only then
+invalidate_insights only reaches other containers through the shared backend: without one it clears the
+writer's own LRU, and every other container keeps serving its entry until the TTL runs out.
+A daily_insights row only changes when its day is processed again, so with a shared backend daily entries get
+a long TTL, without one a short one (DAILY_CACHE_TTL_S) bounds how long a reprocessed day is served stale. The
+latest historical row changes whenever a process job runs, so that entry is short-lived and invalidated on write.
+Per-location responses (?location=) have their own keys, the writers invalidate the locations they wrote.
+Entries carry an ETag (the row's UUID) and Last-Modified (its created_at) for 304 revalidation.
+Only the stdlib is imported, the GET handlers import this on cold start.
+"""
+
+MAX_ENTRIES          = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 256))
+MAX_BYTES            = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+SHARED_BACKEND       = os.environ.get("RESPONSE_CACHE_BACKEND", "")
+DAILY_TTL_S          = float(os.environ.get("DAILY_CACHE_TTL_S", 24 * 3600 if SHARED_BACKEND else 300))
+HISTORICAL_TTL_S     = float(os.environ.get("HISTORICAL_CACHE_TTL_S", 60))
+
+HISTORICAL_KEY = "historical:latest"
+
+
+def daily_key(insight_date, location_id=None) -> str:
+    return f"daily:{insight_date}" if location_id is None else f"daily:{insight_date}:location:{location_id}"
+
+
+def historical_key(location_id=None) -> str:
+    return HISTORICAL_KEY if location_id is None else f"historical:location:{location_id}"
+
+
+class CachedResponse(NamedTuple):
+    """A 200 response body with its validators."""
+    body: str
+    etag: str
+    last_modified: str # HTTP date
+
+    @classmethod
+    def build(cls, payload: dict, row_id, created_at: datetime) -> "CachedResponse":
+        if created_at.tzinfo is None: # TIMESTAMP columns (created_at DEFAULT CURRENT_TIMESTAMP) are UTC on the DB server
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        return cls(json.dumps(payload), f'"{row_id}"', format_datetime(created_at.astimezone(timezone.utc), usegmt=True))
+
+
+class LRUCache:
+    """Thread-safe LRU with per-entry TTL, evicts the least recently used entries beyond max_entries/max_bytes."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.entries = OrderedDict() # key -> (expires_at, size, value)
+        self.bytes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self.entries.move_to_end(key)
+            return item[2]
+
+    def set(self, key, value, ttl_s: float, size=1):
+        with self.lock:
+            if key in self.entries:
+                self._pop(key)
+            if size > self.max_bytes:
+                return
+            self.entries[key] = (time.monotonic() + ttl_s, size, value)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self.entries)))
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                if key in self.entries:
+                    self._pop(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _pop(self, key):
+        self.bytes -= self.entries.pop(key)[1]
+
+
+class LocalBackend:
+    """In-memory stand-in for the shared backend (same get/set/delete as RedisBackend)."""
+
+    def __init__(self):
+        self.cache = LRUCache(max_entries=10 * MAX_ENTRIES, max_bytes=10 * MAX_BYTES)
+
+    def get(self, key: str) -> str | None:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: str, ttl_s: float):
+        self.cache.set(key, value, ttl_s, size=len(value))
+
+    def delete(self, *keys: str):
+        self.cache.delete(*keys)
+
+
+class RedisBackend:
+    """Shared backend on Redis, values are the JSON-encoded CachedResponse."""
+
+    def __init__(self, url: str):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> str | None:
+        value = self.client.get(key)
+        return value.decode() if value is not None else None
+
+    def set(self, key: str, value: str, ttl_s: float):
+        self.client.set(key, value, px=int(ttl_s * 1000))
+
+    def delete(self, *keys: str):
+        if keys:
+            self.client.delete(*keys)
+
+
+def make_backend(spec: str):
+    if not spec:
+        return None
+    if spec == "local":
+        return LocalBackend()
+    if spec.startswith(("redis://", "rediss://")):
+        return RedisBackend(spec)
+    raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND '{spec}'")
+
+
+class ResponseCache:
+    """
+    Local LRU in front of an optional shared backend, with hit/miss counters.
+    A shared backend that fails is treated as a miss, the response is then served from Postgres.
+    """
+
+    def __init__(self, local: LRUCache, shared=None):
+        self.local, self.shared = local, shared
+        self.counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0, "shared_errors": 0}
+
+    def get(self, key: str) -> CachedResponse | None:
+        entry = self.local.get(key)
+        if entry is not None:
+            self.counters["hits"] += 1
+            return entry
+
+        if self.shared is not None:
+            try:
+                value = self.shared.get(key)
+            except Exception:
+                value = None
+                self.counters["shared_errors"] += 1
+            if value is not None:
+                entry = CachedResponse(*json.loads(value))
+                self.local.set(key, entry, self._ttl(key), size=len(entry.body))
+                self.counters["shared_hits"] += 1
+                return entry
+
+        self.counters["misses"] += 1
+        return None
+
+    def set(self, key: str, entry: CachedResponse):
+        ttl_s = self._ttl(key)
+        self.local.set(key, entry, ttl_s, size=len(entry.body))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, json.dumps(entry), ttl_s)
+            except Exception:
+                self.counters["shared_errors"] += 1
+
+    def invalidate(self, *keys: str):
+        self.local.delete(*keys)
+        self.counters["invalidations"] += len(keys)
+        if self.shared is not None:
+            try:
+                self.shared.delete(*keys)
+            except Exception:
+                self.counters["shared_errors"] += 1
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["shared_hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round((lookups - self.counters["misses"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.local.entries),
+            "bytes": self.local.bytes,
+            "evictions": self.local.evictions,
+        }
+
+    @staticmethod
+    def _ttl(key: str) -> float:
+        return HISTORICAL_TTL_S if key.startswith("historical:") else DAILY_TTL_S
+
+
+RESPONSE_CACHE = ResponseCache(LRUCache(), make_backend(SHARED_BACKEND))
+
+
+def invalidate_insights(*insight_dates, locations=()):
+    """
+    Called after writing insights: drops the latest-historical entry and the given days,
+    and for every location in locations its latest-historical entry and its entries of those days.
+    Other containers only see it through the shared backend, without one it is local to this process.
+    """
+    RESPONSE_CACHE.invalidate(
+        HISTORICAL_KEY, *(daily_key(d) for d in insight_dates),
+        *(historical_key(loc) for loc in locations),
+        *(daily_key(d, loc) for d in insight_dates for loc in locations)
+    )
+
+
+def _request_headers(event) -> dict:
+    return {k.lower(): v for k, v in ((event or {}).get("headers") or {}).items()}
+
+
+def is_not_modified(event, entry: CachedResponse) -> bool:
+    """If-None-Match wins over If-Modified-Since, like RFC 9110 says."""
+    headers = _request_headers(event)
+    if "if-none-match" in headers:
+        tags = [t.strip() for t in headers["if-none-match"].split(",")]
+        return "*" in tags or entry.etag in tags or f"W/{entry.etag}" in tags
+    if "if-modified-since" in headers:
+        try:
+            return parsedate_to_datetime(entry.last_modified) <= parsedate_to_datetime(headers["if-modified-since"])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cached_response(event, entry: CachedResponse, cache_status: str) -> dict:
+    """200 with the cached body, or 304 without a body when the client's copy is still valid."""
+    headers = {
+        "Content-Type": "application/json",
+        "ETag": entry.etag,
+        "Last-Modified": entry.last_modified,
+        "X-Cache": cache_status,
+    }
+    if is_not_modified(event, entry):
+        return {"statusCode": 304, "headers": headers, "body": ""}
+    return {"statusCode": 200, "headers": headers, "body": entry.body}
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pandas as pd
+
+"""
+Bounded-cost SHAP for the historical recompute.
+- stratified_sample keeps at most SHAP_MAX_ROWS rows, every (day, hour) stratum keeping its share, and
+  weights each kept row by the number of rows it stands for, so weighted sums estimate the full-data sums
+- bootstrap_sums draws SHAP_BOOTSTRAP Poisson(1) bootstrap replicates of the weighted |SHAP| sums.
+  Poisson counts are drawn per row, so replicate sums of disjoint row blocks (location chunks) just add up
+- shap_bounds turns merged replicate sums into a confidence interval on each feature's mean |SHAP|
+The explainer then costs O(SHAP_MAX_ROWS) however long the history is. SHAP_MAX_ROWS=0 explains every row.
+"""
+
+SHAP_MAX_ROWS  = int(os.environ.get("SHAP_MAX_ROWS", 100_000))
+SHAP_BOOTSTRAP = int(os.environ.get("SHAP_BOOTSTRAP", 200)) # replicates, 0 = no confidence bounds
+SHAP_CI        = float(os.environ.get("SHAP_CI", 0.95))
+BOOTSTRAP_STEP = 25 # replicates per matrix product, bounds the count matrix to 25 x rows
+
+
+#
+def stratified_sample(index: pd.DatetimeIndex, max_rows=None, seed=0) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Positions of at most ~max_rows rows of a time-indexed frame, stratified by (day, hour), and their weights
+    (stratum rows / kept rows of the stratum). Shares are rounded up or down at random so the total stays on budget,
+    a stratum whose share rounds to 0 is dropped (only when the budget is below one row per hour).
+    Returns (all positions, None) when the frame fits in the budget.
+    """
+    max_rows = SHAP_MAX_ROWS if max_rows is None else max_rows
+    n_rows   = len(index)
+    if not max_rows or n_rows <= max_rows:
+        return np.arange(n_rows), None
+
+    rng          = np.random.default_rng(seed)
+    strata, _    = pd.factorize(index.floor("h"))
+    sizes        = np.bincount(strata)
+    share        = sizes * (max_rows / n_rows)
+    keep         = np.floor(share + rng.random(len(sizes))).astype(np.int64)
+
+    # rank of every row within its stratum, in random order
+    order        = np.lexsort((rng.random(n_rows), strata))
+    starts       = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    rank         = np.empty(n_rows, dtype=np.int64)
+    rank[order]  = np.arange(n_rows) - starts[strata[order]]
+
+    positions = np.flatnonzero(rank < keep[strata])
+    kept      = strata[positions]
+    return positions, sizes[kept] / keep[kept]
+
+
+#
+def bootstrap_sums(abs_shap: np.ndarray, weights=None, n_boot=None, seed=0) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Poisson bootstrap of weighted |SHAP| sums: (n_boot x features) replicate sums and (n_boot,) replicate weights.
+    Use a different seed for every block of rows that is merged later.
+    """
+    n_boot  = SHAP_BOOTSTRAP if n_boot is None else n_boot
+    rng     = np.random.default_rng(seed)
+    weights = np.ones(len(abs_shap)) if weights is None else np.asarray(weights, dtype=np.float64)
+    sums    = np.empty((n_boot, abs_shap.shape[1]))
+    totals  = np.empty(n_boot)
+    for lo in range(0, n_boot, BOOTSTRAP_STEP):
+        hi = min(lo + BOOTSTRAP_STEP, n_boot)
+        counts = rng.poisson(1.0, (hi - lo, len(abs_shap))) * weights
+        sums[lo:hi]   = counts @ abs_shap.astype(np.float64, copy=False)
+        totals[lo:hi] = counts.sum(axis=1)
+    return sums, totals
+
+
+#
+def shap_bounds(columns, boot_sums: np.ndarray, boot_weights: np.ndarray, features=None, ci=None) -> dict:
+    """{feature: [low, high]} percentile interval of mean |SHAP| over the replicates, for features (default: all)."""
+    ci    = SHAP_CI if ci is None else ci
+    means = boot_sums / boot_weights[:, None]
+    low, high = np.quantile(means, [(1 - ci) / 2, (1 + ci) / 2], axis=0)
+    position  = {col: i for i, col in enumerate(columns)}
+    return {
+        feature: [round(float(low[position[feature]]), 4), round(float(high[position[feature]]), 4)]
+        for feature in (features if features is not None else columns)
+    }
@@ -0,0 +1,179 @@
+import os
+import hashlib
+from datetime import timedelta
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+from src.model.preprocess import BASE_FEATURES, TARGET, INDEX, preprocess, max_lag
+from src.model.model_runner import predict_proba
+from src.utils.data_access import read_incoming, copy_incoming, day_range, MODEL_COLUMNS
+from src.utils.lag_state import load_tail, stored_tail, next_tail
+from src.utils.metrics import span
+
+"""
+Per-interval mental_health_status predictions for a batch of sensor rows or a date range of incoming_data.
+Features come from preprocess (after the lag rows before the batch, src/utils/lag_state.py) with dropna=False:
+a row is scored even when some of its lags have no history or it has no status yet, XGBoost sends the missing
+values down the branch it learned for them. Scoring is XGBoost in-place prediction on the float32 feature matrix
+(model_runner.predict_proba), no DMatrix per call, on SCORE_THREADS threads.
+Predictions are stored in bulk: one binary COPY into a temporary table, then one upsert into status_predictions,
+keyed on (model_version, location_id, timestamp).
+"""
+
+SCORE_THREADS  = int(os.environ.get("SCORE_THREADS", 0)) # XGBoost threads, 0 = one per core
+SCORE_MAX_ROWS = int(os.environ.get("SCORE_MAX_ROWS", 10_000)) # rows of one request body
+SCORE_MAX_DAYS = int(os.environ.get("SCORE_MAX_DAYS", 31)) # days of one start/end request
+
+PREDICTION_COLUMNS = ["timestamp", "location_id", "probability", "predicted_status"]
+PREDICTION_TYPES   = {"timestamp": "timestamptz", "location_id": "int4", "probability": "float8", "predicted_status": "int4"}
+
+
+#
+@lru_cache(maxsize=8)
+def _file_version(path: str, mtime: float) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:12]
+
+
+#
+def model_version(entry) -> str:
+    """Model file name + a hash of its content (a ModelEntry from get_model), what predictions are stored under."""
+    return f"{os.path.basename(entry.path)}-{_file_version(entry.path, entry.mtime)}"
+
+
+#
+def rows_frame(rows: list) -> pd.DataFrame:
+    """
+    Request rows ({"timestamp": ..., "location_id": ..., sensor columns, optionally mental_health_status})
+    as a frame of MODEL_COLUMNS sorted by time. Missing sensor values are NaN. Raises ValueError on bad rows.
+    """
+    if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+        raise ValueError("'rows' must be a non-empty list of objects")
+    if len(rows) > SCORE_MAX_ROWS:
+        raise ValueError(f"At most {SCORE_MAX_ROWS} rows per request, got {len(rows)}")
+    df = pd.DataFrame(rows)
+    for col in (INDEX, "location_id"):
+        if col not in df.columns or df[col].isna().any():
+            raise ValueError(f"Every row needs '{col}'")
+
+    out = {INDEX: pd.to_datetime(df[INDEX], utc=True)}
+    for col in BASE_FEATURES + [TARGET]:
+        out[col] = pd.to_numeric(df[col]) if col in df.columns else np.nan
+    if not (out["location_id"] % 1 == 0).all():
+        raise ValueError("'location_id' must be an integer")
+    return pd.DataFrame(out)[MODEL_COLUMNS].sort_values(INDEX, kind="stable").reset_index(drop=True)
+
+
+#
+def features(df: pd.DataFrame, feature_names, history=None) -> pd.DataFrame:
+    """Every row of df preprocessed (compact, NaN kept), after history (repaired rows right before df)."""
+    if TARGET not in df.columns: # the status lags still come from history
+        df = df.assign(**{TARGET: np.nan})
+    return preprocess(df, model_features=feature_names, compact=True, history=history, dropna=False)
+
+
+#
+def score(proc_df: pd.DataFrame, model, feature_names, nthread=None) -> pd.DataFrame:
+    """
+    Predictions (PREDICTION_COLUMNS) of the preprocessed rows, on nthread XGBoost threads (default SCORE_THREADS).
+    Rows without a location_id are not scored, predictions are stored per location.
+    """
+    proc_df = proc_df[proc_df["location_id"].notna()]
+    with span("predict", rows=len(proc_df)):
+        probability = predict_proba(model, proc_df[list(feature_names)], SCORE_THREADS if nthread is None else nthread)
+    return pd.DataFrame({
+        "timestamp": proc_df.index,
+        "location_id": proc_df["location_id"].to_numpy().astype(np.int64),
+        "probability": probability.astype(np.float64),
+        "predicted_status": (probability > 0.5).astype(np.int64),
+    })
+
+
+#
+def rows_history(conn, df: pd.DataFrame, history_rows, lag_rows: int) -> pd.DataFrame | None:
+    """
+    Lag history of request rows df: history_rows (the rows right before them, same format as the rows, [] for
+    none) repaired, or else the stored tail of the day before the first row (lag_tails, one row by key), which
+    fits a batch that starts with its day. incoming_data is not read. Raises ValueError when there is neither.
+    """
+    first = df[INDEX].iloc[0]
+    if history_rows is not None:
+        if not lag_rows or history_rows == []:
+            return None
+        history = rows_frame(history_rows)
+        if history[INDEX].iloc[-1] >= first:
+            raise ValueError("'history' must end before the first row")
+        return next_tail(history, None, lag_rows)
+    if not lag_rows:
+        return None
+    with span("db.read_lag_tail"):
+        history = stored_tail(conn, first.date(), lag_rows)
+    if history is None or history.index[-1] >= first:
+        raise ValueError(
+            f"No stored lag tail for {first.date() - timedelta(days=1)}: pass 'history' "
+            f"(the {lag_rows} rows before the first one, [] for none) or process that day first"
+        )
+    return history
+
+
+#
+def score_rows(conn, rows: list, entry, history_rows=None, nthread=None) -> pd.DataFrame:
+    """Predictions of request rows, the lags before the first one from rows_history."""
+    df = rows_frame(rows)
+    history = rows_history(conn, df, history_rows, max_lag(entry.feature_names))
+    with span("preprocess", rows=len(df)):
+        proc_df = features(df, entry.feature_names, history)
+    return score(proc_df, entry.model, entry.feature_names, nthread)
+
+
+#
+def read_range(conn, start, end) -> pd.DataFrame:
+    """Rows of incoming_data from start to end (days, inclusive)."""
+    if end < start:
+        raise ValueError("'end' must not be before 'start'")
+    if (end - start).days + 1 > SCORE_MAX_DAYS:
+        raise ValueError(f"At most {SCORE_MAX_DAYS} days per request")
+    return read_incoming(conn, "timestamp >= %s AND timestamp < %s", (day_range(start)[0], day_range(end)[1]))
+
+
+#
+def score_range(conn, start, end, entry, nthread=None) -> pd.DataFrame:
+    """Predictions of every incoming_data row from start to end, after the lag tail of the day before start."""
+    with span("db.read") as s:
+        df = read_range(conn, start, end)
+        s.rows = len(df)
+    if df.empty:
+        return pd.DataFrame(columns=PREDICTION_COLUMNS)
+    with span("db.read_lag_tail"):
+        history = load_tail(conn, start, max_lag(entry.feature_names))
+    with span("preprocess", rows=len(df)):
+        proc_df = features(df, entry.feature_names, history)
+    return score(proc_df, entry.model, entry.feature_names, nthread)
+
+
+#
+def save_predictions(conn, predictions: pd.DataFrame, version: str) -> int:
+    """
+    Upserts predictions under version: one binary COPY into a temporary table, then one INSERT ... ON CONFLICT.
+    A (location_id, timestamp) that appears twice keeps its last prediction. Returns the rows stored. The caller commits.
+    """
+    predictions = predictions.drop_duplicates(["location_id", "timestamp"], keep="last")
+    if predictions.empty:
+        return 0
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS status_predictions_staging (
+              timestamp TIMESTAMPTZ, location_id INT, probability DOUBLE PRECISION, predicted_status INT
+            ) ON COMMIT DROP;
+            TRUNCATE status_predictions_staging;
+        """)
+    copy_incoming(conn, [predictions], PREDICTION_COLUMNS, table="status_predictions_staging", column_types=PREDICTION_TYPES)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO status_predictions (timestamp, location_id, model_version, probability, predicted_status)
+            SELECT timestamp, location_id, %s, probability, predicted_status FROM status_predictions_staging
+            ON CONFLICT (model_version, location_id, timestamp) DO UPDATE
+                SET probability = EXCLUDED.probability, predicted_status = EXCLUDED.predicted_status,
+                    created_at = CURRENT_TIMESTAMP;
+        """, (version,))
+        return cur.rowcount
@@ -0,0 +1,105 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from src.utils.stats import SHAP_ENGINE, get_abs_shap_matrix, summarize_background
+
+"""
+Chunked |SHAP| sums over a worker pool.
+X is cut into SHAP_CHUNK_ROWS-row chunks, every chunk returns its float64 sum of |SHAP| per feature and the
+partial sums are added in chunk order, so the result is bit-identical for any worker count or executor
+(and so is the mean |SHAP| ranking). Chunking alone also bounds the contribution matrix to one chunk per worker.
+- "thread":  XGBoost releases the GIL while predicting
+- "process": spawned processes (a forked child would inherit the parent's OpenMP state); falls back to
+             in-process where process pools are not available (AWS Lambda has no /dev/shm)
+Either way every worker loads its own copy of the model once, from its serialized bytes (not from disk), with
+cores / workers OpenMP threads: the cached booster other callers use is never reconfigured.
+run_in_pool is the pool both this and the per-location aggregates (src/utils/locations.py) run on.
+The shap engine summarizes its background once over the whole of X and hands it to every chunk.
+"""
+
+SHAP_CHUNK_ROWS = int(os.environ.get("SHAP_CHUNK_ROWS", 50_000))
+SHAP_WORKERS    = int(os.environ.get("SHAP_WORKERS", 1)) # 0 = one per core
+SHAP_EXECUTOR   = os.environ.get("SHAP_EXECUTOR", "thread")
+SHAP_EXECUTORS  = ("thread", "process")
+
+_worker = threading.local() # the model copy of a pool worker (thread or process)
+
+
+#
+def run_in_pool(fn, args: list[tuple], workers: int, executor="process", initializer=None, initargs=()) -> list | None:
+    """
+    [fn(*a) for a in args], in order, on a pool of `workers` threads or spawned processes (a forked child would
+    inherit the parent's OpenMP state), every worker set up by initializer(*initargs). None when workers <= 1 or
+    no process pool can be created here (AWS Lambda has no /dev/shm): the caller then runs fn in-process.
+    """
+    if workers <= 1:
+        return None
+    if executor == "thread":
+        pool = ThreadPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs)
+    else:
+        try:
+            pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=initializer, initargs=initargs
+            )
+        except (OSError, NotImplementedError): # no semaphores/shared memory for a pool here
+            return None
+    with pool:
+        return list(pool.map(fn, *zip(*args)))
+
+
+#
+def _init_worker(raw: bytearray, nthread: int):
+    """A private copy of the model with its own thread count, so workers never change a shared booster."""
+    import xgboost as xgb
+    _worker.model = xgb.XGBClassifier()
+    _worker.model.load_model(raw)
+    _worker.model.get_booster().set_param({"nthread": nthread})
+
+
+#
+def _chunk_sum(X: pd.DataFrame, engine: str, background=None, model=None) -> np.ndarray:
+    model = model if model is not None else _worker.model
+    return get_abs_shap_matrix(X, model, engine=engine, background=background).sum(axis=0, dtype=np.float64)
+
+
+#
+def resolve_workers(workers=None) -> int:
+    workers = SHAP_WORKERS if workers is None else workers
+    return workers if workers > 0 else os.cpu_count() or 1
+
+
+#
+def shap_abs_sum(X: pd.DataFrame, model=None, engine=None, chunk_rows=None, workers=None, executor=None) -> np.ndarray:
+    """Float64 sum of |SHAP| per column of X, evaluated chunk by chunk on `workers` workers."""
+    engine     = engine or SHAP_ENGINE
+    executor   = executor or SHAP_EXECUTOR
+    chunk_rows = chunk_rows or SHAP_CHUNK_ROWS
+    if executor not in SHAP_EXECUTORS:
+        raise ValueError(f"Unknown SHAP executor '{executor}', expected one of {SHAP_EXECUTORS}")
+    if model is None:
+        from src.model.model_runner import get_model
+        model = get_model().model
+
+    total = np.zeros(X.shape[1])
+    if X.empty:
+        return total
+    background = summarize_background(X) if engine == "shap" else None
+    chunks     = [X.iloc[i:i + chunk_rows] for i in range(0, len(X), chunk_rows)]
+    workers    = min(resolve_workers(workers), len(chunks))
+    nthread    = max(1, (os.cpu_count() or 1) // workers)
+
+    raw      = model.get_booster().save_raw("ubj") if workers > 1 else None
+    partials = run_in_pool(
+        _chunk_sum, [(chunk, engine, background) for chunk in chunks], workers, executor,
+        initializer=_init_worker, initargs=(raw, nthread)
+    )
+    if partials is None:
+        partials = [_chunk_sum(chunk, engine, background, model) for chunk in chunks]
+
+    for partial in partials: # chunk order, whatever finished first
+        total += partial
+    return total
@@ -1,44 +1,145 @@
-import shap
+import os
 import pandas as pd
-import shap
-from src.model.model_runner import load_model
 import numpy as np
 
+# shap and xgboost are imported where they are used, so importing this module stays cheap
+
+# "native": TreeSHAP contributions straight from the booster (pred_contribs)
+# "shap":   shap.Explainer over a summarized background of X, kept as the reference backend
+SHAP_ENGINE  = os.environ.get("SHAP_ENGINE", "native")
+SHAP_ENGINES = ("native", "shap")
+
+# background of the shap engine: "kmeans" (centroids rounded to observed values) or "sample" (stratified by day/hour)
+SHAP_BACKGROUND      = os.environ.get("SHAP_BACKGROUND", "kmeans")
+SHAP_BACKGROUND_ROWS = int(os.environ.get("SHAP_BACKGROUND_ROWS", 100))
+
+
+#
+def _top_features(columns, summary: np.ndarray, n_feat: int) -> dict:
+    """Top N features by a per-column summary value, rounded for the API."""
+    top_idx = summary.argsort()[-n_feat:][::-1]
+
+    return {
+        columns[i]: round(float(summary[i]), 4)
+        for i in top_idx
+    }
+
 
 #
-def get_shap_values(X: pd.DataFrame, model=None, n_feat=15):
+def summarize_background(X: pd.DataFrame, rows=None, method=None, seed=0) -> pd.DataFrame:
     """
-    Compute SHAP values for top N features.
+    At most `rows` background rows standing for X. The interventional explainer costs O(rows) per explained row,
+    so the background size, not the history length, sets its cost.
     """
+    rows   = rows or SHAP_BACKGROUND_ROWS
+    method = method or SHAP_BACKGROUND
+    if len(X) <= rows:
+        return X
+    if method == "kmeans":
+        import shap
+        centroids = shap.kmeans(X.to_numpy(dtype=np.float64), rows, round_values=True).data
+        return pd.DataFrame(centroids, columns=X.columns).astype(X.dtypes.to_dict())
+    if method == "sample":
+        from src.utils.sampling import stratified_sample
+        positions, _ = stratified_sample(X.index, rows, seed=seed)
+        return X.iloc[positions]
+    raise ValueError(f"Unknown SHAP background '{method}', expected 'kmeans' or 'sample'")
+
+
+#
+def get_abs_shap_matrix(X: pd.DataFrame, model=None, engine=None, background=None) -> np.ndarray:
+    """
+    Per-row |SHAP| values (rows x features) from the selected engine.
+    The native engine uses XGBoost's path-dependent TreeSHAP and drops the bias column, it needs no background.
+    The shap engine runs an interventional TreeExplainer against background (default: summarize_background(X)).
+    """
+    engine = engine or SHAP_ENGINE
+    if engine not in SHAP_ENGINES:
+        raise ValueError(f"Unknown SHAP engine '{engine}', expected one of {SHAP_ENGINES}")
     if model is None:
-        model = load_model()
+        from src.model.model_runner import get_model
+        model = get_model().model
 
-    explainer    = shap.Explainer(model, X)
-    shap_values  = explainer(X)
-    shap_summary = np.abs(shap_values.values).mean(axis=0)
+    if engine == "native":
+        import xgboost as xgb
+        contribs = model.get_booster().predict(xgb.DMatrix(X), pred_contribs=True)
+        return np.abs(contribs[:, :-1])
 
-    top_idx = shap_summary.argsort()[-n_feat:][::-1]
-    
-    return {
-        X.columns[i]: round(float(shap_summary[i]), 4)
-        for i in top_idx
-    }
+    import shap
+    background  = summarize_background(X) if background is None else background
+    explainer   = shap.Explainer(model, shap.maskers.Independent(background, max_samples=len(background)))
+    shap_values = explainer(X)
+    return np.abs(shap_values.values)
 
 
 #
-def get_correlation_matrix(df: pd.DataFrame, n_feat=15) -> pd.DataFrame:
+def get_shap_abs_sum(X: pd.DataFrame, model=None, engine=None, chunk_rows=None, workers=None, executor=None) -> dict:
     """
-    Correlation matrix of averaged time-of-day features.
+    Sum of |SHAP| per feature over the rows of X (unrounded, float64).
+    Sums and row counts can be added across days, see src/utils/aggregates.
+    Evaluated in row chunks, on a worker pool when workers > 1 (src/utils/shap_pool.py, SHAP_WORKERS).
     """
-    df = df.copy()
-    df['time_of_day'] = df.index.time
-    avg_by_time = df.groupby('time_of_day').mean(numeric_only=True)
+    from src.utils.shap_pool import shap_abs_sum
+    abs_sum = shap_abs_sum(X, model, engine, chunk_rows, workers, executor)
+    return {col: float(v) for col, v in zip(X.columns, abs_sum)}
+
+
+#
+def top_shap_features(shap_abs_sum: dict, row_count: int, n_feat=15) -> dict:
+    """
+    Top N features by mean |SHAP| from a per-feature |SHAP| sum and its row count.
+    """
+    columns = list(shap_abs_sum)
+    summary = np.array([shap_abs_sum[c] for c in columns]) / row_count
+    return _top_features(columns, summary, n_feat)
+
+
+#
+def get_shap_values(X: pd.DataFrame, model=None, n_feat=15, engine=None, chunk_rows=None, workers=None, executor=None):
+    """
+    Compute SHAP values for top N features.
+    For a given chunk size the result is the same with any worker count and executor (see get_shap_abs_sum).
+    """
+    return top_shap_features(get_shap_abs_sum(X, model, engine, chunk_rows, workers, executor), len(X), n_feat)
+
+
+#
+def top_shap_from_matrix(columns, abs_shap: np.ndarray, n_feat=15) -> dict:
+    """Top N features by mean |SHAP| from a per-row |SHAP| matrix (see get_abs_shap_matrix)."""
+    return _top_features(columns, abs_shap.mean(axis=0, dtype=np.float64), n_feat)
+
+
+#
+def get_time_of_day_stats(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Per time-of-day sums and non-null counts of the numeric columns.
+    These are the sufficient statistics of get_correlation_matrix, they can be added across days.
+    """
+    grouped = df.select_dtypes('number').groupby(df.index.time)
+    return grouped.sum(), grouped.count()
+
+
+#
+def correlation_from_time_of_day_stats(sums: pd.DataFrame, counts: pd.DataFrame, n_feat=15) -> dict:
+    """
+    Top N Pearson correlations with the target, from (merged) time-of-day sums and counts.
+    """
+    avg_by_time = sums / counts
     corr_matrix = avg_by_time.corr()
-    
+
     if 'mental_health_status' not in corr_matrix:
         return {}
 
     correlations = corr_matrix['mental_health_status'].drop('mental_health_status')
     top_corr = correlations.reindex(correlations.abs().sort_values(ascending=False).index).head(n_feat)
 
-    return {k: round(v, 4) for k, v in top_corr.items()}
\ No newline at end of file
+    return {k: round(v, 4) for k, v in top_corr.items()}
+
+
+#
+def get_correlation_matrix(df: pd.DataFrame, n_feat=15) -> pd.DataFrame:
+    """
+    Correlation matrix of averaged time-of-day features.
+    """
+    sums, counts = get_time_of_day_stats(df)
+    return correlation_from_time_of_day_stats(sums, counts, n_feat=n_feat)
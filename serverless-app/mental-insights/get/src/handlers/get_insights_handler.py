@@ -3,40 +3,71 @@ import json
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from src.utils.db import get_connection
+from src.utils.response_cache import RESPONSE_CACHE, CachedResponse, cached_response, historical_key
+from src.utils.metrics import instrumented, span, count
 
 
+# latest row of all locations, or of one location (?location=<location_id>)
+LATEST_QUERY = """
+    SELECT *
+    FROM historical_insights
+    ORDER BY created_at DESC
+    LIMIT 1;
+"""
+LATEST_LOCATION_QUERY = """
+    SELECT *
+    FROM location_historical_insights
+    WHERE location_id = %s
+    ORDER BY created_at DESC
+    LIMIT 1;
+"""
+
+
+@instrumented("get_insights")
 def lambda_handler(event, context):
     try:
-        with get_connection() as conn:
+        location_str = (event.get("queryStringParameters") or {}).get("location")
+        if location_str is not None and not location_str.isdigit():
+            return {"statusCode": 400, "body": json.dumps({"error": "'location' must be a location_id (integer)"})}
+        location_id = int(location_str) if location_str is not None else None
+
+        # the latest row only changes when a process job runs (it invalidates this entry)
+        entry = RESPONSE_CACHE.get(historical_key(location_id))
+        if entry is not None:
+            count("cache.hit")
+            return cached_response(event, entry, "HIT")
+        count("cache.miss")
+
+        with span("db.read"), get_connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute("""
-                    SELECT *
-                    FROM historical_insights
-                    ORDER BY created_at DESC
-                    LIMIT 1;
-                """)
+                if location_id is None:
+                    cur.execute(LATEST_QUERY)
+                else:
+                    cur.execute(LATEST_LOCATION_QUERY, (location_id,))
                 row = cur.fetchone()
 
         if not row:
             return {
                 "statusCode": 404,
-                "body": json.dumps({"error": "No insights found."})
+                "body": json.dumps({"error": "No insights found." if location_id is None else f"No insights found for location {location_id}."})
             }
 
-        return {
-            "statusCode": 200,
-            "body": json.dumps({
-                "message":  "Latest historic insights (computed using all data)",
-                "created_at": row["created_at"].isoformat(),
-                "time_range": row["time_range"],
-                "days_analyzed": row["days_analyzed"],
-                "top_stress_features_shap": row["top_stress_features_shap"],
-                "correlations_pearson": row["correlations_pearson"]
-            }),
-            "headers": {
-                "Content-Type": "application/json"
-            }
+        payload = {
+            "message":  "Latest historic insights (computed using all data)",
+            "created_at": row["created_at"].isoformat(),
+            "time_range": row["time_range"],
+            "days_analyzed": row["days_analyzed"],
+            "top_stress_features_shap": row["top_stress_features_shap"],
+            "correlations_pearson": row["correlations_pearson"]
         }
+        if row.get("top_stress_features_shap_ci") is not None:
+            payload["top_stress_features_shap_ci"] = row["top_stress_features_shap_ci"]
+        if location_id is not None:
+            payload["message"]     = f"Latest historic insights of location {location_id}"
+            payload["location_id"] = location_id
+        entry = CachedResponse.build(payload, row["hinsight_id"] if location_id is None else row["lhinsight_id"], row["created_at"])
+        RESPONSE_CACHE.set(historical_key(location_id), entry)
+        return cached_response(event, entry, "MISS")
 
     except Exception as e:
         return {
@@ -5,34 +5,49 @@ import psycopg2
 from psycopg2.extras import RealDictCursor, Json
 
 from src.model.preprocess import preprocess
-from src.model.model_runner import load_model
-from src.utils.stats import get_correlation_matrix, get_shap_values
+from src.model.model_runner import get_model
+from src.utils.stats import get_correlation_matrix, top_shap_features
+from src.utils.aggregates import merge_aggregates
+from src.utils.locations import location_aggregates, location_historical_rows, save_location_historical
+from src.utils.sampling import stratified_sample, shap_bounds
 from src.utils.db import get_connection
+from src.utils.data_access import read_incoming
+from src.utils.feature_store import FEATURE_STORE_DIR, load_features
+from src.utils.response_cache import invalidate_insights
+from src.utils.metrics import instrumented, span
 
 
+@instrumented("process_insights")
 def lambda_handler(event, context):
     try:
         with get_connection() as conn:
-            # Fetch data from incoming_data
-            query = """
-                SELECT
-                    id, timestamp, location_id, temperature_celsius, humidity_percent,
-                    air_quality_index, noise_level_db, lighting_lux, crowd_density,
-                    stress_level, sleep_hours, mood_score, mental_health_status
-                FROM incoming_data
-                ORDER BY timestamp
-            """
-            df = pd.read_sql(query, conn)
-            if df.empty:
+            with span("model.load"):
+                model_entry = get_model()
+            model, feat_cols = model_entry.model, model_entry.feature_names
+
+            store_days = None
+            if FEATURE_STORE_DIR:
+                # stored preprocessed days (src/utils/feature_store.py), only missing/stale days are read and preprocessed
+                with span("features") as s:
+                    proc_df, store_days = load_features(conn, feat_cols)
+                    s.rows = len(proc_df)
+                empty = not store_days["stored"] + store_days["rebuilt"]
+            else:
+                # Fetch data from incoming_data (only the columns preprocess needs)
+                with span("db.read") as s:
+                    df = read_incoming(conn)
+                    s.rows = len(df)
+                empty = df.empty
+            if empty:
                 return {
                     "statusCode": 400,
                     "body": json.dumps({"error": "No data found in incoming_data table."})
                 }
 
-
-            model     = load_model("/opt/python/assets/xgb_model.json")
-            feat_cols = model.get_booster().feature_names
-            proc_df   = preprocess(df, model_features=feat_cols)
+            if not FEATURE_STORE_DIR:
+                # the whole history: memory-lean dtypes, SHAP is unchanged and correlations agree to the rounding
+                with span("preprocess", rows=len(df)):
+                    proc_df   = preprocess(df, model_features=feat_cols, compact=True)
             # Calculate metadata
             X = proc_df.drop(columns=["mental_health_status"])
             date_range = proc_df.index.normalize().unique()
@@ -41,17 +56,34 @@ def lambda_handler(event, context):
             days_analyzed = len(date_range)
 
             
-            shap_top_features = get_shap_values(X, model, n_feat=5)
-            corr_map = get_correlation_matrix(proc_df, n_feat=5)
+            # bounded cost: at most SHAP_MAX_ROWS rows, stratified by day and hour, are explained
+            positions, weights = stratified_sample(proc_df.index)
+            with span("shap", rows=len(positions)):
+                # per-location |SHAP| sums over all cores, the all-locations result is their merge
+                bootstrap = {}
+                per_location = location_aggregates(
+                    proc_df.iloc[positions] if weights is not None else proc_df, model_entry.path,
+                    weights=weights, bootstrap=bootstrap
+                )
+                merged = merge_aggregates(list(per_location.values()))
+                shap_top_features = top_shap_features(merged["shap_abs_sum"], merged["row_count"], n_feat=5)
+                shap_ci = shap_bounds(X.columns, bootstrap["boot_sums"], bootstrap["boot_weights"], shap_top_features) \
+                    if bootstrap["n_boot"] else None
+            with span("correlation", rows=len(proc_df)):
+                corr_map = get_correlation_matrix(proc_df, n_feat=5)
+                location_rows = location_historical_rows(proc_df, per_location, n_feat=5)
 
             # Insert into historical_insights
-            with conn.cursor() as cur:
+            with span("db.write"), conn.cursor() as cur:
                 cur.execute("""
-                    INSERT INTO historical_insights (time_range, top_stress_features_shap, correlations_pearson, days_analyzed)
-                    VALUES (%s, %s, %s, %s)
+                    INSERT INTO historical_insights
+                        (time_range, top_stress_features_shap, correlations_pearson, days_analyzed, top_stress_features_shap_ci)
+                    VALUES (%s, %s, %s, %s, %s)
                     ON CONFLICT DO NOTHING;
-                """, (time_range, Json(shap_top_features), Json(corr_map), days_analyzed))
+                """, (time_range, Json(shap_top_features), Json(corr_map), days_analyzed, Json(shap_ci) if shap_ci else None))
+                save_location_historical(cur, location_rows)
                 conn.commit()
+                invalidate_insights(locations=list(per_location))
 
         return {
             "statusCode": 200,
@@ -60,7 +92,11 @@ def lambda_handler(event, context):
                 "time_range": time_range,
                 "days_analyzed": days_analyzed,
                 "top_stress_features_shap": shap_top_features,
+                "top_stress_features_shap_ci": shap_ci,
+                "rows_explained": len(positions),
                 "correlations_pearson": corr_map,
+                "locations": sorted(per_location),
+                **({"feature_store": store_days} if store_days is not None else {}),
             })
         }
 
@@ -0,0 +1,69 @@
+import sys
+import time
+import numpy as np
+from src.model.preprocess import TARGET, preprocess
+from src.model.model_runner import get_model
+from src.utils.stats import get_abs_shap_matrix, top_shap_from_matrix
+from src.utils.sampling import stratified_sample, bootstrap_sums, shap_bounds
+from synthetic_data import generate
+
+"""
+Bounded-cost historical SHAP (src/utils/sampling.py) vs. explaining every row, on synthetic data
+(scripts/synthetic_data.py) of growing length. Per size and row budget: SHAP + bootstrap time next to
+the exact time, the largest error of mean |SHAP| (scaled by the largest value), whether the top N
+features are the same and how many of the exact means fall inside their bootstrap interval.
+The bounded time stays flat once the history is larger than the budget. Exits with 1 when the top N
+differ or fewer than MIN_COVERAGE of the features are covered.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_bounded_shap.py [days ...]`
+"""
+
+SIZES        = [365, 1825, 3650]
+BUDGETS      = [20_000, 100_000]
+N_FEAT       = 5
+MIN_COVERAGE = 0.8 # of all features, a 95 % interval misses ~1 in 20
+
+
+#
+def main(sizes=SIZES) -> int:
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    failed = []
+
+    for days in sizes:
+        proc_df = preprocess(generate(days), model_features=feat_cols, compact=True)
+        X = proc_df.drop(columns=[TARGET])
+        start = time.perf_counter()
+        exact = get_abs_shap_matrix(X, model).mean(axis=0, dtype=np.float64)
+        exact_s = time.perf_counter() - start
+        exact_top = top_shap_from_matrix(X.columns, exact[None, :], N_FEAT)
+        print(f"\n{days} day(s), {len(X)} rows | every row {exact_s:7.2f} s")
+
+        for budget in BUDGETS:
+            start = time.perf_counter()
+            positions, weights = stratified_sample(X.index, budget)
+            matrix = get_abs_shap_matrix(X.iloc[positions], model)
+            w = np.ones(len(positions)) if weights is None else weights
+            estimate = (w @ matrix.astype(np.float64)) / w.sum()
+            boot_sums, boot_weights = bootstrap_sums(matrix, weights)
+            elapsed = time.perf_counter() - start
+
+            bounds   = shap_bounds(list(X.columns), boot_sums, boot_weights)
+            covered  = np.mean([lo <= round(m, 4) <= hi for m, (lo, hi) in zip(exact, bounds.values())])
+            scaled   = np.abs(estimate - exact).max() / exact.max()
+            same_top = set(top_shap_from_matrix(X.columns, estimate[None, :], N_FEAT)) == set(exact_top)
+            print(
+                f"  budget {budget:>7,} | {len(positions):>7,} rows {elapsed:7.2f} s (x{exact_s / elapsed:.1f})"
+                f" | max scaled error {scaled:.4f} | same top-{N_FEAT}: {same_top} | exact inside CI: {covered:.0%}"
+            )
+            if not same_top or covered < MIN_COVERAGE:
+                failed.append(f"{days}d budget {budget}")
+
+    for line in failed:
+        print(f"FAIL {line}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main([int(s) for s in sys.argv[1:]] or SIZES))
@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+"""
+Import time of every Lambda handler module, each measured in a fresh interpreter
+(what a cold start pays before lambda_handler runs). Exits with 1 if a handler is over its budget.
+
+Run from serverless-app/:
+`python3.11 scripts/bench_cold_start.py [--detail]`
+Budgets (ms) can be overridden with COLD_START_BUDGET_MS='{"get_insights_handler": 150}'.
+--detail also prints the slowest imports of each handler (python -X importtime).
+"""
+
+LAYER_PATH = "layers/shared/python"
+REPEATS    = 5
+
+HANDLERS = {
+    "get_insights_handler":           "mental-insights/get",
+    "process_insights_handler":       "mental-insights/process",
+    "get_daily_insights_handler":     "daily-mental-insights/get",
+    "process_daily_insights_handler": "daily-mental-insights/process",
+    "score_status_handler":           "status-predictions/score",
+}
+
+# read-only handlers should only pay for psycopg2
+BUDGET_MS = {
+    "get_insights_handler":           150,
+    "get_daily_insights_handler":     150,
+    "process_insights_handler":       3000,
+    "process_daily_insights_handler": 3000,
+    "score_status_handler":           3000,
+}
+BUDGET_MS.update(json.loads(os.environ.get("COLD_START_BUDGET_MS", "{}")))
+
+PROBE = (
+    "import time; start = time.perf_counter(); "
+    "import importlib; importlib.import_module('src.handlers.{name}'); "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+
+#
+def _env(code_uri: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([code_uri, LAYER_PATH])
+    return env
+
+
+#
+def import_time_ms(name: str, code_uri: str) -> float:
+    """Median import time of one handler module over REPEATS fresh interpreters."""
+    runs = []
+    for _ in range(REPEATS):
+        out = subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", PROBE.format(name=name)],
+            env=_env(code_uri), capture_output=True, text=True, check=True
+        )
+        runs.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(runs)
+
+
+#
+def slowest_imports(name: str, code_uri: str, top=8) -> list[tuple[str, float]]:
+    """Packages imported directly by the handler/layer, by cumulative import time (ms), from -X importtime."""
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-X", "importtime", "-c", f"import src.handlers.{name}"],
+        env=_env(code_uri), capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            depth = len(module) - len(module.lstrip()) # nested imports are indented
+            entries.append((depth, module.strip(), int(cumulative) / 1000))
+
+    # the output is post-order (children before their parent), walk it backwards with a parent stack
+    totals, stack = {}, []
+    for depth, module, ms in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        parent = stack[-1][1] if stack else ""
+        if parent.startswith("src") and not module.startswith("src"):
+            top_level = module.split(".")[0]
+            totals[top_level] = max(totals.get(top_level, 0.0), ms)
+        stack.append((depth, module))
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+
+#
+def main(detail=False):
+    over_budget = []
+    for name, code_uri in HANDLERS.items():
+        ms, budget = import_time_ms(name, code_uri), BUDGET_MS[name]
+        status = "OK" if ms <= budget else "OVER BUDGET"
+        if ms > budget:
+            over_budget.append(name)
+        print(f"{name:<32} {ms:8.1f} ms  (budget {budget} ms)  {status}")
+
+        if detail:
+            for module, module_ms in slowest_imports(name, code_uri):
+                print(f"    {module:<28} {module_ms:8.1f} ms")
+
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main(detail="--detail" in sys.argv[1:])
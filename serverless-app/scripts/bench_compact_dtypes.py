@@ -0,0 +1,110 @@
+import sys
+import numpy as np
+import pandas as pd
+from src.model.preprocess import (
+    TARGET, preprocess, downcast, repair_outliers, add_time_features, generate_required_lags
+)
+from src.model.model_runner import get_model
+from src.utils.stats import get_abs_shap_matrix, get_correlation_matrix, top_shap_from_matrix
+from synthetic_data import generate
+from bench_stages import measure, prepare
+
+"""
+preprocess(compact=True) vs. the default float64 pipeline on synthetic data (scripts/synthetic_data.py).
+Prints wall time and RSS growth of every stage in both modes, then checks that the outputs agree:
+mean |SHAP| per feature within SHAP_RTOL, the same top features, and correlations within CORR_ATOL
+(they are rounded to 4 decimals for the API). Exits with 1 when a check fails.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_compact_dtypes.py [days ...]`
+"""
+
+SIZES     = [30, 365, 1825]
+REPEATS   = 2
+SHAP_RTOL = 1e-5
+CORR_ATOL = 1e-4
+N_FEAT    = 5
+
+
+#
+def run_stages(df: pd.DataFrame, feat_cols: list[str], model, compact: bool) -> tuple[dict, pd.DataFrame, dict]:
+    """Stage metrics, the preprocessed frame and the outputs, with every stage run the way preprocess runs it."""
+    stages = {}
+    n_rows = len(df)
+
+    def stage(name, fn):
+        out, stages[name] = measure(fn, n_rows, REPEATS)
+        return out
+
+    with pd.option_context("mode.copy_on_write", compact):
+        source   = stage("downcast", lambda: downcast(df)) if compact else df
+        prepared = stage("prepare", lambda: prepare(source))
+        repaired = stage("repair_outliers", lambda: repair_outliers(prepared))
+        timed    = stage("add_time_features", lambda: add_time_features(repaired, compact=compact))
+        lagged   = stage("generate_required_lags", lambda: generate_required_lags(
+            timed, feature_list=feat_cols, dtype=np.float32 if compact else np.float64
+        ))
+        staged   = stage("dropna", lambda: lagged.dropna())
+        del source, prepared, repaired, timed, lagged
+
+    proc_df = stage("preprocess", lambda: preprocess(df, model_features=feat_cols, compact=compact))
+    pd.testing.assert_frame_equal(staged, proc_df) # the stages above are what preprocess runs
+    del staged
+
+    X = proc_df.drop(columns=[TARGET])
+    abs_shap = stage("shap", lambda: get_abs_shap_matrix(X, model))
+    corr     = stage("correlation", lambda: get_correlation_matrix(proc_df, n_feat=len(X.columns)))
+    outputs  = {"mean_abs_shap": abs_shap.mean(axis=0, dtype=np.float64), "columns": list(X.columns), "corr": corr}
+    return stages, proc_df, outputs
+
+
+#
+def check_outputs(default: dict, compact: dict) -> list[str]:
+    failures = []
+    shap_rel = np.max(np.abs(compact["mean_abs_shap"] - default["mean_abs_shap"]) / np.maximum(default["mean_abs_shap"], 1e-12))
+    if shap_rel > SHAP_RTOL:
+        failures.append(f"mean |SHAP| differs by {shap_rel:.2e} (relative)")
+    top_default = top_shap_from_matrix(default["columns"], default["mean_abs_shap"][None, :], N_FEAT)
+    top_compact = top_shap_from_matrix(compact["columns"], compact["mean_abs_shap"][None, :], N_FEAT)
+    if list(top_default) != list(top_compact):
+        failures.append(f"top SHAP features differ: {list(top_default)} vs {list(top_compact)}")
+
+    corr_diff = max((abs(compact["corr"].get(k, np.nan) - v) for k, v in default["corr"].items()), default=0.0)
+    if not corr_diff <= CORR_ATOL:
+        failures.append(f"correlations differ by {corr_diff:.2e}")
+    return failures
+
+
+#
+def main(sizes=SIZES) -> int:
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    failed = []
+
+    for days in sizes:
+        df = generate(days)
+        default_stages, default_df, default_out = run_stages(df, feat_cols, model, compact=False)
+        default_mb = default_df.memory_usage(deep=True).sum() / 2**20
+        del default_df
+        compact_stages, compact_df, compact_out = run_stages(df, feat_cols, model, compact=True)
+        compact_mb = compact_df.memory_usage(deep=True).sum() / 2**20
+        del compact_df
+
+        print(f"\n{days} day(s), {len(df)} rows | preprocessed frame {default_mb:.1f} MB -> {compact_mb:.1f} MB")
+        print(f"  {'stage':<24} {'default':>24} {'compact':>24}")
+        for name in compact_stages:
+            cells = []
+            for stages in (default_stages, compact_stages):
+                m = stages.get(name)
+                cells.append(f"{m['wall_s'] * 1000:9.1f} ms +{m['rss_growth_mb']:7.1f} MB" if m else "-")
+            print(f"  {name:<24} {cells[0]:>24} {cells[1]:>24}")
+
+        failures = check_outputs(default_out, compact_out)
+        failed += [f"{days}d: {f}" for f in failures]
+        print(f"  outputs: {'within tolerance' if not failures else '; '.join(failures)}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main([int(s) for s in sys.argv[1:]] or SIZES))
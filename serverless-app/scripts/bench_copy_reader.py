@@ -0,0 +1,67 @@
+import sys
+import time
+import pandas as pd
+from src.utils.db import get_connection
+from src.utils.data_access import read_incoming, iter_incoming, MODEL_COLUMNS
+
+"""
+Binary COPY reader vs. pd.read_sql on incoming_data-shaped tables of 100k and 1M rows.
+The rows are generated server side in a scratch table (bench_incoming_data, dropped afterwards),
+then both readers load the columns preprocess needs and the results are compared.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_copy_reader.py [rows ...]`
+"""
+
+SIZES = [100_000, 1_000_000]
+TABLE = "bench_incoming_data"
+
+
+#
+def fill_table(conn, n_rows: int):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}; CREATE TABLE {TABLE} (LIKE incoming_data);")
+        cur.execute(f"""
+            INSERT INTO {TABLE}
+            SELECT g, TIMESTAMPTZ '2024-05-01 08:00+00' + g * INTERVAL '15 minutes',
+                   100 + mod(g, 6), 15 + random() * 15, 40 + random() * 40, (random() * 150)::int,
+                   40 + random() * 40, 100 + random() * 400, (random() * 60)::int, (random() * 80)::int,
+                   4 + random() * 6, random() * 3, (random() * 2)::int, FALSE
+            FROM generate_series(1, %s) g
+        """, (n_rows,))
+    conn.commit()
+
+
+#
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+#
+def main(sizes=SIZES):
+    cols = ", ".join(MODEL_COLUMNS)
+    with get_connection() as conn:
+        try:
+            for n_rows in sizes:
+                fill_table(conn, n_rows)
+
+                legacy, t_sql  = timed(lambda: pd.read_sql(f"SELECT {cols} FROM {TABLE} ORDER BY timestamp", conn))
+                fast, t_copy   = timed(lambda: read_incoming(conn, columns=MODEL_COLUMNS, table=TABLE))
+                chunks, t_iter = timed(lambda: sum(len(c) for c in iter_incoming(conn, table=TABLE, chunk_rows=50_000)))
+
+                pd.testing.assert_frame_equal(fast, legacy)
+                assert chunks == n_rows
+
+                print(
+                    f"{n_rows:>9} rows | read_sql {t_sql:7.2f}s | COPY binary {t_copy:6.2f}s"
+                    f" ({n_rows / t_copy:,.0f} rows/s, x{t_sql / t_copy:.1f}) | chunked {t_iter:6.2f}s"
+                )
+        finally:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {TABLE};")
+
+
+if __name__ == "__main__":
+    main([int(s) for s in sys.argv[1:]] or SIZES)
@@ -0,0 +1,150 @@
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, timedelta
+
+SCHEMA = "bench_daily_range"
+# every pooled connection of the handler works in the scratch schema, in UTC
+os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA},public -c TimeZone=UTC"
+sys.path.insert(0, "daily-mental-insights/get")
+
+from psycopg2.extras import Json
+from src.utils.db import connect, close_pool
+from src.utils.response_cache import RESPONSE_CACHE
+from src.utils import partial_day
+import src.handlers.get_daily_insights_handler as daily
+
+"""
+A dashboard month: one GET /daily-mental-insights?date= per day vs. one start/end range request
+(get_daily_insights_handler). The stored days are fake daily_insights rows, the last --pending days only
+have unprocessed rows and go through the on-the-fly fallback, once one after another (1 worker) and once
+concurrently. Caches are cleared before every run. Every stored day also has an older row with other values,
+and its SHAP features and correlations differ. Checks that the range response has the same insights (both fields,
+the latest row of a day) as the per-day responses, page after page, and that the stored days are the latest rows.
+Exits with 1 when they differ.
+Everything runs in this one process, so the per-invocation cost the range request saves in Lambda
+(a cold/warm invocation, API Gateway and a pooled connection per day) is not part of the timings.
+Tables live in a scratch schema (bench_daily_range) that is dropped afterwards.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_daily_range.py [--days 30] [--pending 4]`
+"""
+
+DAYS    = 30
+PENDING = 4
+START   = date(2024, 5, 1)
+SHAP    = {"stress_level": 5.4, "air_quality_index": 0.35, "sleep_hours": 0.16, "mood_score": 0.13, "crowd_density_lag_13": 0.18}
+PEARSON = {"stress_level": 0.83, "air_quality_index": 0.4, "sleep_hours": -0.39, "noise_level_db_lag_34": -0.38, "mood_score": -0.32}
+STALE   = {"stress_level": 0.0} # an older row of the same day, never returned
+
+
+#
+def fill_tables(conn, days: int, pending: int):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}, public;")
+        cur.execute(open("db/init.sql").read())
+        stored = days - pending
+        cur.execute("""
+            INSERT INTO daily_insights (insight_date, top_stress_features_shap, correlations_pearson, created_at)
+            SELECT %s::date + g, v.shap, v.pearson, CURRENT_TIMESTAMP - v.age
+            FROM generate_series(0, %s - 1) g,
+                 (VALUES (%s::jsonb, %s::jsonb, INTERVAL '0'), (%s::jsonb, %s::jsonb, INTERVAL '1 day')) v(shap, pearson, age)
+        """, (START, stored, Json(SHAP), Json(PEARSON), Json(STALE), Json(STALE)))
+        cur.execute("""
+            INSERT INTO incoming_data (timestamp, location_id, temperature_celsius, humidity_percent, air_quality_index,
+                                       noise_level_db, lighting_lux, crowd_density, stress_level, sleep_hours,
+                                       mood_score, mental_health_status, processed)
+            SELECT %s::timestamptz + g * INTERVAL '15 minutes', 100 + mod(g, 6), 15 + random() * 15, 40 + random() * 40,
+                   (random() * 150)::int, 40 + random() * 40, 100 + random() * 400, (random() * 60)::int,
+                   (random() * 80)::int, 4 + random() * 6, random() * 3, (random() * 2)::int, g < %s
+            FROM generate_series(0, %s - 1) g
+        """, (START, stored * 96, days * 96))
+    conn.commit()
+
+
+#
+def call(params: dict) -> dict:
+    response = daily.lambda_handler({"queryStringParameters": params}, None)
+    if response["statusCode"] != 200:
+        raise RuntimeError(f"{params}: {response['statusCode']} {response['body']}")
+    return json.loads(response["body"])
+
+
+#
+def cold():
+    RESPONSE_CACHE.local.clear()
+    partial_day.clear()
+
+
+#
+def per_day(days: int) -> dict:
+    out = {}
+    for i in range(days):
+        body = call({"date": (START + timedelta(days=i)).isoformat()})
+        out[body["insight_date"]] = (body["top_stress_features_shap"], body["correlations_pearson"])
+    return out
+
+
+#
+def ranged(days: int, limit: int) -> dict:
+    params = {"start": START.isoformat(), "end": (START + timedelta(days=days - 1)).isoformat(), "limit": str(limit)}
+    out, cursor = {}, None
+    while True:
+        body = call({**params, **({"cursor": cursor} if cursor else {})})
+        out.update({i["insight_date"]: (i["top_stress_features_shap"], i["correlations_pearson"]) for i in body["insights"]})
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return out
+
+
+#
+def timed(fn):
+    cold()
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+#
+def main(days=DAYS, pending=PENDING) -> int:
+    conn = connect()
+    failures = []
+    try:
+        fill_tables(conn, days, pending)
+        print(f"{days} day(s), {days - pending} stored, {pending} computed on the fly")
+        call({"date": START.isoformat()}) # model, pool and handler warm-up
+
+        reference, per_day_s = timed(lambda: per_day(days))
+        print(f"  {days} single day requests     {per_day_s:7.2f} s")
+        latest = [START + timedelta(days=i) for i in range(days - pending)]
+        if any(reference[d.isoformat()] != (SHAP, PEARSON) for d in latest):
+            failures.append("single day requests: a stored day is not its latest row (SHAP, correlations)")
+        for workers in (1, daily.FALLBACK_WORKERS):
+            daily.FALLBACK_WORKERS = workers
+            for limit in (days, 7):
+                result, range_s = timed(lambda: ranged(days, limit))
+                pages = -(-days // limit)
+                print(f"  range, {pages:2d} page(s), {workers} fallback worker(s) {range_s:7.2f} s (x{per_day_s / range_s:.1f})")
+                if result != reference:
+                    failures.append(f"{pages} page(s), {workers} worker(s): insights differ from the single day requests")
+    finally:
+        close_pool()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-day GET requests vs. one start/end range request.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--pending", type=int, default=PENDING)
+    args = parser.parse_args()
+    sys.exit(main(args.days, args.pending))
@@ -0,0 +1,80 @@
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from src.model.preprocess import INDEX, preprocess, max_lag
+from src.model.model_runner import get_model
+from src.utils.lag_state import next_tail
+from src.utils.feature_store import write_day, read_day, _frame
+from synthetic_data import generate
+
+"""
+Feature store (src/utils/feature_store.py) vs. preprocessing the history again, on synthetic data
+(scripts/synthetic_data.py) in a temporary directory. Days are preprocessed one after another (after the
+lag tail of the day before) and written as partitions, then the whole history is read back memory-mapped.
+Prints the time of a full-history preprocess, of writing the partitions and of reading them, and checks
+that the frame read back is bit-identical to the frame that was written. Exits with 1 when it is not.
+No database needed: the partitions get dummy source keys (incoming_day_versions is not part of this).
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_feature_store.py [--days 365]`
+"""
+
+DAYS    = 365
+REPEATS = 3
+
+
+#
+def main(days=DAYS) -> int:
+    feat_cols = get_model().feature_names
+    depth     = max_lag(feat_cols)
+    raw       = generate(days)
+    day_frames = [(day, df_day.reset_index(drop=True)) for day, df_day in raw.groupby(raw[INDEX].dt.date)]
+    root      = tempfile.mkdtemp(prefix="feature_store_")
+    failures  = []
+    try:
+        start = time.perf_counter()
+        full = preprocess(raw, model_features=feat_cols, compact=True)
+        full_s = time.perf_counter() - start
+
+        start, written, history = time.perf_counter(), [], None
+        for day, df_day in day_frames:
+            proc_df = preprocess(df_day, model_features=feat_cols, compact=True, history=history)
+            history = next_tail(df_day, history, depth)
+            write_day(day, proc_df, feat_cols, {"source": str(day), "history": None}, root)
+            written.append(proc_df)
+        write_s = time.perf_counter() - start
+        written = pd.concat(written)
+
+        read_s = None
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            stored = _frame([read_day(day, feat_cols, {"source": str(day), "history": None}, root) for day, _ in day_frames], feat_cols)
+            elapsed = time.perf_counter() - start
+            read_s = elapsed if read_s is None else min(read_s, elapsed)
+
+        print(f"{days} day(s), {len(raw)} rows, {len(stored)} preprocessed rows")
+        print(f"  full-history preprocess  {full_s:8.3f} s")
+        print(f"  per day + write          {write_s:8.3f} s")
+        print(f"  memory-mapped read       {read_s:8.3f} s (x{full_s / read_s:.1f} vs. preprocess)")
+
+        if not stored.index.equals(written.index) or not np.array_equal(stored.to_numpy(), written.to_numpy()):
+            failures.append("the stored frame differs from the written one")
+        same = np.mean(stored.loc[full.index.intersection(stored.index)].to_numpy() == full.loc[stored.index.intersection(full.index)].to_numpy())
+        print(f"  {same:.2%} of the stored values equal to the full-history preprocess")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Feature store reads vs. preprocessing again.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    sys.exit(main(parser.parse_args().days))
@@ -0,0 +1,123 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from src.model.preprocess import DEFAULT_LAG_COLS, LAG_PERIODS, preprocess, add_discovered_lag_features
+from src.model.model_runner import get_model
+from src.model.lag_discovery import clear_cache
+from synthetic_data import generate
+
+"""
+ACF/PACF lag stages: the statsmodels versions they replace (one column and period at a time, columns inserted
+one by one, copied below) vs. add_discovered_lag_features (src/model/lag_discovery.py: batched FFT ACF,
+Durbin-Levinson PACF, one pass for all columns), on synthetic data (scripts/synthetic_data.py) preprocessed
+for the model. The new stages are timed without (cold) and with (warm) a cached discovery.
+Checks that both add the same columns, the lags with the same values and the rolling means within float
+rounding (they are differences of cumulative sums instead of pandas' running window sums).
+Exits with 1 when they differ. Needs statsmodels (requirements.txt), the Lambda functions do not.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_lag_discovery.py [--days 365]`
+"""
+
+DAYS    = 365
+REPEATS = 3
+
+
+#
+def statsmodels_acf_stage(df, cols, period='', max_lag=48) -> pd.DataFrame:
+    from statsmodels.tsa.stattools import acf
+    df = df.copy()
+    for col in cols:
+        series = df[col].resample(period).mean() if period else df[col]
+        series = series.dropna()
+        adjusted_lag = min(max_lag, (len(series) // 3) - 1)
+        if adjusted_lag < 1:
+            continue
+        acf_vals   = acf(series, nlags=adjusted_lag, fft=True)
+        threshold  = 1.96 / np.sqrt(len(series))
+        cutoff_lag = next((i for i, v in enumerate(acf_vals[1:], start=1) if abs(v) < threshold), 4)
+        if cutoff_lag > 1:
+            if period:
+                cutoff_lag = int(cutoff_lag * (pd.Timedelta(period).total_seconds() / 60) / 15)
+            df[f'{col}_ma_lag_{cutoff_lag}'] = df[col].rolling(window=cutoff_lag, min_periods=1).mean()
+    return df
+
+
+#
+def statsmodels_pacf_stage(df, cols, period='', max_lag=48) -> pd.DataFrame:
+    from statsmodels.tsa.stattools import pacf
+    df = df.copy()
+    for col in cols:
+        series = df[col].resample(period).mean() if period else df[col]
+        series = series.dropna()
+        adjusted_lag = min(max_lag, (len(series) // 3) - 1)
+        if adjusted_lag < 1:
+            continue
+        pacf_vals = pacf(series, nlags=adjusted_lag)
+        threshold = 1.96 / np.sqrt(len(series))
+        for lag in [i for i, v in enumerate(pacf_vals[1:], start=1) if abs(v) > threshold]:
+            if period:
+                lag = int(lag * (pd.Timedelta(period).total_seconds() / 60) / 15)
+            df[f'{col}_lag_{lag}'] = df[col].shift(lag)
+    return df
+
+
+#
+def statsmodels_stages(df, cols) -> pd.DataFrame:
+    for period in LAG_PERIODS:
+        df = statsmodels_acf_stage(df, cols, period)
+    for period in LAG_PERIODS:
+        df = statsmodels_pacf_stage(df, cols, period)
+    return df
+
+
+#
+def best_time(fn) -> tuple[float, pd.DataFrame]:
+    best, out = None, None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+#
+def main(days=DAYS) -> int:
+    feat_cols = get_model().feature_names
+    frame     = preprocess(generate(days), model_features=feat_cols)
+    failures  = []
+    print(f"{days} day(s), {len(frame)} rows, {len(DEFAULT_LAG_COLS)} lag columns, periods {LAG_PERIODS}")
+
+    old_s, old = best_time(lambda: statsmodels_stages(frame, DEFAULT_LAG_COLS))
+    cold_s, _  = best_time(lambda: (clear_cache(), add_discovered_lag_features(frame, DEFAULT_LAG_COLS))[1])
+    warm_s, new = best_time(lambda: add_discovered_lag_features(frame, DEFAULT_LAG_COLS))
+    added = sorted(set(new.columns) - set(frame.columns))
+    print(f"  statsmodels, column by column  {old_s:8.3f} s")
+    print(f"  batched, discovery             {cold_s:8.3f} s (x{old_s / cold_s:.1f})")
+    print(f"  batched, cached discovery      {warm_s:8.3f} s (x{old_s / warm_s:.1f})")
+    print(f"  {len(added)} column(s) added")
+
+    if added != sorted(set(old.columns) - set(frame.columns)):
+        failures.append("the added columns differ from the statsmodels stages")
+    else:
+        for col in added:
+            same = (
+                np.allclose(new[col], old[col], rtol=1e-9, atol=1e-9, equal_nan=True) if "_ma_lag_" in col
+                else new[col].equals(old[col])
+            )
+            if not same:
+                failures.append(f"{col} differs from the statsmodels stages")
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched ACF/PACF lag stages vs. the statsmodels ones.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    sys.exit(main(parser.parse_args().days))
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET, preprocess
+from src.model.model_runner import get_model
+from src.utils.stats import get_abs_shap_matrix, get_correlation_matrix, top_shap_from_matrix
+from src.utils.aggregates import merge_aggregates
+from src.utils.locations import LOCATION_COLUMN, location_aggregates, location_insights
+from synthetic_data import generate
+
+"""
+Per-location insights (src/utils/locations.py) on synthetic data (scripts/synthetic_data.py):
+- times location_aggregates in-process and with 2..N worker processes (N = cores, or the arguments)
+- checks that every worker count gives the same per-location sums, that the merged sums reproduce the
+  all-locations SHAP, and that each location's insights match a naive recompute on that location's rows alone.
+  The references average |SHAP| in float64 like the merged sums (get_shap_values averages the float32 matrix,
+  which drifts in the 4th decimal over ~10^4 rows). Exits with 1 when a check fails.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_locations.py [--days N] [workers ...]`
+"""
+
+DAYS   = 365
+N_FEAT = 5
+RTOL   = 1e-6
+ATOL   = 1.01e-4 # one unit of the API rounding
+
+
+#
+def naive_location_insights(proc_df: pd.DataFrame, model) -> dict:
+    """Each location's insights from its own rows, one SHAP call per location (the reference)."""
+    insights = {}
+    for loc, loc_df in proc_df.groupby(LOCATION_COLUMN):
+        X = loc_df.drop(columns=[TARGET])
+        correlations = get_correlation_matrix(loc_df.drop(columns=[LOCATION_COLUMN]), n_feat=len(X.columns))
+        insights[int(loc)] = {
+            "top_stress_features_shap": top_shap_from_matrix(X.columns, get_abs_shap_matrix(X, model).astype(np.float64), N_FEAT),
+            "correlations_pearson": dict([(k, v) for k, v in correlations.items() if v == v][:N_FEAT]),
+        }
+    return insights
+
+
+#
+def same_sums(a: dict, b: dict) -> bool:
+    if a.keys() != b.keys():
+        return False
+    for loc in a:
+        if a[loc]["row_count"] != b[loc]["row_count"]:
+            return False
+        x = np.array([a[loc]["shap_abs_sum"][c] for c in a[loc]["shap_abs_sum"]])
+        y = np.array([b[loc]["shap_abs_sum"][c] for c in a[loc]["shap_abs_sum"]])
+        if not np.allclose(x, y, rtol=RTOL, atol=0):
+            return False
+        if not np.allclose(a[loc]["tod_sums"].to_numpy(), b[loc]["tod_sums"].to_numpy(), rtol=RTOL, equal_nan=True):
+            return False
+    return True
+
+
+#
+def main(days=DAYS, worker_counts=None) -> int:
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    proc_df = preprocess(generate(days), model_features=feat_cols)
+    n_locations = proc_df[LOCATION_COLUMN].nunique()
+    print(f"{days} day(s), {len(proc_df)} preprocessed rows, {n_locations} locations, {os.cpu_count()} core(s)")
+
+    failures = []
+    start = time.perf_counter()
+    reference = location_aggregates(proc_df, model_entry.path, workers=1)
+    base_s = time.perf_counter() - start
+    print(f"  in-process            {base_s:8.2f} s")
+
+    for workers in worker_counts or range(2, (os.cpu_count() or 1) + 1):
+        start = time.perf_counter()
+        result = location_aggregates(proc_df, model_entry.path, workers=workers)
+        elapsed = time.perf_counter() - start
+        print(f"  {workers:2d} worker process(es) {elapsed:8.2f} s (x{base_s / elapsed:.2f})")
+        if not same_sums(reference, result):
+            failures.append(f"{workers} workers: per-location sums differ from the in-process ones")
+
+    merged = merge_aggregates(list(reference.values()))
+    X = proc_df.drop(columns=[TARGET])
+    overall = get_abs_shap_matrix(X, model).mean(axis=0, dtype=np.float64)
+    for feature, value in zip(X.columns, overall):
+        mean = merged["shap_abs_sum"][feature] / merged["row_count"]
+        if not np.isclose(mean, value, rtol=1e-5, atol=1e-9):
+            failures.append(f"merged mean |SHAP| of {feature}: {mean:.6f} vs {value:.6f}")
+
+    start = time.perf_counter()
+    naive = naive_location_insights(proc_df, model)
+    print(f"  naive per-location    {time.perf_counter() - start:8.2f} s ({n_locations} SHAP calls)")
+    insights = location_insights(reference, n_feat=N_FEAT)
+    for loc in naive:
+        for key in ("top_stress_features_shap", "correlations_pearson"):
+            got, want = insights[loc][key], naive[loc][key]
+            if got.keys() != want.keys() or any(abs(got[k] - want[k]) > ATOL for k in want):
+                failures.append(f"location {loc} {key}: {got} vs {want}")
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    days = DAYS
+    if args[:1] == ["--days"]:
+        days, args = int(args[1]), args[2:]
+    sys.exit(main(days, [int(a) for a in args] or None))
@@ -0,0 +1,58 @@
+import os
+import sys
+import shutil
+import tempfile
+import time
+from src.model.model_runner import MODEL_PATH, get_model, clear_model_cache, save_binary_model
+
+"""
+Cold vs. warm model load times through the model registry, for the JSON model and its UBJSON copy.
+Cold = first get_model() in a fresh container (parse the file), warm = every later invocation (cache hit).
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_model_load.py [--write-ubj]`
+--write-ubj also stores the .ubj next to the layer's JSON model, so get_model() picks it up.
+"""
+
+REPEATS = 20
+
+
+#
+def time_get_model(path: str) -> tuple[float, float]:
+    """Best-of cold load and mean warm lookup for path, in seconds."""
+    cold = []
+    for _ in range(REPEATS):
+        clear_model_cache()
+        start = time.perf_counter()
+        get_model(path)
+        cold.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        get_model(path)
+    warm = (time.perf_counter() - start) / REPEATS
+
+    return min(cold), warm
+
+
+#
+def main(write_ubj=False):
+    tmp_dir   = tempfile.mkdtemp()
+    json_path = os.path.join(tmp_dir, "xgb_model.json")
+    shutil.copy(MODEL_PATH, json_path)
+
+    try:
+        # the JSON run has to happen before the .ubj sibling exists, get_model would prefer it
+        for label in ("json", "ubj"):
+            path = json_path if label == "json" else save_binary_model(json_path)
+            cold, warm = time_get_model(path)
+            print(f"{label:<5} {os.path.getsize(path) / 1024:8.0f} KiB | cold {cold * 1000:8.2f} ms | warm {warm * 1e6:8.1f} us")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    if write_ubj:
+        print(f"Wrote {save_binary_model(MODEL_PATH)}")
+
+
+if __name__ == "__main__":
+    main(write_ubj="--write-ubj" in sys.argv[1:])
@@ -0,0 +1,109 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET, repair_outliers, remove_target_outliers, flip_outlier_sign
+
+"""
+Checks that the vectorized outlier repair matches the original loop implementations
+and times both at a few dataset sizes. Also checks that a sign-flip outlier in the last row
+(no right neighbor, the loop raised IndexError there) is left as it is.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_outlier_repair.py`
+"""
+
+CSV_PATH = "assets/university_mental_health_iot_dataset.csv"
+SIZES    = [1_000, 100_000, 1_000_000]
+
+
+#
+def legacy_remove_target_outliers(df: pd.DataFrame) -> pd.DataFrame:
+    """Original loop implementation (reference only)."""
+    df = df.copy()
+    outlier_indices = df[df[TARGET] == 2].index
+
+    for ts in outlier_indices:
+        idx = df.index.get_loc(ts)
+
+        if 0 < idx < len(df) - 1:
+            before_val = df.iloc[idx - 1][TARGET]
+            after_val = df.iloc[idx + 1][TARGET]
+            df.at[ts, TARGET] = max(before_val, after_val)
+
+    return df
+
+
+#
+def legacy_flip_outlier_sign(df: pd.DataFrame, col='mood_score', iqr_coef=1.5) -> pd.DataFrame:
+    """Original loop implementation (reference only)."""
+    df = df.copy()
+
+    q25, q75 = df[col].quantile([0.25, 0.75])
+    iqr      = q75 - q25
+    lq, uq   = q25 - iqr_coef * iqr, q75 + iqr_coef * iqr
+
+    outlier_mask = (df[col] < lq) | (df[col] > uq)
+    mc_outlier_timestamps = df.index[outlier_mask]
+
+    for ts in mc_outlier_timestamps:
+        idx = df.index.get_loc(ts)
+        val_before  = df.iloc[idx-1]['mood_score']
+        val_after   = df.iloc[idx+1]['mood_score']
+        val_current = df.iloc[idx]['mood_score']
+        neighbor_sign = np.sign(val_before + val_after)
+        if min(abs(val_after), abs(val_before)) <= abs(val_current) <= max(abs(val_after), abs(val_before)):
+            if np.sign(val_current) != neighbor_sign and neighbor_sign != 0:
+                df.iloc[idx, df.columns.get_loc('mood_score')] *= -1
+    return df
+
+
+#
+def make_frame(n_rows: int, seed=0) -> pd.DataFrame:
+    """Resamples the bundled CSV to n_rows at a 15 minute cadence, with extra outliers injected."""
+    rng = np.random.default_rng(seed)
+    src = pd.read_csv(CSV_PATH).drop(columns=["timestamp"])
+    df  = src.sample(n=n_rows, replace=True, random_state=seed).reset_index(drop=True)
+    df.index = pd.date_range("2024-05-01", periods=n_rows, freq="15min", name="timestamp")
+
+    # runs of target outliers and sign flips, including the first/last rows
+    df.loc[df.index[rng.choice(n_rows, n_rows // 50, replace=False)], TARGET] = 2
+    df.iloc[[0, 1, 2], df.columns.get_loc(TARGET)] = 2
+    df.iloc[-1, df.columns.get_loc(TARGET)] = 2
+    flips = rng.choice(np.arange(1, n_rows - 1), n_rows // 50, replace=False)
+    df.iloc[flips, df.columns.get_loc("mood_score")] *= -1
+    df.iloc[0, df.columns.get_loc("mood_score")] = -2.9
+    df.iloc[-1, df.columns.get_loc("mood_score")] = 1.5 # the loop version cannot repair the last row
+    return df
+
+
+#
+def timed(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - start
+
+
+#
+def main(sizes=SIZES):
+    for n_rows in sizes:
+        df = make_frame(n_rows)
+
+        legacy, t_legacy = timed(lambda d: legacy_flip_outlier_sign(legacy_remove_target_outliers(d)), df)
+        fast, t_fast     = timed(repair_outliers, df)
+        staged           = flip_outlier_sign(remove_target_outliers(df))
+
+        pd.testing.assert_frame_equal(fast, legacy)
+        pd.testing.assert_frame_equal(staged, legacy)
+
+        print(f"{n_rows:>9} rows | loop {t_legacy:8.3f}s | vectorized {t_fast:8.4f}s | x{t_legacy / t_fast:,.0f}")
+
+    df = make_frame(1_000)
+    # between its left neighbor and the first row: flipped if the first row were taken as its right neighbor
+    df.iloc[[0, -2, -1], df.columns.get_loc("mood_score")] = [9.0, 10.0, -9.5]
+    assert repair_outliers(df)["mood_score"].iloc[-1] == -9.5, "the last row was repaired without a right neighbor"
+    print("last row outlier left unrepaired")
+
+
+if __name__ == "__main__":
+    main([int(s) for s in sys.argv[1:]] or SIZES)
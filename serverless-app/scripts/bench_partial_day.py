@@ -0,0 +1,133 @@
+import sys
+import time
+import threading
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.db import connect
+from src.utils.data_access import read_incoming, day_range, UNPROCESSED_DAY
+from src.utils.lag_state import load_tail
+from src.model.preprocess import preprocess, max_lag
+from src.model.model_runner import get_model
+from src.utils.stats import get_correlation_matrix, get_shap_values
+from src.utils import partial_day
+
+"""
+Polling a day that is not over yet: memoized/delta fallback (src/utils/partial_day.py) vs. the full
+recompute the GET handler used to run on every call. Rows arrive in batches between polls,
+every poll checks that both give the same result. Ends with concurrent polls of one snapshot,
+which must share a single computation.
+Tables live in a scratch schema (bench_partial_day) that is dropped afterwards.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_partial_day.py [rows_per_day]`
+"""
+
+ROWS_PER_DAY = 1440 # one row a minute
+POLLS        = 20
+SCHEMA       = "bench_partial_day"
+DAY          = date(2024, 5, 2)
+THREADS      = 8
+
+
+#
+def session(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {SCHEMA}, public; SET TimeZone = 'UTC';")
+    return conn
+
+
+#
+def insert_rows(conn, first: int, n_rows: int):
+    """Rows first .. first + n_rows - 1 of DAY, one minute apart."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO incoming_data (timestamp, location_id, temperature_celsius, humidity_percent, air_quality_index,
+                                       noise_level_db, lighting_lux, crowd_density, stress_level, sleep_hours,
+                                       mood_score, mental_health_status, processed)
+            SELECT %s::timestamptz + g * INTERVAL '1 minute', 100 + mod(g, 6), 15 + random() * 15, 40 + random() * 40,
+                   (random() * 150)::int, 40 + random() * 40, 100 + random() * 400, (random() * 60)::int,
+                   (random() * 80)::int, 4 + random() * 6, random() * 3, (random() * 2)::int, FALSE
+            FROM generate_series(%s, %s) g
+        """, (DAY, first, first + n_rows - 1))
+    conn.commit()
+
+
+#
+def full_recompute(conn):
+    feat_cols = get_model().feature_names
+    history = load_tail(conn, DAY, max_lag(feat_cols))
+    proc_df = preprocess(read_incoming(conn, UNPROCESSED_DAY, day_range(DAY)), model_features=feat_cols, history=history)
+    X = proc_df.drop(columns=["mental_health_status"])
+    return get_shap_values(X, n_feat=5), get_correlation_matrix(proc_df, n_feat=5)
+
+
+#
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+#
+def main(rows_per_day=ROWS_PER_DAY):
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+        session(conn)
+        cur.execute(open("db/init.sql").read())
+    conn.commit()
+    get_model()
+
+    try:
+        first_batch = rows_per_day // 2
+        batch = (rows_per_day - first_batch) // POLLS
+        insert_rows(conn, 0, first_batch)
+        t_full_total = t_memo_total = 0.0
+        for poll in range(POLLS + 1):
+            if poll:
+                insert_rows(conn, first_batch + (poll - 1) * batch, batch)
+            timings = []
+            for repeat in range(2): # the second call sees no new rows
+                full, t_full = timed(lambda: full_recompute(conn))
+                memo, t_memo = timed(lambda: partial_day.partial_day_insights(conn, DAY))
+                assert memo == full, (poll, memo, full)
+                t_full_total += t_full
+                t_memo_total += t_memo
+                timings.append(t_memo)
+            print(
+                f"poll {poll:>2}: {first_batch + poll * batch:>5} rows | full {t_full * 1000:7.1f} ms"
+                f" | new rows {timings[0] * 1000:7.1f} ms | unchanged {timings[1] * 1000:5.1f} ms"
+            )
+
+        print(f"total: full recompute {t_full_total:.2f}s, memoized {t_memo_total:.2f}s (x{t_full_total / t_memo_total:.1f})")
+        print(f"counters: {partial_day.stats()}")
+
+        # concurrent polls of a new snapshot share one computation
+        insert_rows(conn, first_batch + POLLS * batch, batch)
+        before = dict(partial_day.COUNTERS)
+        partial_day.clear() # a full recompute, so the concurrent calls overlap
+        conns = [session(connect()) for _ in range(THREADS)]
+        barrier = threading.Barrier(THREADS)
+
+        def poll_together(c):
+            barrier.wait()
+            return partial_day.partial_day_insights(c, DAY)
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            results = list(pool.map(poll_together, conns))
+        for c in conns:
+            c.close()
+        computed = sum(partial_day.COUNTERS[k] - before[k] for k in ("delta", "full", "hits"))
+        shared   = partial_day.COUNTERS["shared"] - before["shared"]
+        assert all(r == results[0] for r in results) and results[0] == full_recompute(conn)
+        print(f"{THREADS} concurrent polls: {computed} computation(s), {shared} served from the shared one")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main(*[int(s) for s in sys.argv[1:2]])
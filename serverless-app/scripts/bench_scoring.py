@@ -0,0 +1,83 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import xgboost as xgb
+from src.model.model_runner import get_model, predict_proba
+from src.utils.scoring import features
+from synthetic_data import generate
+
+"""
+Scoring throughput (rows/s) of the three ways to predict with the model, on synthetic data (scripts/synthetic_data.py)
+preprocessed the way the scoring endpoint does it (src/utils/scoring.py, NaN kept):
+- model.predict(DataFrame): the sklearn wrapper, also in-place for a frame, plus its checks and conversions per call
+- booster.predict(DMatrix(X)): a DMatrix built per call from the float32 matrix
+- in-place: model_runner.predict_proba, booster.inplace_predict on the float32 matrix, per thread count
+  (the thread count is set once, changing it costs a booster reconfiguration on the next call)
+Each is timed on batches of --batch rows (a request body) and on the whole frame at once (a date range).
+Checks that every way predicts the same labels (and in-place the same probabilities as the DMatrix).
+Exits with 1 when they differ.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_scoring.py [--days 365] [--batch 96]`
+"""
+
+DAYS    = 365
+BATCH   = 96 # one day of one sensor
+REPEATS = 3
+
+
+#
+def best_rate(fn, batches: list) -> tuple[float, np.ndarray]:
+    """Best-of-REPEATS rows/s of fn over every batch, and its concatenated output."""
+    rows, best = sum(len(b) for b in batches), None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        out = [fn(b) for b in batches]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return rows / best, np.concatenate(out)
+
+
+#
+def main(days=DAYS, batch=BATCH) -> int:
+    entry     = get_model()
+    model     = entry.model
+    booster   = model.get_booster()
+    frame     = features(generate(days), entry.feature_names)[entry.feature_names]
+    X         = frame.to_numpy(dtype=np.float32)
+    cpus      = os.cpu_count() or 1
+    failures  = []
+    print(f"{days} day(s), {len(X)} rows x {X.shape[1]} features, {cpus} core(s)")
+
+    for label, size in ((f"batches of {batch}", batch), ("whole frame", len(X))):
+        starts = range(0, len(X), size)
+        frames = [frame.iloc[i:i + size] for i in starts]
+        arrays = [X[i:i + size] for i in starts]
+        print(f"  {label}")
+
+        rate, labels = best_rate(model.predict, frames)
+        print(f"    model.predict(DataFrame)        {rate:12,.0f} rows/s")
+        rate, dmatrix = best_rate(lambda a: booster.predict(xgb.DMatrix(a, feature_names=entry.feature_names)), arrays)
+        print(f"    booster.predict(DMatrix)        {rate:12,.0f} rows/s")
+        for nthread in sorted({1, cpus}):
+            rate, inplace = best_rate(lambda a: predict_proba(model, a, nthread), arrays)
+            print(f"    in-place, {nthread:2d} thread(s)           {rate:12,.0f} rows/s")
+            if not np.array_equal(inplace, dmatrix):
+                failures.append(f"{label}, {nthread} thread(s): in-place probabilities differ from the DMatrix ones")
+            if not np.array_equal((inplace > 0.5).astype(np.int64), labels):
+                failures.append(f"{label}, {nthread} thread(s): in-place labels differ from model.predict")
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scoring throughput: sklearn wrapper vs. DMatrix vs. in-place prediction.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--batch", type=int, default=BATCH)
+    args = parser.parse_args()
+    sys.exit(main(args.days, args.batch))
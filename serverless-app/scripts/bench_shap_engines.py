@@ -0,0 +1,65 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.model.preprocess import preprocess
+from src.model.model_runner import get_model
+from src.utils.stats import get_abs_shap_matrix, get_shap_values
+
+"""
+Compares the native (pred_contribs) and shap library engines of get_shap_values:
+mean |SHAP| per feature must agree within TOLERANCE (scaled by the largest value)
+and the top N features must be the same set. Prints timings of both.
+The shap engine explains against summarize_background(X) (SHAP_BACKGROUND, SHAP_BACKGROUND_ROWS).
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_shap_engines.py [rows ...]`
+"""
+
+CSV_PATH   = "assets/university_mental_health_iot_dataset.csv"
+SIZES      = [1_000, 10_000]
+TOLERANCE  = 0.05
+N_FEAT     = 5
+
+
+#
+def load_rows(n_rows: int) -> pd.DataFrame:
+    """Bundled CSV repeated to n_rows, re-stamped at a 15 minute cadence."""
+    src = pd.read_csv(CSV_PATH)
+    df  = src.iloc[np.arange(n_rows) % len(src)].reset_index(drop=True)
+    df["timestamp"] = pd.date_range("2024-05-01 08:00", periods=n_rows, freq="15min")
+    return df
+
+
+#
+def main(sizes=SIZES):
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    failed = False
+
+    for n_rows in sizes:
+        X = preprocess(load_rows(n_rows), model_features=feat_cols).drop(columns=["mental_health_status"])
+
+        timings, summaries = {}, {}
+        for engine in ("shap", "native"):
+            start = time.perf_counter()
+            summaries[engine] = get_abs_shap_matrix(X, model, engine=engine).mean(axis=0)
+            timings[engine]   = time.perf_counter() - start
+
+        ref, fast = summaries["shap"], summaries["native"]
+        scaled_diff = np.abs(ref - fast).max() / ref.max()
+        same_top    = set(get_shap_values(X, model, N_FEAT, engine="shap")) == set(get_shap_values(X, model, N_FEAT, engine="native"))
+        ok = scaled_diff <= TOLERANCE and same_top
+        failed |= not ok
+
+        print(
+            f"{len(X):>8} rows | shap {timings['shap']:7.3f}s | native {timings['native']:7.3f}s"
+            f" | x{timings['shap'] / timings['native']:.0f} | max scaled diff {scaled_diff:.4f}"
+            f" | same top-{N_FEAT}: {same_top} | {'OK' if ok else 'FAIL'}"
+        )
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main([int(s) for s in sys.argv[1:]] or SIZES)
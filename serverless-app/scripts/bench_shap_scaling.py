@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from src.model.preprocess import TARGET, preprocess
+from src.model.model_runner import get_model
+from src.utils.stats import top_shap_features
+from src.utils.shap_pool import SHAP_CHUNK_ROWS, SHAP_EXECUTORS, shap_abs_sum
+from synthetic_data import generate
+
+"""
+Scaling of the chunked |SHAP| sums (src/utils/shap_pool.py) from 1 to N workers, for both executors,
+on synthetic data (scripts/synthetic_data.py). Prints wall time, speedup and parallel efficiency per
+worker count, and checks that every run returns bit-identical sums to the 1-worker run and the same top
+N ranking as one unchunked pass. Exits with 1 when a check fails.
+Process workers pay a spawn + model transfer of ~1-2 s per call, which only pays off on large inputs.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_shap_scaling.py [--days 1825] [--workers 1 2 4] [--chunk-rows 50000]`
+"""
+
+DAYS    = 1825
+REPEATS = 2
+N_FEAT  = 5
+
+
+#
+def timed(fn, repeats=REPEATS):
+    best, out = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return out, best
+
+
+#
+def main(days=DAYS, worker_counts=None, chunk_rows=SHAP_CHUNK_ROWS, executors=SHAP_EXECUTORS) -> int:
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    X = preprocess(generate(days), model_features=feat_cols, compact=True).drop(columns=[TARGET])
+    worker_counts = worker_counts or list(range(1, (os.cpu_count() or 1) + 1))
+    print(f"{days} day(s), {len(X)} rows, chunks of {chunk_rows} rows, {os.cpu_count()} core(s)")
+
+    unchunked = shap_abs_sum(X, model, chunk_rows=len(X), workers=1)
+    reference_top = list(top_shap_features(dict(zip(X.columns, unchunked)), len(X), N_FEAT))
+    failures = []
+
+    for executor in executors:
+        base_sums, base_s = None, None
+        for workers in worker_counts:
+            sums, elapsed = timed(lambda: shap_abs_sum(X, model, chunk_rows=chunk_rows, workers=workers, executor=executor))
+            if base_sums is None:
+                base_sums, base_s = sums, elapsed
+            speedup = base_s / elapsed
+            print(
+                f"  {executor:<8} {workers:2d} worker(s) {elapsed:8.2f} s {len(X) / elapsed:>12,.0f} rows/s"
+                f" | x{speedup:.2f} | efficiency {speedup / workers:.0%}"
+            )
+            if not np.array_equal(sums, base_sums):
+                failures.append(f"{executor} {workers} workers: sums differ from 1 worker by {np.abs(sums - base_sums).max():.2e}")
+            top = list(top_shap_features(dict(zip(X.columns, sums)), len(X), N_FEAT))
+            if top != reference_top:
+                failures.append(f"{executor} {workers} workers: top {N_FEAT} {top} vs {reference_top}")
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunked SHAP scaling from 1 to N workers.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--workers", type=int, nargs="*", help="worker counts (default: 1 to the number of cores)")
+    parser.add_argument("--chunk-rows", type=int, default=SHAP_CHUNK_ROWS)
+    parser.add_argument("--executor", choices=SHAP_EXECUTORS, nargs="*", default=list(SHAP_EXECUTORS))
+    args = parser.parse_args()
+    sys.exit(main(args.days, args.workers, args.chunk_rows, args.executor))
@@ -0,0 +1,292 @@
+import gc
+import os
+import sys
+import json
+import time
+import platform
+import ctypes
+import argparse
+import resource
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from src.utils.db import connect
+from src.utils.data_access import read_incoming, copy_incoming, MODEL_COLUMNS
+from src.model.preprocess import TARGET, preprocess, repair_outliers, add_time_features, generate_required_lags
+from src.model.model_runner import get_model
+from src.utils.stats import get_shap_values, get_correlation_matrix
+from synthetic_data import generate
+
+"""
+Stage-level benchmark on synthetic data (scripts/synthetic_data.py), from one day to several years of rows.
+Every stage is timed on its own: the DB write (binary COPY) and read, preprocess and each of its sub-stages,
+get_shap_values and get_correlation_matrix. Per stage: best wall time of --repeats runs, rows/s,
+and peak RSS while it ran (Linux resets the high-water mark before each run, elsewhere it is the process peak).
+Results are saved as JSON and compared with a stored baseline: a stage regresses when it is slower than
+--max-slowdown x baseline or grows RSS by more than --max-rss-growth x baseline (small absolute changes are
+ignored as noise). Exits with 1 on a regression. The baseline is machine specific, refresh it with --save-baseline.
+DB stages use a scratch schema (bench_stages) that is dropped afterwards, --no-db skips them.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/bench_stages.py [days ...] [--no-db] [--save-baseline]`
+"""
+
+SIZES          = [1, 30, 365, 1825] # days of 96 rows
+REPEATS        = 3
+SCHEMA         = "bench_stages"
+RESULTS_PATH   = "bench_stages_results.json"
+BASELINE_PATH  = "scripts/bench_stages_baseline.json"
+MAX_SLOWDOWN   = 1.5 # run-to-run noise on a shared host is up to ~1.4x
+MAX_RSS_GROWTH = 1.3
+MIN_WALL_S     = 0.02 # differences below these are noise
+MIN_RSS_MB     = 16.0
+WRITE_ROWS     = 100_000 # rows per frame handed to copy_incoming, like the CSV loader
+
+
+#
+def _status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+#
+def release_free_memory():
+    """Hands freed heap back to the OS (glibc), so a stage's RSS growth does not depend on what ran before it."""
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+#
+def reset_peak_rss() -> bool:
+    """Resets the process RSS high-water mark (Linux >= 4.0), False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+#
+def peak_rss_mb() -> float:
+    peak = _status_mb("VmHWM")
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+#
+def current_rss_mb() -> float:
+    rss = _status_mb("VmRSS")
+    return rss if rss is not None else peak_rss_mb()
+
+
+#
+def measure(fn, n_rows: int, repeats: int, setup=None) -> tuple[object, dict]:
+    """Runs fn repeats times, returns its last output and the stage metrics."""
+    walls, peaks, growths = [], [], []
+    out = None
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        out = None
+        release_free_memory()
+        exact = reset_peak_rss()
+        rss_start = current_rss_mb()
+        start = time.perf_counter()
+        out = fn()
+        walls.append(time.perf_counter() - start)
+        peaks.append(peak_rss_mb())
+        growths.append(max(peaks[-1] - rss_start, 0.0))
+
+    wall = min(walls)
+    return out, {
+        "wall_s":        round(wall, 6),
+        "rows_per_s":    round(n_rows / wall) if wall > 0 else None,
+        "peak_rss_mb":   round(max(peaks), 1),
+        "rss_growth_mb": round(max(growths), 1),
+        "rss_exact":     exact,
+    }
+
+
+#
+def prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """What preprocess does before its pipeline: copy, drop processed, timestamp index."""
+    df = df.copy().drop(columns=["processed"], errors="ignore")
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df.set_index("timestamp")
+
+
+#
+def db_session(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}, public;")
+        cur.execute(open("db/init.sql").read())
+    conn.commit()
+
+
+#
+def db_drop(conn):
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    conn.commit()
+
+
+#
+def run_size(days: int, repeats: int, conn=None) -> dict:
+    df = generate(days)
+    n_rows = len(df)
+    stages = {}
+
+    def stage(name, fn, setup=None):
+        out, stages[name] = measure(fn, n_rows, repeats, setup)
+        return out
+
+    if conn is not None:
+        def truncate():
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE incoming_data")
+            conn.commit()
+
+        def write():
+            copy_incoming(conn, (df[i:i + WRITE_ROWS] for i in range(0, n_rows, WRITE_ROWS)), MODEL_COLUMNS)
+            conn.commit()
+
+        stage("db.write", write, setup=truncate)
+        read = stage("db.read", lambda: read_incoming(conn, columns=MODEL_COLUMNS))
+        assert len(read) == n_rows
+
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+
+    prepared = stage("preprocess.prepare", lambda: prepare(df))
+    repaired = stage("preprocess.repair_outliers", lambda: repair_outliers(prepared))
+    timed    = stage("preprocess.add_time_features", lambda: add_time_features(repaired))
+    lagged   = stage("preprocess.generate_required_lags", lambda: generate_required_lags(timed, feature_list=feat_cols))
+    staged   = stage("preprocess.dropna", lambda: lagged.dropna())
+    proc_df  = stage("preprocess", lambda: preprocess(df, model_features=feat_cols))
+    pd.testing.assert_frame_equal(staged, proc_df) # the sub-stages still add up to preprocess
+
+    X = proc_df.drop(columns=[TARGET])
+    stage("get_shap_values", lambda: get_shap_values(X, model, n_feat=5))
+    stage("get_correlation_matrix", lambda: get_correlation_matrix(proc_df, n_feat=5))
+
+    return {"rows": n_rows, "stages": stages}
+
+
+#
+def environment(repeats: int, db: bool) -> dict:
+    import xgboost
+    return {
+        "created":  datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "machine":  platform.machine(),
+        "system":   platform.system(),
+        "cpus":     os.cpu_count(),
+        "python":   platform.python_version(),
+        "numpy":    np.__version__,
+        "pandas":   pd.__version__,
+        "xgboost":  xgboost.__version__,
+        "repeats":  repeats,
+        "db":       db,
+    }
+
+
+#
+def compare(results: dict, baseline: dict, max_slowdown=MAX_SLOWDOWN, max_rss_growth=MAX_RSS_GROWTH) -> list[str]:
+    """Regressions of results against baseline, as readable lines."""
+    regressions = []
+    for days, size in results["sizes"].items():
+        base = baseline["sizes"].get(days)
+        if base is None:
+            continue
+        for name, cur in size["stages"].items():
+            ref = base["stages"].get(name)
+            if ref is None:
+                continue
+            if cur["wall_s"] > max(ref["wall_s"] * max_slowdown, ref["wall_s"] + MIN_WALL_S):
+                regressions.append(
+                    f"{days}d {name}: {cur['wall_s']:.4f}s vs {ref['wall_s']:.4f}s (x{cur['wall_s'] / ref['wall_s']:.2f})"
+                )
+            if cur["rss_growth_mb"] > max(ref["rss_growth_mb"] * max_rss_growth, ref["rss_growth_mb"] + MIN_RSS_MB):
+                regressions.append(f"{days}d {name}: +{cur['rss_growth_mb']:.1f} MB RSS vs +{ref['rss_growth_mb']:.1f} MB")
+    return regressions
+
+
+#
+def print_size(days: str, size: dict, baseline: dict | None):
+    base = (baseline or {}).get("sizes", {}).get(days, {}).get("stages", {})
+    print(f"\n{days} day(s), {size['rows']} rows")
+    for name, cur in size["stages"].items():
+        ratio = f"x{cur['wall_s'] / base[name]['wall_s']:.2f}" if name in base and base[name]["wall_s"] else ""
+        print(
+            f"  {name:<36} {cur['wall_s'] * 1000:10.2f} ms {cur['rows_per_s'] or 0:>14,} rows/s"
+            f" | peak RSS {cur['peak_rss_mb']:7.1f} MB (+{cur['rss_growth_mb']:.1f}) {ratio:>7}"
+        )
+
+
+#
+def main(sizes=SIZES, repeats=REPEATS, db=True, out=RESULTS_PATH, baseline_path=BASELINE_PATH,
+         save_baseline=False, max_slowdown=MAX_SLOWDOWN, max_rss_growth=MAX_RSS_GROWTH) -> int:
+    baseline = None
+    if not save_baseline and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+    results = {"environment": environment(repeats, db), "sizes": {}}
+    conn = connect() if db else None
+    try:
+        if conn is not None:
+            db_session(conn)
+        get_model()
+        for days in sizes:
+            results["sizes"][str(days)] = run_size(days, repeats, conn)
+            print_size(str(days), results["sizes"][str(days)], baseline)
+    finally:
+        if conn is not None:
+            db_drop(conn)
+            conn.close()
+
+    with open(baseline_path if save_baseline else out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {baseline_path if save_baseline else out}")
+    if baseline is None:
+        return 0
+
+    env, base_env = results["environment"], baseline["environment"]
+    differs = [k for k in ("machine", "system", "cpus", "python", "numpy", "pandas", "xgboost") if env[k] != base_env.get(k)]
+    if differs:
+        print(f"Note: baseline was recorded on a different environment ({', '.join(differs)})")
+    regressions = compare(results, baseline, max_slowdown, max_rss_growth)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    print(f"{len(regressions)} regression(s) against {baseline_path} (created {base_env.get('created')})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage timings and peak RSS on synthetic data.")
+    parser.add_argument("days", type=int, nargs="*", default=SIZES, help="dataset sizes in days")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--no-db", action="store_true", help="skip the DB read/write stages")
+    parser.add_argument("--out", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--max-slowdown", type=float, default=MAX_SLOWDOWN)
+    parser.add_argument("--max-rss-growth", type=float, default=MAX_RSS_GROWTH)
+    args = parser.parse_args()
+
+    sys.exit(main(
+        args.days, args.repeats, not args.no_db, args.out, args.baseline,
+        args.save_baseline, args.max_slowdown, args.max_rss_growth
+    ))
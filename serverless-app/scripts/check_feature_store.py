@@ -0,0 +1,132 @@
+import sys
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET, preprocess
+from src.model.model_runner import get_model
+from src.utils.db import connect
+from src.utils.data_access import read_incoming, copy_incoming, session_timezone, MODEL_COLUMNS
+from src.utils.feature_store import load_features
+from src.utils.stats import get_correlation_matrix, get_shap_values
+from synthetic_data import iter_synthetic
+
+"""
+Checks the feature store of /process-mental-insights (FEATURE_STORE_DIR set, src/utils/feature_store.load_features:
+days preprocessed one at a time after the lag tail of the day before, stored, read back) against the whole history
+preprocessed at once with outliers repaired day by day (preprocess(repair_tz=...)), what the stored days add up to,
+on synthetic data (scripts/synthetic_data.py) in a scratch schema (feature_store_check, dropped afterwards) and a
+temporary store directory.
+For every session TimeZone (days are split in it):
+- store built from scratch, store read back, and a store in which one day changed (that day and the next are
+  rebuilt, their lag tail comes from incoming_data) must give the same frame as that per-day repaired preprocess
+  (same rows, same float32 features and target) and the same SHAP ranking and correlations
+- reports how many values also match the handler without a store (the whole history repaired at once)
+Exits with 1 when a check fails.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/check_feature_store.py [--days 30]`
+"""
+
+DAYS      = 30
+SCHEMA    = "feature_store_check"
+TIMEZONES = ["UTC", "America/New_York"]
+
+
+#
+def fill_table(conn, days: int):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}, public;")
+        cur.execute(open("db/init.sql").read())
+    copy_incoming(conn, iter_synthetic(days), MODEL_COLUMNS)
+    conn.commit()
+
+
+#
+def whole_history(conn, feat_cols, repair_tz) -> pd.DataFrame:
+    """The whole history preprocessed at once, repair_tz=None is /process-mental-insights without a store."""
+    return preprocess(read_incoming(conn), model_features=feat_cols, compact=True, repair_tz=repair_tz)
+
+
+#
+def same_frame(a: pd.DataFrame, b: pd.DataFrame, feat_cols) -> bool:
+    if not a.index.equals(b.index):
+        return False
+    return all(
+        np.array_equal(a[col].to_numpy(dtype=np.float32), b[col].to_numpy(dtype=np.float32), equal_nan=True)
+        for col in list(feat_cols) + [TARGET]
+    )
+
+
+#
+def insights(frame: pd.DataFrame, model) -> tuple:
+    X = frame.drop(columns=[TARGET])
+    return get_shap_values(X, model, n_feat=5), get_correlation_matrix(frame, n_feat=5)
+
+
+#
+def check(conn, feat_cols, model, root: str) -> tuple[list, float]:
+    """(failures, share of the values equal to the handler without a store) in the current session TimeZone."""
+    failures = []
+    shutil.rmtree(root, ignore_errors=True)
+    reference = whole_history(conn, feat_cols, session_timezone(conn))
+    runs = [
+        ("built", load_features(conn, feat_cols, root), reference),
+        ("read back", load_features(conn, feat_cols, root), reference),
+    ]
+    # one mood_score of a day in the middle changes: that day and the next one are rebuilt
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE incoming_data SET mood_score = -mood_score
+            WHERE id = (SELECT id FROM incoming_data ORDER BY timestamp OFFSET (SELECT COUNT(*) / 2 FROM incoming_data) LIMIT 1)
+        """)
+    conn.commit()
+    changed = whole_history(conn, feat_cols, session_timezone(conn))
+    runs.append(("one day changed", load_features(conn, feat_cols, root), changed))
+
+    for label, (frame, days), expected in runs:
+        if not same_frame(frame, expected, feat_cols):
+            failures.append(f"{label} ({days}): the stored frame differs from the per-day repaired preprocess")
+        elif insights(frame, model) != insights(expected, model):
+            failures.append(f"{label} ({days}): SHAP/correlations differ from the per-day repaired preprocess")
+        print(f"    {label:<16} {days}")
+
+    old  = whole_history(conn, feat_cols, None).reindex(changed.index)
+    same = np.mean(changed[list(feat_cols)].to_numpy(dtype=np.float32) == old[list(feat_cols)].to_numpy(dtype=np.float32))
+    return failures, same
+
+
+#
+def main(days=DAYS) -> int:
+    entry    = get_model()
+    root     = tempfile.mkdtemp(prefix="feature_store_check_")
+    conn     = connect()
+    failures = []
+    try:
+        for tz in TIMEZONES:
+            with conn.cursor() as cur:
+                cur.execute("SET TimeZone TO %s", (tz,))
+            fill_table(conn, days)
+            print(f"  TimeZone {tz}, {days} day(s)")
+            found, same = check(conn, entry.feature_names, entry.model, root)
+            failures += [f"{tz}: {line}" for line in found]
+            print(f"    {same:.2%} of the values also equal to the handler without a store (whole history repaired at once)")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Historical features with vs. without the feature store.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    sys.exit(main(parser.parse_args().days))
@@ -0,0 +1,82 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET, INDEX, preprocess, max_lag, repair_outliers, add_time_features, generate_required_lags
+from src.model.model_runner import get_model
+from src.utils.lag_state import LAG_COLUMNS, next_tail
+from synthetic_data import generate
+
+"""
+Checks the lag tail carry-over (src/utils/lag_state.py) on synthetic data (scripts/synthetic_data.py):
+days are preprocessed one at a time after the previous day's tail, the way the daily handler does it.
+- every day after the first keeps all of its rows (a day preprocessed alone loses its first max_lag rows)
+- the chained rows equal one pass over the whole range in which every day was repaired on its own,
+  i.e. the lags see exactly the rows they would with the full history read
+- reports how many values also match a full-history preprocess (outlier repair looks at the whole
+  frame there, so mood_score/target values near day edges or the IQR bounds can differ)
+Both dtype modes are checked. Exits with 1 when a check fails.
+
+Run from serverless-app/:
+`PYTHONPATH=layers/shared/python python3.11 scripts/check_lag_state.py [--days 30]`
+"""
+
+DAYS = 30
+
+
+#
+def per_day_reference(raw: pd.DataFrame, feat_cols, compact: bool) -> pd.DataFrame:
+    """Every day repaired on its own, then time features and lags over the concatenation."""
+    frame = raw.set_index(pd.to_datetime(raw[INDEX]))[LAG_COLUMNS]
+    repaired = pd.concat([repair_outliers(day) for _, day in frame.groupby(frame.index.date)])
+    proc = add_time_features(repaired, compact=compact)
+    return generate_required_lags(proc, feature_list=feat_cols, dtype=np.float32 if compact else np.float64).dropna()
+
+
+#
+def main(days=DAYS) -> int:
+    feat_cols = get_model().feature_names
+    depth     = max_lag(feat_cols)
+    raw       = generate(days)
+    day_frames = [df_day.reset_index(drop=True) for _, df_day in raw.groupby(raw[INDEX].dt.date)]
+    print(f"{days} day(s), {len(raw)} rows, max lag {depth}")
+    failures = []
+
+    for compact in (False, True):
+        label = "compact" if compact else "default"
+        start = time.perf_counter()
+        chained, alone, history = [], 0, None
+        for df_day in day_frames:
+            chained.append(preprocess(df_day, model_features=feat_cols, compact=compact, history=history))
+            alone  += len(preprocess(df_day, model_features=feat_cols, compact=compact))
+            history = next_tail(df_day, history, depth)
+        chained = pd.concat(chained)
+        elapsed = time.perf_counter() - start
+
+        sizes = chained.groupby(chained.index.date).size().iloc[1:]
+        short = int((sizes.to_numpy() < [len(d) for d in day_frames[1:]]).sum())
+        if short:
+            failures.append(f"{label}: {short} day(s) after the first lost rows")
+
+        reference = per_day_reference(raw, feat_cols, compact)
+        if not chained.index.equals(reference.index) or not np.array_equal(chained.to_numpy(), reference.to_numpy()):
+            failures.append(f"{label}: chained days differ from the per-day repaired reference")
+
+        full  = preprocess(raw, model_features=feat_cols, compact=compact).loc[chained.index]
+        same  = np.mean(chained.to_numpy() == full.to_numpy())
+        print(
+            f"  {label:<8} {len(chained):>7} rows kept (alone: {alone}) in {elapsed:.2f} s"
+            f" | {same:.2%} of the values equal to a full-history preprocess"
+        )
+
+    for line in failures:
+        print(f"FAIL {line}")
+    print("all checks passed" if not failures else f"{len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lag tail carry-over vs. full-history preprocessing.")
+    parser.add_argument("--days", type=int, default=DAYS)
+    sys.exit(main(parser.parse_args().days))
@@ -0,0 +1,160 @@
+import sys
+import json
+from datetime import date, timedelta
+from src.utils.db import connect
+from src.utils.data_access import select_incoming_sql, day_range, MODEL_COLUMNS, UNPROCESSED_DAY
+from migrate_incoming_data import INDEX_DDL, partition_incoming_data
+
+"""
+EXPLAIN check for the daily incoming_data lookups, on growing tables in both layouts
+(plain table + indexes, and monthly partitions after scripts/migrate_incoming_data.py --partition).
+Every lookup must stay bounded: no sequential scan outside the one partition of the target day, and the lag tail
+read (the LAG_ROWS rows before the day, src/utils/lag_state.py) a backward index scan without a Sort over the history
+(on the partitioned table a Merge Append that touches the top index pages of every earlier month, no row past the LIMIT).
+Buffers touched by the daily read are printed per size (next to the old DATE(timestamp) = %s query on an
+unindexed table), they should stay flat while the table grows.
+Tables live in a scratch schema (plan_check) that is dropped afterwards. Exits with 1 on an unbounded plan.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/check_query_plans.py [days ...]`
+"""
+
+DAYS    = [100, 1_000, 5_000] # 96 rows per day
+SCHEMA  = "plan_check"
+START   = date(2015, 1, 1)
+LAYOUTS = ["plain", "partitioned"]
+LAG_ROWS = 44 # max_lag of the model (air_quality_index_lag_44)
+
+
+#
+def fill_table(cur, n_days: int, layout: str):
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}, public;")
+    cur.execute(open("db/init.sql").read())
+    # everything is processed except the last two days
+    cur.execute("""
+        INSERT INTO incoming_data (timestamp, location_id, temperature_celsius, humidity_percent, air_quality_index,
+                                   noise_level_db, lighting_lux, crowd_density, stress_level, sleep_hours,
+                                   mood_score, mental_health_status, processed)
+        SELECT %s::timestamptz + g * INTERVAL '15 minutes', 100 + mod(g, 6), 15 + random() * 15, 40 + random() * 40,
+               (random() * 150)::int, 40 + random() * 40, 100 + random() * 400, (random() * 60)::int,
+               (random() * 80)::int, 4 + random() * 6, random() * 3, (random() * 2)::int, g < %s
+        FROM generate_series(0, %s - 1) g
+    """, (START, (n_days - 2) * 96, n_days * 96))
+    if layout == "partitioned":
+        partition_incoming_data(cur, months_ahead=1)
+        for ddl in INDEX_DDL:
+            cur.execute(ddl)
+    cur.execute("ANALYZE incoming_data")
+
+
+#
+def explain(cur, query: str, params=(), analyze=False) -> dict:
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({options}) {query}", params)
+    plan = cur.fetchone()[0]
+    return (json.loads(plan) if isinstance(plan, str) else plan)[0]
+
+
+#
+def scans(node: dict) -> list[tuple[str, str]]:
+    """(node type, relation) of every scan in the plan tree."""
+    out = [(node["Node Type"], node["Relation Name"])] if node["Node Type"].endswith("Scan") and "Relation Name" in node else []
+    for child in node.get("Plans", []):
+        out += scans(child)
+    return out
+
+
+#
+def node_types(node: dict) -> set[str]:
+    out = {node["Node Type"]}
+    for child in node.get("Plans", []):
+        out |= node_types(child)
+    return out
+
+
+#
+def is_bounded(plan: dict) -> bool:
+    """No Seq Scan, unless the whole query reads a single partition (pruned down to the target month)."""
+    found = scans(plan["Plan"])
+    relations = {rel for _, rel in found}
+    return all(kind != "Seq Scan" for kind, _ in found) or (len(relations) == 1 and "incoming_data" not in relations)
+
+
+#
+def is_top_n(plan: dict) -> bool:
+    """Bounded and read in index order: no Sort, so the scan stops after the LIMIT instead of reading every match."""
+    return is_bounded(plan) and "Sort" not in node_types(plan["Plan"])
+
+
+#
+def check(cur, n_days: int) -> dict:
+    target_date = START + timedelta(days=n_days - 2)
+    daily_sql = select_incoming_sql(cur, "incoming_data", ["id"] + MODEL_COLUMNS, UNPROCESSED_DAY, day_range(target_date), "timestamp")
+    legacy_sql = select_incoming_sql(cur, "incoming_data", ["id"] + MODEL_COLUMNS,
+                                     "DATE(timestamp) = %s AND processed = FALSE", [target_date], "timestamp")
+    tail_sql = select_incoming_sql(cur, "incoming_data", MODEL_COLUMNS, "timestamp < %s", [day_range(target_date)[0]],
+                                   "timestamp DESC", LAG_ROWS)
+    cur.execute(f"SELECT array_agg(id) FROM ({daily_sql}) d")
+    ids = cur.fetchone()[0]
+
+    daily = explain(cur, daily_sql, analyze=True)
+    plans = {
+        "daily read":   daily,
+        "earliest day": explain(cur, "SELECT MIN(timestamp)::date FROM incoming_data WHERE processed = FALSE"),
+        "mark processed": explain(
+            cur, "UPDATE incoming_data SET processed = TRUE WHERE id = ANY(%s) AND timestamp >= %s AND timestamp < %s",
+            (ids, *day_range(target_date))
+        ),
+    }
+    tail = explain(cur, tail_sql, analyze=True)
+    # what the handlers used to run, on the table as it used to be (no index)
+    cur.execute("SAVEPOINT legacy")
+    cur.execute("DROP INDEX incoming_data_unprocessed_ts_idx, incoming_data_ts_idx")
+    legacy = explain(cur, legacy_sql, analyze=True)
+    cur.execute("ROLLBACK TO SAVEPOINT legacy")
+    return {
+        "rows":           n_days * 96,
+        "bounded":        {**{name: is_bounded(plan) for name, plan in plans.items()}, "lag tail": is_top_n(tail)},
+        "buffers":        daily["Plan"]["Shared Hit Blocks"] + daily["Plan"]["Shared Read Blocks"],
+        "ms":             daily["Execution Time"],
+        "legacy_buffers": legacy["Plan"]["Shared Hit Blocks"] + legacy["Plan"]["Shared Read Blocks"],
+        "legacy_ms":      legacy["Execution Time"],
+        "partitions":     len({rel for _, rel in scans(daily["Plan"])}),
+        "tail_buffers":   tail["Plan"]["Shared Hit Blocks"] + tail["Plan"]["Shared Read Blocks"],
+    }
+
+
+#
+def main(days=DAYS):
+    failed = []
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET TimeZone = 'UTC'")
+            for layout in LAYOUTS:
+                for n_days in days:
+                    fill_table(cur, n_days, layout)
+                    result = check(cur, n_days)
+                    conn.commit()
+
+                    unbounded = [name for name, ok in result["bounded"].items() if not ok]
+                    failed += [f"{layout}/{n_days}d: {name}" for name in unbounded]
+                    print(
+                        f"{layout:<12} {result['rows']:>8} rows | daily read {result['buffers']:>5} buffers"
+                        f" {result['ms']:7.2f} ms, {result['partitions']} relation(s)"
+                        f" | lag tail {result['tail_buffers']:>4} buffers"
+                        f" | before (DATE(timestamp) = %s, no index): {result['legacy_buffers']:>5} buffers {result['legacy_ms']:7.2f} ms"
+                        f" | {'OK' if not unbounded else 'UNBOUNDED: ' + ', '.join(unbounded)}"
+                    )
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main([int(s) for s in sys.argv[1:]] or DAYS)
@@ -1,50 +1,136 @@
-import os
+import time
+import argparse
+import numpy as np
 import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_values
-from src.utils.db import get_connection 
-
-
-CSV_PATH = "assets/university_mental_health_iot_dataset.csv"
-
-def load_csv_to_incoming_table(csv_path=CSV_PATH):
-    df = pd.read_csv(csv_path)
-    df["processed"] = False
-    df["timestamp"] = pd.to_datetime(df["timestamp"])
-
-    rows = [
-    (
-        row.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-        row.location_id,
-        row.temperature_celsius,
-        row.humidity_percent,
-        row.air_quality_index,
-        row.noise_level_db,
-        row.lighting_lux,
-        row.crowd_density,
-        row.stress_level,
-        row.sleep_hours,
-        row.mood_score,
-        row.mental_health_status,
-        row.processed
-    )
-    for row in df.itertuples(index=False)
-    ]
-
-    insert_sql = """
-        INSERT INTO incoming_data (
-            timestamp, location_id, temperature_celsius, humidity_percent,
-            air_quality_index, noise_level_db, lighting_lux, crowd_density,
-            stress_level, sleep_hours, mood_score, mental_health_status, processed
-        ) VALUES %s
+from src.utils.db import get_connection
+from src.utils.data_access import copy_incoming
+from migrate_incoming_data import INDEX_DDL, TRIGGER_DDL
+
+"""
+Bulk loader for incoming_data.
+CSV files are read in bounded chunks, type-checked, and streamed straight into
+`COPY incoming_data FROM STDIN (FORMAT binary)`, so memory stays flat however large the files are.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/load_csv_to_db.py [file.csv ...] [--chunk-rows N] [--staging]`
+--staging loads into incoming_data_staging first and swaps it in for incoming_data in one transaction
+(replaces the table contents, readers never see a half loaded table). The swapped in table gets the indexes
+under their incoming_data names and the incoming_day_versions triggers, and every day of the old and the new
+contents gets a new version, so the feature store rebuilds them.
+"""
+
+CSV_PATH   = "assets/university_mental_health_iot_dataset.csv"
+CHUNK_ROWS = 100_000
+STAGING    = "incoming_data_staging"
+
+INT_COLUMNS   = ["location_id", "air_quality_index", "crowd_density", "stress_level", "mental_health_status"]
+FLOAT_COLUMNS = ["temperature_celsius", "humidity_percent", "noise_level_db", "lighting_lux", "sleep_hours", "mood_score"]
+COLUMNS       = ["timestamp"] + INT_COLUMNS + FLOAT_COLUMNS + ["processed"]
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+
+
+#
+def coerce_chunk(df: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """
+    Validates and coerces one CSV chunk to the incoming_data types.
+    Unparseable numbers become NULL (ints must be whole and fit INT), rows without a valid timestamp are rejected.
+    Returns the clean chunk and the number of rejected rows.
+    """
+    missing = [c for c in ["timestamp"] + INT_COLUMNS + FLOAT_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"CSV is missing columns: {missing}")
+
+    out = pd.DataFrame({"timestamp": pd.to_datetime(df["timestamp"], errors="coerce")})
+    for col in FLOAT_COLUMNS:
+        out[col] = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+    for col in INT_COLUMNS:
+        values = pd.to_numeric(df[col], errors="coerce").astype(np.float64)
+        valid  = (values % 1 == 0) & values.between(INT32_MIN, INT32_MAX)
+        out[col] = values.where(valid)
+    out["processed"] = False
+
+    keep = out["timestamp"].notna()
+    return out[keep], int((~keep).sum())
+
+
+#
+def iter_chunks(csv_paths, chunk_rows, stats):
+    """Clean chunks of every file in order, rejected rows are counted into stats."""
+    for path in csv_paths:
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            clean, rejected = coerce_chunk(chunk)
+            stats["rejected"] += rejected
+            yield clean
+
+
+#
+def swap_in_staging(cur):
     """
+    Replaces incoming_data with the staging table (the id sequence moves over with it).
+    CREATE TABLE (LIKE ... INCLUDING ALL) copies the indexes under generated names and no triggers: the copies
+    are renamed after the index with the same definition on incoming_data, the triggers are created again, and
+    the days of both tables get a new version (COPY into the staging table did not bump them).
+    """
+    cur.execute(f"""
+        WITH defs AS (
+            SELECT tablename, indexname,
+                   regexp_replace(indexdef, '^CREATE (UNIQUE )?INDEX \\S+ ON \\S+ ', '') AS def,
+                   row_number() OVER (PARTITION BY tablename, regexp_replace(indexdef, '^CREATE (UNIQUE )?INDEX \\S+ ON \\S+ ', '')
+                                      ORDER BY indexname) AS n
+            FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename IN ('incoming_data', '{STAGING}')
+        )
+        SELECT c.indexname, o.indexname
+        FROM defs c JOIN defs o USING (def, n)
+        WHERE c.tablename = '{STAGING}' AND o.tablename = 'incoming_data'
+    """)
+    renames = dict(cur.fetchall())
+    cur.execute(f"""
+        INSERT INTO incoming_day_versions (day, version)
+        SELECT DATE(timestamp), pg_current_xact_id()::text::bigint FROM incoming_data
+        UNION SELECT DATE(timestamp), pg_current_xact_id()::text::bigint FROM {STAGING}
+        ON CONFLICT (day) DO UPDATE SET version = EXCLUDED.version;
+        ALTER SEQUENCE incoming_data_id_seq OWNED BY {STAGING}.id;
+        DROP TABLE incoming_data;
+        ALTER TABLE {STAGING} RENAME TO incoming_data;
+    """)
+    for copy, orig in renames.items():
+        cur.execute(f"ALTER INDEX {copy} RENAME TO {orig}")
+    for ddl in INDEX_DDL + TRIGGER_DDL:
+        cur.execute(ddl)
 
 
+#
+def load_csv_to_incoming_table(csv_paths=(CSV_PATH,), chunk_rows=CHUNK_ROWS, staging=False):
+    stats = {"rejected": 0}
+    start = time.perf_counter()
 
     with get_connection() as conn:
         with conn.cursor() as cur:
-            execute_values(cur, insert_sql, rows)
-            print(f"Inserted {len(rows)} rows into incoming_data.")
+            table = "incoming_data"
+            if staging:
+                cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = 'incoming_data'::regclass")
+                if cur.fetchone()[0]:
+                    raise ValueError("--staging would drop the partitioning of incoming_data, load it directly instead")
+                table = STAGING
+                cur.execute(f"DROP TABLE IF EXISTS {STAGING}; CREATE TABLE {STAGING} (LIKE incoming_data INCLUDING ALL);")
+
+            rows = copy_incoming(conn, iter_chunks(csv_paths, chunk_rows, stats), COLUMNS, table=table)
+
+            if staging:
+                swap_in_staging(cur)
+
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {rows} rows into incoming_data ({stats['rejected']} rejected) "
+          f"in {elapsed:.2f}s, {rows / elapsed:,.0f} rows/s.")
+    return rows
+
 
 if __name__ == "__main__":
-    load_csv_to_incoming_table()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Stream CSV files into incoming_data.")
+    parser.add_argument("csv_paths", nargs="*", default=[CSV_PATH])
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--staging", action="store_true")
+    args = parser.parse_args()
+    load_csv_to_incoming_table(args.csv_paths, args.chunk_rows, args.staging)
@@ -0,0 +1,145 @@
+import argparse
+from datetime import date, timedelta
+from psycopg2 import sql
+from src.utils.db import get_connection
+
+"""
+Brings an existing incoming_data table up to the current access path, safe to re-run.
+- always: the indexes from db/init.sql (partial index for unprocessed rows, btree on timestamp, replacing the
+  BRIN index older versions created) and the triggers
+  that keep incoming_day_versions (the function comes from db/init.sql)
+- --partition: converts incoming_data into a table range-partitioned by month on timestamp
+  (one transaction, rows are copied over, ids and the id sequence are kept). Rows outside every
+  month partition land in incoming_data_default.
+- on a partitioned table: adds month partitions up to --months-ahead months after today/the newest row,
+  rows already sitting in the default partition for those months are moved into them.
+  Run it (e.g. monthly) before the data reaches the last partition.
+
+Month bounds are midnights in the session TimeZone, use the same TimeZone as the handlers (UTC on Lambda)
+so a day never spans two partitions.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/migrate_incoming_data.py [--partition] [--months-ahead N]`
+"""
+
+TABLE        = "incoming_data"
+MONTHS_AHEAD = 3
+
+INDEX_DDL = [
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_unprocessed_ts_idx ON {TABLE} (timestamp) WHERE processed = FALSE",
+    f"CREATE INDEX IF NOT EXISTS {TABLE}_ts_idx ON {TABLE} (timestamp)",
+    f"DROP INDEX IF EXISTS {TABLE}_ts_brin_idx", # could not serve the lag tail top-N
+]
+
+# statement triggers with transition tables, also allowed on a partitioned table
+TRIGGER_DDL = [
+    f"""
+    DROP TRIGGER IF EXISTS {TABLE}_versions_{event} ON {TABLE};
+    CREATE TRIGGER {TABLE}_versions_{event} AFTER {event.upper()} ON {TABLE}
+      REFERENCING {tables} FOR EACH STATEMENT EXECUTE FUNCTION bump_incoming_day_versions();
+    """
+    for event, tables in [
+        ("insert", "NEW TABLE AS new_rows"),
+        ("update", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+        ("delete", "OLD TABLE AS old_rows"),
+    ]
+]
+
+
+#
+def is_partitioned(cur, table=TABLE) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+#
+def month_starts(first: date, last: date):
+    """First day of every month from first's month to last's month, inclusive."""
+    month = first.replace(day=1)
+    while month <= last:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+#
+def add_month_partition(cur, month: date, parent=TABLE) -> bool:
+    """
+    Attaches the [month, next month) partition of parent unless it exists.
+    Rows of that month already in the default partition are moved into it first (ATTACH would refuse otherwise).
+    """
+    name = f"{TABLE}_{month:%Y_%m}"
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cur.fetchone()[0]:
+        return False
+
+    start, end = month, (month + timedelta(days=32)).replace(day=1)
+    ident, default = sql.Identifier(name), sql.Identifier(f"{TABLE}_default")
+    cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(ident, sql.Identifier(parent)))
+    cur.execute(sql.SQL("""
+        WITH moved AS (DELETE FROM {default} WHERE timestamp >= %s AND timestamp < %s RETURNING *)
+        INSERT INTO {part} SELECT * FROM moved
+    """).format(default=default, part=ident), (start, end))
+    cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM ({}) TO ({})").format(
+        sql.Identifier(parent), ident, sql.Literal(str(start)), sql.Literal(str(end))
+    ))
+    return True
+
+
+#
+def add_month_partitions(cur, months_ahead=MONTHS_AHEAD, parent=TABLE, source=TABLE) -> int:
+    """Month partitions covering the rows of source up to months_ahead months past today (or the newest row)."""
+    cur.execute(sql.SQL("SELECT MIN(timestamp)::date, MAX(timestamp)::date FROM {}").format(sql.Identifier(source)))
+    first, last = cur.fetchone()
+    today = date.today()
+    last  = max(last or today, today)
+    for _ in range(months_ahead):
+        last = (last.replace(day=1) + timedelta(days=32)).replace(day=1)
+    return sum(add_month_partition(cur, month, parent) for month in month_starts(first or today, last))
+
+
+#
+def partition_incoming_data(cur, months_ahead=MONTHS_AHEAD) -> int:
+    """Rebuilds incoming_data as a monthly range-partitioned table, returns the number of month partitions."""
+    staging = f"{TABLE}_partitioned"
+    cur.execute(f"""
+        LOCK TABLE {TABLE} IN ACCESS EXCLUSIVE MODE;
+        CREATE TABLE {staging} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (timestamp);
+        ALTER TABLE {staging} ADD PRIMARY KEY (id, timestamp);
+        CREATE TABLE {TABLE}_default PARTITION OF {staging} DEFAULT;
+    """)
+    # partitions first, so the copy routes every row straight to its month
+    n_partitions = add_month_partitions(cur, months_ahead, parent=staging, source=TABLE)
+    cur.execute(f"""
+        INSERT INTO {staging} SELECT * FROM {TABLE};
+        ALTER SEQUENCE {TABLE}_id_seq OWNED BY {staging}.id;
+        DROP TABLE {TABLE};
+        ALTER TABLE {staging} RENAME TO {TABLE};
+        ALTER INDEX {staging}_pkey RENAME TO {TABLE}_pkey;
+    """)
+    return n_partitions
+
+
+#
+def migrate(partition=False, months_ahead=MONTHS_AHEAD):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if partition and not is_partitioned(cur):
+                n_partitions = partition_incoming_data(cur, months_ahead)
+                print(f"Partitioned {TABLE} by month ({n_partitions} partitions + default).")
+            elif is_partitioned(cur):
+                n_partitions = add_month_partitions(cur, months_ahead)
+                print(f"Added {n_partitions} month partitions to {TABLE}.")
+
+            for ddl in INDEX_DDL + TRIGGER_DDL:
+                cur.execute(ddl)
+            cur.execute(f"ANALYZE {TABLE}")
+    print(f"{TABLE} indexes and triggers are up to date.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add the incoming_data indexes and (optionally) monthly partitions.")
+    parser.add_argument("--partition", action="store_true")
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    args = parser.parse_args()
+    migrate(args.partition, args.months_ahead)
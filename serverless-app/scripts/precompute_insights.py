@@ -1,90 +1,289 @@
 import os
 import sys
-import json
+import time
+import argparse
+import multiprocessing
+from datetime import date, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import pandas as pd
-from datetime import datetime
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 from src.utils.db import get_connection
-from src.model.preprocess import preprocess
-from src.model.model_runner import load_model
-from src.utils.stats import get_correlation_matrix, get_shap_values
+from src.utils.data_access import read_incoming, day_range, earliest_unprocessed_date, MODEL_COLUMNS, UNPROCESSED_DAY
+from src.model.preprocess import preprocess, max_lag
+from src.model.model_runner import get_model
+from src.utils.stats import get_correlation_matrix, top_shap_features
+from src.utils.response_cache import invalidate_insights
+from src.utils.metrics import invocation, span
+from src.utils.aggregates import (
+    merge_aggregates, save_daily_aggregates, historical_shap_from_aggregates,
+    time_of_day_rows, save_time_of_day_rows, correlations_for_range
+)
+from src.utils.locations import (
+    location_aggregates, location_day_rows, save_location_days, location_historical_from_aggregates,
+    save_location_historical
+)
+from src.utils.lag_state import load_tail, next_tail, save_tails
+from src.utils.feature_store import FEATURE_STORE_DIR, day_versions, source_key, load_day, write_day, stored_frame
+
+"""
+Without arguments: daily insights for the earliest unprocessed date, then historical insights.
+With --start/--end: backfill every complete unprocessed day of the range. The rows are read once,
+days are computed in a process pool, results are written in bulk every --commit-days days,
+and historical_insights is rebuilt once at the end. Per-location rows (src/utils/locations.py)
+are written alongside, from the same SHAP pass. Each day is preprocessed after the lag tail of
+the day before (src/utils/lag_state.py), taken from the same read inside the range. With FEATURE_STORE_DIR set,
+days already in the feature store (src/utils/feature_store.py) are not preprocessed again and the others
+are added to it. Committed days are marked processed,
+so an interrupted backfill is resumed by running it again.
+
+Run:
+`PYTHONPATH=layers/shared/python python3.11 scripts/precompute_insights.py [--start YYYY-MM-DD --end YYYY-MM-DD] [--workers N]`
+"""
+
+FULL_DAY_ROWS = 96 # 15 min intervals, same rule as the daily process handler
+COMMIT_DAYS   = 10
+
+
+#
+def compute_day(target_date, df: pd.DataFrame, history=None, store_key=None) -> dict:
+    """
+    Everything stored for one day, computed from its unprocessed rows (also runs in backfill workers).
+    history is the lag tail of the day before (lag_state.load_tail / next_tail), store_key the day's
+    feature store key (feature_store.source_key, None without a store). Insights are computed on the
+    float32 frame the store returns (feature_store.stored_frame), with or without a store.
+    """
+    start = time.perf_counter()
+    model_entry = get_model()
+    model, feat_cols = model_entry.model, model_entry.feature_names
+    proc_df = load_day(target_date, feat_cols, store_key) if store_key is not None else None
+    if proc_df is None:
+        with span("preprocess", rows=len(df)):
+            proc_df = stored_frame(preprocess(df, model_features=feat_cols, compact=True, history=history), feat_cols)
+        if store_key is not None:
+            write_day(target_date, proc_df, feat_cols, store_key)
+    X         = proc_df.drop(columns=["mental_health_status"])
+    with span("shap", rows=len(X)):
+        # days are the unit of parallelism here, one location chunk per day
+        per_location = location_aggregates(proc_df, model_entry.path, workers=1)
+        daily_agg    = merge_aggregates(list(per_location.values()))
+    with span("correlation", rows=len(proc_df)):
+        correlations = get_correlation_matrix(proc_df, n_feat=5)
+        tod_rows     = time_of_day_rows(target_date, proc_df)
+        location_day, location_tod = location_day_rows(target_date, per_location, n_feat=5)
+
+    return {
+        "insight_date": target_date,
+        "ids": df["id"].tolist(),
+        "top_stress_features_shap": top_shap_features(daily_agg["shap_abs_sum"], daily_agg["row_count"], n_feat=5),
+        "correlations_pearson": correlations,
+        "aggregate": daily_agg,
+        "time_of_day_rows": tod_rows,
+        "location_rows": location_day,
+        "location_time_of_day_rows": location_tod,
+        "lag_tail": next_tail(df, history, max_lag(feat_cols)),
+        "seconds": time.perf_counter() - start,
+    }
+
+
+#
+def save_days(cur, results: list[dict]):
+    """Writes the results of compute_day in bulk and marks their rows processed."""
+    with span("db.write", rows=sum(len(r["ids"]) for r in results)):
+        _save_days(cur, results)
+
+
+#
+def _save_days(cur, results: list[dict]):
+    dates = [r["insight_date"] for r in results]
+    execute_values(cur, """
+        INSERT INTO daily_insights (insight_date, top_stress_features_shap, correlations_pearson)
+        VALUES %s
+    """, [(r["insight_date"], Json(r["top_stress_features_shap"]), Json(r["correlations_pearson"])) for r in results])
+    save_daily_aggregates(cur, [(r["insight_date"], r["aggregate"]) for r in results])
+    save_time_of_day_rows(cur, dates, [row for r in results for row in r["time_of_day_rows"]])
+    save_location_days(
+        cur, dates,
+        [row for r in results for row in r["location_rows"]],
+        [row for r in results for row in r["location_time_of_day_rows"]]
+    )
+    save_tails(cur, [(r["insight_date"], r["lag_tail"]) for r in results], max_lag(get_model().feature_names))
+
+    ids = [i for r in results for i in r["ids"]]
+    cur.execute(
+        "UPDATE incoming_data SET processed = TRUE WHERE id = ANY(%s) AND timestamp >= %s AND timestamp < %s;",
+        (ids, day_range(min(dates))[0], day_range(max(dates))[1])
+    )
+
+
+#
+def _locations(results: list[dict]) -> set:
+    return {row[1] for r in results for row in r["location_rows"]}
+
+
+#
+def save_historical(conn, end_date) -> str:
+    """Historical insights merged from the stored per-day aggregates up to end_date, returns their time range."""
+    with span("historical"):
+        hist = historical_shap_from_aggregates(conn, end_date, n_feat=5)
+        corr_map_all = correlations_for_range(conn, end_date=end_date, n_feat=5)
+        location_rows = location_historical_from_aggregates(conn, end_date, n_feat=5)
+
+    with span("db.write_historical"), conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO historical_insights (time_range, top_stress_features_shap, correlations_pearson, days_analyzed)
+            VALUES (%s, %s, %s, %s);
+        """, (hist["time_range"], Json(hist["top_stress_features_shap"]), Json(corr_map_all), hist["days_analyzed"]))
+        save_location_historical(cur, location_rows)
+    conn.commit()
+    invalidate_insights(locations=[row[0] for row in location_rows])
+    return hist["time_range"]
 
 
 def main():
     try:
         with get_connection() as conn:
             # Get earliest unprocessed date
-            date_query = """
-                SELECT MIN(DATE(timestamp)) AS earliest_date
-                FROM incoming_data
-                WHERE processed = FALSE
-            """
-            target_date = pd.read_sql(date_query, conn).iloc[0]["earliest_date"]
-
-            if target_date is pd.NaT or pd.isnull(target_date):
+            target_date = earliest_unprocessed_date(conn)
+
+            if target_date is None:
                 print("!===No unprocessed data remaining.\n")
                 return
             print(f"===Processing insights for earliest unprocessed date: {target_date}\n")
             # Fetch unprocessed rows
-            query_daily = """
-                SELECT * FROM incoming_data
-                WHERE DATE(timestamp) = %s AND processed = FALSE
-                ORDER BY timestamp
-            """
-            df = pd.read_sql(query_daily, conn, params=[target_date])
+            with span("db.read") as s:
+                df = read_incoming(
+                    conn, UNPROCESSED_DAY, day_range(target_date),
+                    columns=["id"] + MODEL_COLUMNS
+                )
+                s.rows = len(df)
             if df.empty:
                 print(f"!===No unprocessed data found for {target_date}\n")
                 return
 
-            proc_df   = df.copy()
+            store_key = source_key(day_versions(conn, target_date - timedelta(days=1), target_date), target_date) \
+                if FEATURE_STORE_DIR else None
+            result = compute_day(target_date, df, load_tail(conn, target_date, max_lag(get_model().feature_names)), store_key)
+            with conn.cursor() as cur:
+                save_days(cur, [result])
+            conn.commit()
+            invalidate_insights(target_date, locations=_locations([result]))
 
-            model     = load_model("assets/xgb_model.json")
-            feat_cols = model.get_booster().feature_names
-            proc_df   = preprocess(proc_df, model_features=feat_cols)
-            X         = proc_df.drop(columns=["mental_health_status"])
+            print(f"===Daily insights saved for {target_date}\n")
 
-            corr_map = get_correlation_matrix(proc_df, n_feat=5)
-            top_features = get_shap_values(X, model, n_feat=5)
+            # Historical insights, merged from the stored per-day aggregates
+            time_range = save_historical(conn, target_date)
 
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO daily_insights (insight_date, top_stress_features_shap, correlations_pearson)
-                    VALUES (%s, %s, %s);
-                """, (target_date, Json(top_features), Json(corr_map)))
+            print(f"===Historical insights updated for range: {time_range}\n")
 
-                ids = df["id"].tolist()
-                cur.execute("UPDATE incoming_data SET processed = TRUE WHERE id = ANY(%s);", (ids,))
-                conn.commit()
+    except Exception as e:
+        print(f"Error: {e}")
+
+
+#
+def _init_worker():
+    # one XGBoost thread per process, the pool already uses every core
+    get_model().model.get_booster().set_param({"nthread": 1})
 
-            print(f"===Daily insights saved for {target_date}\n")
 
-            # Historical insights
-            df_all = pd.read_sql("SELECT * FROM incoming_data WHERE processed = TRUE", conn)
-            if df_all.empty:
-                print("No processed data available for historical insights.")
+#
+def backfill(start_date: date, end_date: date, workers=None, commit_days=COMMIT_DAYS):
+    try:
+        start = time.perf_counter()
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SHOW TimeZone")
+                tz = cur.fetchone()[0]
+                cur.execute("SELECT insight_date FROM daily_insights WHERE insight_date BETWEEN %s AND %s", (start_date, end_date))
+                existing = {row[0] for row in cur.fetchall()}
+
+            # one read for the whole range, split into days the way DATE(timestamp) does (session TimeZone)
+            with span("db.read") as s:
+                df = read_incoming(
+                    conn, UNPROCESSED_DAY, (start_date, day_range(end_date)[1]),
+                    columns=["id"] + MODEL_COLUMNS
+                )
+                s.rows = len(df)
+            days, skipped = [], []
+            for day, df_day in df.groupby(df["timestamp"].dt.tz_convert(tz).dt.date):
+                if day in existing or len(df_day) < FULL_DAY_ROWS:
+                    skipped.append(day)
+                else:
+                    days.append((day, df_day.reset_index(drop=True)))
+            print(f"===Backfilling {len(days)} days ({len(df)} rows read), skipping {len(skipped)} partial/existing days\n")
+            if not days:
                 return
 
-            df_all = preprocess(df_all, model_features=feat_cols)
-            X_all  = df_all.drop(columns=["mental_health_status"])
-            top_features_all = get_shap_values(X_all, model, n_feat=5)
-            corr_map_all     = get_correlation_matrix(df_all, n_feat=5)
+            # lag tails in day order: from the day before when it is backfilled too, else stored/read before the day
+            lag_depth, histories, previous = max_lag(get_model().feature_names), [], None
+            for day, df_day in days:
+                if previous is None or previous[0] != day - timedelta(days=1):
+                    history = load_tail(conn, day, lag_depth)
+                else:
+                    history = next_tail(previous[1], previous[2], lag_depth)
+                histories.append(history)
+                previous = (day, df_day, history)
+            versions = day_versions(conn, days[0][0] - timedelta(days=1), days[-1][0]) if FEATURE_STORE_DIR else None
+            store_keys = [source_key(versions, day) if versions is not None else None for day, _ in days]
 
-            date_range = df_all.index.normalize().unique()
-            time_range = f"{date_range.min().date()} - {target_date}"
-            days_analyzed = len(date_range)
+            saved, batch = [], []
+            # the workers' own stages are not traced, this span covers the whole pool (the batch writes are also db.write).
+            # Spawned like src/utils/shap_pool.py: a forked worker would inherit the loaded model's OpenMP state
+            # and the connection pool's sockets
+            with span("compute", rows=sum(len(df_day) for _, df_day in days)), \
+                    ProcessPoolExecutor(
+                        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+                    ) as pool:
+                futures = [
+                    pool.submit(compute_day, day, df_day, history, store_key)
+                    for (day, df_day), history, store_key in zip(days, histories, store_keys)
+                ]
+                for future in as_completed(futures):
+                    result = future.result()
+                    print(f"{result['insight_date']}: {len(result['ids'])} rows in {result['seconds']:.2f}s")
+                    batch.append(result)
+                    if len(batch) >= commit_days:
+                        with conn.cursor() as cur:
+                            save_days(cur, batch)
+                        conn.commit()
+                        invalidate_insights(*(r["insight_date"] for r in batch), locations=_locations(batch))
+                        saved += batch
+                        batch = []
+            if batch:
+                with conn.cursor() as cur:
+                    save_days(cur, batch)
+                conn.commit()
+                invalidate_insights(*(r["insight_date"] for r in batch), locations=_locations(batch))
+                saved += batch
 
             with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO historical_insights (time_range, top_stress_features_shap, correlations_pearson, days_analyzed)
-                    VALUES (%s, %s, %s, %s);
-                """, (time_range, Json(top_features_all), Json(corr_map_all), days_analyzed))
-                conn.commit()
+                cur.execute("SELECT MAX(insight_date) FROM daily_aggregates")
+                time_range = save_historical(conn, cur.fetchone()[0])
 
-            print(f"===Historical insights updated for range: {time_range}\n")
+        elapsed = time.perf_counter() - start
+        n_rows  = sum(len(r["ids"]) for r in saved)
+        print(
+            f"\n===Backfilled {len(saved)} days ({n_rows} rows) in {elapsed:.2f}s: "
+            f"{len(saved) / elapsed:.1f} days/s, {n_rows / elapsed:,.0f} rows/s"
+        )
+        print(f"===Historical insights updated for range: {time_range}\n")
 
     except Exception as e:
         print(f"Error: {e}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Daily and historical insights for unprocessed incoming_data.")
+    parser.add_argument("--start", type=date.fromisoformat, help="first day of a backfill")
+    parser.add_argument("--end", type=date.fromisoformat, help="last day of a backfill (inclusive)")
+    parser.add_argument("--workers", type=int, default=None, help="backfill processes (default: all cores)")
+    parser.add_argument("--commit-days", type=int, default=COMMIT_DAYS)
+    args = parser.parse_args()
+
+    if (args.start or args.end) and not (args.start and args.end):
+        parser.error("--start and --end go together")
+    # one metrics line per run, same format as the Lambda handlers (src/utils/metrics.py)
+    with invocation("precompute_insights"):
+        if args.start:
+            backfill(args.start, args.end, args.workers, args.commit_days)
+        else:
+            main()
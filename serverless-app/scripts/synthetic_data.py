@@ -0,0 +1,102 @@
+import sys
+import argparse
+from datetime import date
+import numpy as np
+import pandas as pd
+from src.model.preprocess import TARGET
+from src.utils.data_access import MODEL_COLUMNS
+
+"""
+Synthetic sensor data with the columns of incoming_data (and of the bundled CSV), one row every 15 minutes.
+Values follow the ranges of assets/university_mental_health_iot_dataset.csv with daily cycles
+(temperature, lighting, crowd) and a stress -> mood -> mental_health_status dependency, so the model
+and the correlation stage see realistic inputs. The outliers preprocess repairs are injected too
+(target = 2, mood_score sign flips). Output is deterministic for a given seed and chunking.
+
+Run (writes a CSV that scripts/load_csv_to_db.py can load):
+`PYTHONPATH=layers/shared/python python3.11 scripts/synthetic_data.py out.csv --days 365`
+"""
+
+START          = date(2024, 1, 1)
+ROWS_PER_DAY   = 96 # 15 min cadence
+CHUNK_DAYS     = 30
+OUTLIER_RATE   = 0.006 # share of target = 2 rows, like the CSV
+SIGN_FLIP_RATE = 0.005
+
+
+#
+def generate_chunk(start, days: int, seed=0) -> pd.DataFrame:
+    """days * 96 rows from start (UTC), columns in MODEL_COLUMNS order."""
+    rng = np.random.default_rng(seed)
+    n   = days * ROWS_PER_DAY
+    ts  = pd.date_range(pd.Timestamp(start, tz="UTC"), periods=n, freq="15min")
+    hour  = ts.hour.to_numpy() + ts.minute.to_numpy() / 60
+    cycle = np.sin(2 * np.pi * (hour - 9) / 24) # peaks mid-afternoon
+
+    crowd       = np.clip(30 + 20 * cycle + rng.normal(0, 10, n), 0, 59).astype(np.int64)
+    temperature = 24 + 3 * cycle + rng.normal(0, 2, n)
+    humidity    = np.clip(60 - 2 * (temperature - 24) + rng.normal(0, 9, n), 20, 100)
+    aqi         = rng.integers(10, 150, n)
+    noise_db    = 45 + 0.35 * crowd + rng.normal(0, 6, n)
+    lighting    = np.clip(300 + 120 * cycle + rng.normal(0, 40, n), 50, 600)
+    sleep       = np.round(np.clip(rng.normal(6.5, 1.2, n), 3, 10), 2)
+    stress      = np.clip(
+        19 + 0.12 * aqi + 0.3 * (noise_db - 45) + 5 * (7 - sleep) + 0.2 * crowd + rng.normal(0, 8, n), 0, 99
+    ).astype(np.int64)
+    mood        = np.round(np.clip(3.0 - stress / 30 + rng.normal(0, 0.4, n), 0, 3), 1)
+    status      = (stress + rng.normal(0, 6, n) > 40).astype(np.int64)
+
+    status[rng.random(n) < OUTLIER_RATE] = 2
+    flips = (rng.random(n) < SIGN_FLIP_RATE) & (mood > 0.5)
+    mood[flips] *= -1
+
+    df = pd.DataFrame({
+        "timestamp": ts,
+        "location_id": rng.integers(101, 106, n),
+        "temperature_celsius": temperature,
+        "humidity_percent": humidity,
+        "air_quality_index": aqi,
+        "noise_level_db": noise_db,
+        "lighting_lux": lighting,
+        "crowd_density": crowd,
+        "stress_level": stress,
+        "sleep_hours": sleep,
+        "mood_score": mood,
+        TARGET: status,
+    })
+    return df[MODEL_COLUMNS]
+
+
+#
+def iter_synthetic(days: int, start=START, seed=0, chunk_days=CHUNK_DAYS):
+    """The rows of `days` days as DataFrames of at most chunk_days days, so years of data never sit in memory at once."""
+    for i, first in enumerate(range(0, days, chunk_days)):
+        yield generate_chunk(pd.Timestamp(start) + pd.Timedelta(days=first), min(chunk_days, days - first), seed=(seed, i))
+
+
+#
+def generate(days: int, start=START, seed=0, chunk_days=CHUNK_DAYS) -> pd.DataFrame:
+    return pd.concat(iter_synthetic(days, start, seed, chunk_days), ignore_index=True)
+
+
+#
+def write_csv(path: str, days: int, start=START, seed=0) -> int:
+    """Same layout as the bundled CSV (naive timestamps, loaded as session time). Returns the row count."""
+    n_rows = 0
+    for i, chunk in enumerate(iter_synthetic(days, start, seed)):
+        chunk["timestamp"] = chunk["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
+        chunk.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        n_rows += len(chunk)
+    return n_rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic incoming_data rows as CSV.")
+    parser.add_argument("path")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start", type=date.fromisoformat, default=START)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    n_rows = write_csv(args.path, args.days, args.start, args.seed)
+    print(f"Wrote {n_rows} rows ({args.days} days from {args.start}) to {args.path}", file=sys.stderr)
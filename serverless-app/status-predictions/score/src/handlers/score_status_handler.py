@@ -0,0 +1,96 @@
+import json
+import pandas as pd
+from src.model.model_runner import get_model
+from src.utils.db import get_connection
+from src.utils.scoring import score_rows, score_range, save_predictions, model_version
+from src.utils.metrics import instrumented, span
+
+"""
+Per-interval mental_health_status predictions (src/utils/scoring.py).
+- body {"rows": [{"timestamp": ..., "location_id": ..., sensor columns...}, ...], "history": [...]}: scores the rows
+  of the request, the lags before the first one come from "history" (the rows right before them, [] for none) or
+  else from the stored lag tail of the day before (lag_tails), 400 when there is neither. The predictions are returned.
+- start=YYYY-MM-DD&end=YYYY-MM-DD (query string or body): scores every incoming_data row of the range.
+  Only the counts are returned, the predictions are in status_predictions.
+Predictions are stored under the model version unless store=false.
+"""
+
+
+#
+def _params(event) -> dict:
+    params = dict(event.get("queryStringParameters") or {})
+    body = event.get("body")
+    if body:
+        body = json.loads(body) if isinstance(body, str) else body
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be a JSON object")
+        params.update(body)
+    return params
+
+
+@instrumented("score_status")
+def lambda_handler(event, context):
+    try:
+        try:
+            params = _params(event)
+            rows   = params.get("rows")
+            store  = str(params.get("store", "true")).lower() not in ("0", "false")
+            if rows is None:
+                if not params.get("start") or not params.get("end"):
+                    return {"statusCode": 400, "body": json.dumps({"error": "Provide 'rows' or 'start' and 'end' (YYYY-MM-DD)"})}
+                start, end = pd.to_datetime(params["start"]).date(), pd.to_datetime(params["end"]).date()
+        except ValueError as e:
+            return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+        with span("model.load"):
+            model_entry = get_model()
+        version = model_version(model_entry)
+
+        with get_connection() as conn:
+            try:
+                if rows is not None:
+                    predictions = score_rows(conn, rows, model_entry, params.get("history"))
+                else:
+                    predictions = score_range(conn, start, end, model_entry)
+            except ValueError as e:
+                return {"statusCode": 400, "body": json.dumps({"error": str(e)})}
+
+            if rows is None and predictions.empty:
+                return {"statusCode": 404, "body": json.dumps({"error": f"No data found from {start} to {end}"})}
+
+            stored = 0
+            if store:
+                with span("db.write", rows=len(predictions)):
+                    stored = save_predictions(conn, predictions, version)
+                    conn.commit()
+
+        body = {
+            "message": f"Scored {len(predictions)} rows with {version}.",
+            "model_version": version,
+            "rows_scored": len(predictions),
+            "predicted_positive": int(predictions["predicted_status"].sum()),
+            "stored": stored,
+        }
+        if rows is not None:
+            body["predictions"] = [
+                {
+                    "timestamp": ts.isoformat(),
+                    "location_id": int(location),
+                    "probability": round(float(probability), 6),
+                    "predicted_status": int(status),
+                }
+                for ts, location, probability, status in predictions.itertuples(index=False)
+            ]
+        else:
+            body.update({"start": start.isoformat(), "end": end.isoformat()})
+
+        return {
+            "statusCode": 200,
+            "body": json.dumps(body)
+        }
+
+    except Exception as e:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"error": str(e)})
+        }